@@ -0,0 +1,275 @@
+"""Achievements and streaks, advanced by each score as it is recorded.
+
+A rule counts something about a player's scores and unlocks its
+achievement at a target: how many scores met a condition (``count``), how
+many in a row did (``streak``: a score that misses resets it), on how many
+consecutive UTC days one did (``daily_streak``), or their summed points
+(``total``). Rules can be limited to one game_type. Conditions are a small
+vocabulary (``beat_ai``, or ``score``/``accuracy``/``time_taken`` compared
+with a number, joined by ``and``) parsed once when the rules are compiled.
+
+Compiling gives every distinct (kind, game_type, condition) one counter,
+shared by the rules that differ only in target, and lists the counters
+each game_type touches. A score updates the counters of its game and checks
+only their rules, so the cost does not depend on the player's history:
+nothing is ever read back from game_scores. A player's state is those
+counters plus the unlock times, one small versioned document saved in the
+same transaction as the score. A save against a version another worker
+has moved on raises ``storage.StaleProgressError``; the caller reloads and
+applies the score again. Flagged scores and the guest account make no
+progress.
+
+Counters start at zero when a rule is added, for new and existing players
+alike. ``python bench.py achievements`` checks the counters against a
+rescan of the history and times a submission with 100 rules.
+"""
+import operator
+import re
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+KINDS = ('count', 'streak', 'daily_streak', 'total')
+
+_COMPARISONS = {'>=': operator.ge, '<=': operator.le, '>': operator.gt, '<': operator.lt, '==': operator.eq}
+_TERM = re.compile(r'^(score|accuracy|time_taken)\s*(>=|<=|>|<|==)\s*(-?\d+(?:\.\d+)?)$')
+_ID = re.compile(r'^[a-z0-9_]+$')
+
+
+class Achievement(NamedTuple):
+    id: str
+    title: str
+    description: str
+    kind: str
+    target: int
+    game_type: Optional[str] = None  # None: scores of any game
+    when: str = ''                   # condition a score must meet; '' = every score
+
+
+ACHIEVEMENTS = (
+    Achievement('first_game', "First Steps", "Play a game", 'count', 1),
+    Achievement('games_100', "Regular", "Play 100 games", 'count', 100),
+    Achievement('games_1000', "Veteran", "Play 1,000 games", 'count', 1000),
+    Achievement('first_win', "Giant Slayer", "Beat the AI baseline", 'count', 1, when='beat_ai'),
+    Achievement('wins_100', "Machine Tamer", "Beat the AI baseline 100 times", 'count', 100, when='beat_ai'),
+    Achievement('text_ai_streak_5', "Turing Tested", "Beat the AI 5 times in a row in text_ai",
+                'streak', 5, 'text_ai', 'beat_ai'),
+    Achievement('ai_image_streak_5', "Sharp Eye", "Beat the AI 5 times in a row in ai_image",
+                'streak', 5, 'ai_image', 'beat_ai'),
+    Achievement('memory_streak_5', "Total Recall", "Beat the AI 5 times in a row in memory_challenge",
+                'streak', 5, 'memory_challenge', 'beat_ai'),
+    Achievement('win_streak_10', "Unstoppable", "Beat the AI 10 times in a row", 'streak', 10, when='beat_ai'),
+    Achievement('accurate_10', "Precise", "Score 95% accuracy or better 10 times", 'count', 10,
+                when='accuracy >= 95'),
+    Achievement('quick_win_10', "Quick Thinker", "Beat the AI in 10 seconds or less, 10 times", 'count', 10,
+                when='beat_ai and time_taken <= 10'),
+    Achievement('daily_3', "Warming Up", "Play on 3 days in a row", 'daily_streak', 3),
+    Achievement('daily_7', "Weekly Habit", "Play on 7 days in a row", 'daily_streak', 7),
+    Achievement('daily_30', "Dedicated", "Play on 30 days in a row", 'daily_streak', 30),
+    Achievement('daily_win_7', "On a Roll", "Beat the AI on 7 days in a row", 'daily_streak', 7, when='beat_ai'),
+    Achievement('points_10k', "Point Collector", "Score 10,000 points in total", 'total', 10000),
+    Achievement('points_100k', "High Roller", "Score 100,000 points in total", 'total', 100000),
+)
+
+
+def compile_condition(when: str) -> Tuple[str, Callable[[Dict[str, Any]], bool]]:
+    """(canonical text, test over a score) for a condition; raises ValueError on anything unknown."""
+    tests, terms = [], []
+    for term in (t.strip() for t in when.split(' and ')) if when.strip() else ():
+        if term == 'beat_ai':
+            tests.append(lambda s: s['score'] > s['ai_baseline_score'])
+            terms.append(term)
+            continue
+        match = _TERM.match(term)
+        if match is None:
+            raise ValueError(f"Unknown achievement condition: {term!r}")
+        field, op, number = match.groups()
+        value = float(number)
+        compare = _COMPARISONS[op]
+        tests.append(lambda s, field=field, compare=compare, value=value: compare(s[field], value))
+        terms.append(f"{field}{op}{value:g}")
+    if not tests:
+        return '', lambda s: True
+    if len(tests) == 1:
+        return terms[0], tests[0]
+    return ' and '.join(terms), lambda s: all(test(s) for test in tests)
+
+
+class AchievementState(NamedTuple):
+    """A player's counters by key and unlock times (epoch seconds) by achievement id."""
+    version: int = 0
+    counters: Dict[str, Any] = {}
+    unlocked: Dict[str, float] = {}
+
+    @classmethod
+    def from_row(cls, row: Optional[Dict[str, Any]]) -> 'AchievementState':
+        if row is None:
+            return cls()
+        return cls(row['version'], row['state']['counters'], row['state']['unlocked'])
+
+    def to_row(self, user_id: str) -> Dict[str, Any]:
+        return {'user_id': user_id, 'version': self.version,
+                'state': {'counters': self.counters, 'unlocked': self.unlocked},
+                'updated_at': datetime.now(timezone.utc)}
+
+
+class _Counter:
+    __slots__ = ('key', 'kind', 'test', 'rules')
+
+    def __init__(self, key: str, kind: str, test: Callable[[Dict[str, Any]], bool]):
+        self.key = key
+        self.kind = kind
+        self.test = test
+        self.rules: List[Achievement] = []  # by target
+
+
+class AchievementRules:
+    """``achievements`` compiled into shared counters, dispatched by game_type."""
+
+    def __init__(self, achievements: Sequence[Achievement] = ACHIEVEMENTS):
+        self.achievements = list(achievements)
+        self._counters: Dict[str, _Counter] = {}
+        self._counter_of: Dict[str, _Counter] = {}
+        for achievement in self.achievements:
+            if not _ID.match(achievement.id) or achievement.id in self._counter_of:
+                raise ValueError(f"Achievement ids must be unique [a-z0-9_]+: {achievement.id!r}")
+            if achievement.kind not in KINDS:
+                raise ValueError(f"Unknown achievement kind: {achievement.kind!r}")
+            if achievement.target < 1:
+                raise ValueError(f"Achievement target must be at least 1: {achievement.id}")
+            when, test = compile_condition(achievement.when)
+            # No dots: the state is also stored as a MongoDB document
+            key = f"{achievement.kind}:{achievement.game_type or '*'}:{when}".replace('.', '_')
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = self._counters[key] = _Counter(key, achievement.kind, test)
+            counter.rules.append(achievement)
+            self._counter_of[achievement.id] = counter
+        for counter in self._counters.values():
+            counter.rules.sort(key=lambda a: a.target)
+        self._by_game: Dict[str, List[_Counter]] = {}
+
+    def _counters_for(self, game_type: str) -> List[_Counter]:
+        counters = self._by_game.get(game_type)
+        if counters is None:
+            counters = self._by_game[game_type] = [
+                c for c in self._counters.values()
+                if c.key.split(':', 2)[1] in ('*', game_type.replace('.', '_'))]
+        return counters
+
+    def apply(self, state: AchievementState, score: Dict[str, Any]) -> Tuple[AchievementState, List[Achievement]]:
+        """The state after ``score`` and the achievements it unlocked; ``state`` is left as it was."""
+        counters = self._counters_for(score['game_type'])
+        if score.get('flag') is not None or not counters:
+            return state, []
+        values = dict(state.counters)
+        unlocked: List[Achievement] = []
+        day = None
+        for counter in counters:
+            met = counter.test(score)
+            value = values.get(counter.key)
+            if counter.kind == 'count':
+                if not met:
+                    continue
+                metric = values[counter.key] = (value or 0) + 1
+            elif counter.kind == 'streak':
+                if not met:
+                    if value:
+                        values[counter.key] = 0
+                    continue
+                metric = values[counter.key] = (value or 0) + 1
+            elif counter.kind == 'total':
+                if not met:
+                    continue
+                metric = values[counter.key] = (value or 0) + score['score']
+            else:  # daily_streak: [last UTC day (ordinal), days in a row]
+                if not met:
+                    continue
+                if day is None:
+                    day = score['timestamp'].astimezone(timezone.utc).toordinal()
+                last, run = value or (0, 0)
+                if day <= last:
+                    continue  # already counted today (or an older score)
+                run = run + 1 if day == last + 1 else 1
+                values[counter.key] = [day, run]
+                metric = run
+            for achievement in counter.rules:
+                if achievement.target > metric:
+                    break
+                if achievement.id not in state.unlocked:
+                    unlocked.append(achievement)
+        new_unlocked = state.unlocked
+        if unlocked:
+            now = score['timestamp'].timestamp()
+            new_unlocked = dict(state.unlocked)
+            new_unlocked.update((achievement.id, now) for achievement in unlocked)
+        return AchievementState(state.version + 1, values, new_unlocked), unlocked
+
+    def progress(self, state: AchievementState, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Every achievement with the player's progress towards it, in declaration order."""
+        today = (now or datetime.now(timezone.utc)).astimezone(timezone.utc).toordinal()
+        entries = []
+        for achievement in self.achievements:
+            counter = self._counter_of[achievement.id]
+            value = state.counters.get(counter.key) or 0
+            if counter.kind == 'daily_streak':
+                # A run not extended yesterday or today is over
+                value = value[1] if value and value[0] >= today - 1 else 0
+            unlocked_at = state.unlocked.get(achievement.id)
+            entries.append({
+                'id': achievement.id, 'title': achievement.title, 'description': achievement.description,
+                'target': achievement.target,
+                'progress': achievement.target if unlocked_at is not None else min(value, achievement.target),
+                'unlocked_at': None if unlocked_at is None else datetime.fromtimestamp(unlocked_at, timezone.utc),
+            })
+        return entries
+
+    @property
+    def counters(self) -> int:
+        return len(self._counters)
+
+
+class AchievementTracker:
+    """Achievement states of the ``max_entries`` most recently seen players.
+
+    ``load`` fetches a player's saved progress (the repository's
+    ``get_achievement_progress``) on a cache miss. Remember a state only
+    once it has been saved, and forget a player whose save was refused.
+    """
+
+    def __init__(self, rules: AchievementRules,
+                 load: Callable[[str], Awaitable[Optional[Dict[str, Any]]]], max_entries: int = 100000):
+        self.rules = rules
+        self.load = load
+        self.max_entries = max_entries
+        self._states: 'OrderedDict[str, AchievementState]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0
+
+    async def get(self, user_id: str) -> AchievementState:
+        state = self._states.get(user_id)
+        if state is not None:
+            self.hits += 1
+            self._states.move_to_end(user_id)
+            return state
+        self.misses += 1
+        state = AchievementState.from_row(await self.load(user_id))
+        self.remember(user_id, state)
+        return state
+
+    def apply(self, state: AchievementState, score: Dict[str, Any]) -> Tuple[AchievementState, List[Achievement]]:
+        return self.rules.apply(state, score)
+
+    def remember(self, user_id: str, state: AchievementState):
+        self._states[user_id] = state
+        self._states.move_to_end(user_id)
+        while len(self._states) > self.max_entries:
+            self._states.popitem(last=False)
+
+    def forget(self, user_id: str):
+        self.conflicts += 1
+        self._states.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._states)
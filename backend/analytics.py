@@ -0,0 +1,239 @@
+"""Global human-vs-AI analytics over game_scores.
+
+Raw rows are folded into a compact columnar snapshot as they arrive:
+
+* a score histogram per game_type (``np.bincount`` counts), from which any
+  percentile is read off the cumulative counts; scores above
+  ``HISTOGRAM_MAX_SCORE`` share its bucket, so one absurd score cannot
+  size the array, and
+* a per (game_type, day) aggregate frame with game, win and sum columns,
+  from which win rates and weekly/monthly trends are re-bucketed.
+
+Refreshing only reads rows past the last seen rowid, so the cost of a query
+depends on the number of games and days, not on the length of the history.
+The snapshot can be saved to disk so a restart does not rescan the table.
+A chunk that fails to fold is folded again row by row, and rows that
+still fail are logged and skipped, so one bad row cannot stall the refresh.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from storage import attach_standard_views
+
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+TREND_BUCKETS = {'day': 'D', 'week': 'W-MON', 'month': 'MS'}
+DAILY_COLUMNS = ['games', 'wins', 'score_sum', 'ai_score_sum', 'accuracy_sum']
+REFRESH_CHUNK_ROWS = 200000
+# Far above any game's real maximum; 800 KB per game at most
+HISTOGRAM_MAX_SCORE = 100000
+
+logger = logging.getLogger(__name__)
+
+
+class ScoreAnalytics:
+    def __init__(self, db_path, snapshot_path: Optional[Path] = None):
+        self.db_path = db_path
+        self.snapshot_path = snapshot_path
+        self.watermark = 0
+        self.histograms: Dict[str, np.ndarray] = {}
+        self.daily = pd.DataFrame(
+            columns=DAILY_COLUMNS,
+            index=pd.MultiIndex.from_arrays([[], pd.DatetimeIndex([], tz='UTC')], names=['game_type', 'day'])
+        ).astype('int64')
+        self.refreshed_at = 0.0
+        self._summaries: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if snapshot_path is not None and Path(snapshot_path).exists():
+            self.load(snapshot_path)
+
+    def reset(self):
+        self.watermark = 0
+        self.histograms = {}
+        self.daily = self.daily.iloc[0:0]
+        self._summaries.clear()
+
+    # Incremental refresh
+    def refresh(self) -> int:
+        """Fold rows added since the last refresh into the snapshot; return how many."""
+        with self._lock:
+            conn = sqlite3.connect(f"file:{Path(self.db_path).as_posix()}?mode=ro", uri=True)
+            added = 0
+            try:
+                attach_standard_views(conn)
+                # Not MAX(rowid): through the partitioned layout's view that scans every
+                # row, while ORDER BY merges the partitions' rowid orders
+                newest = conn.execute(
+                    'SELECT COALESCE((SELECT rowid FROM game_scores ORDER BY rowid DESC LIMIT 1), 0)').fetchone()[0]
+                if newest < self.watermark:
+                    # The table was rebuilt or replaced under us; start over
+                    self.reset()
+                chunks = pd.read_sql_query(
+                    'SELECT rowid AS rid, game_type, score, ai_baseline_score, accuracy, timestamp '
+                    'FROM game_scores WHERE rowid > ? AND flag IS NULL ORDER BY rowid',
+                    conn, params=(self.watermark,), chunksize=REFRESH_CHUNK_ROWS
+                )
+                for chunk in chunks:
+                    if chunk.empty:
+                        continue
+                    self._fold_or_skip(chunk)
+                    self.watermark = int(chunk['rid'].iloc[-1])
+                    added += len(chunk)
+            finally:
+                conn.close()
+            self.refreshed_at = time.monotonic()
+            if added:
+                self._summaries.clear()
+                if self.snapshot_path is not None:
+                    self.save(self.snapshot_path)
+            return added
+
+    def _fold_or_skip(self, chunk: pd.DataFrame):
+        try:
+            self._fold(chunk)
+            return
+        except Exception:
+            logger.exception("Folding %d scores into the analytics snapshot failed; retrying row by row", len(chunk))
+        for i in range(len(chunk)):
+            try:
+                self._fold(chunk.iloc[i:i + 1])
+            except Exception:
+                logger.exception("Skipping score rowid %s in the analytics snapshot", chunk['rid'].iloc[i])
+
+    def _fold(self, chunk: pd.DataFrame):
+        # Everything is computed before anything is stored, so a failure leaves the snapshot as it was
+        scores = chunk['score'].to_numpy(dtype=np.int64).clip(0, HISTOGRAM_MAX_SCORE)
+        histograms = {}
+        for game_type, positions in chunk.groupby('game_type').indices.items():
+            counts = np.bincount(scores[positions])
+            current = self.histograms.get(game_type)
+            if current is not None:
+                if len(counts) > len(current):
+                    current, counts = counts, current.copy()
+                else:
+                    current = current.copy()
+                current[:len(counts)] += counts
+                counts = current
+            histograms[game_type] = counts
+
+        day = pd.to_datetime(chunk['timestamp'], utc=True, format='ISO8601').dt.floor('D')
+        frame = pd.DataFrame({
+            'game_type': chunk['game_type'],
+            'day': day,
+            'games': 1,
+            'wins': (chunk['score'] > chunk['ai_baseline_score']).astype('int64'),
+            'score_sum': chunk['score'].astype('int64'),
+            'ai_score_sum': chunk['ai_baseline_score'].astype('int64'),
+            'accuracy_sum': chunk['accuracy'].astype('float64'),
+        })
+        daily = frame.groupby(['game_type', 'day']).sum()
+        self.daily = self.daily.add(daily, fill_value=0)
+        self.histograms.update(histograms)
+
+    # Queries (served from the snapshot)
+    def percentiles(self, game_type: Optional[str] = None) -> Dict[str, float]:
+        if game_type is None:
+            histograms = list(self.histograms.values())
+            size = max((len(h) for h in histograms), default=0)
+            counts = np.zeros(size, dtype=np.int64)
+            for histogram in histograms:
+                counts[:len(histogram)] += histogram
+        else:
+            counts = self.histograms.get(game_type, np.zeros(0, dtype=np.int64))
+        cumulative = np.cumsum(counts)
+        total = int(cumulative[-1]) if len(cumulative) else 0
+        if total == 0:
+            return {f"p{p}": 0 for p in PERCENTILES}
+        ranks = np.ceil(np.array(PERCENTILES) / 100 * total).astype(np.int64)
+        values = np.searchsorted(cumulative, np.maximum(ranks, 1))
+        return {f"p{p}": int(v) for p, v in zip(PERCENTILES, values)}
+
+    def summary(self, bucket: str = 'day', days: int = 30) -> Dict[str, Any]:
+        key = (bucket, days)
+        cached = self._summaries.get(key)
+        if cached is not None:
+            return cached
+
+        by_game = self.daily.groupby(level='game_type').sum()
+        totals = by_game.sum()
+        games = {}
+        for game_type, row in by_game.iterrows():
+            games[game_type] = {
+                "games_played": int(row['games']),
+                "human_win_rate": float(round(row['wins'] / row['games'] * 100, 1)) if row['games'] else 0.0,
+                "avg_score": float(round(row['score_sum'] / row['games'], 1)) if row['games'] else 0.0,
+                "avg_ai_score": float(round(row['ai_score_sum'] / row['games'], 1)) if row['games'] else 0.0,
+                "avg_accuracy": float(round(row['accuracy_sum'] / row['games'], 1)) if row['games'] else 0.0,
+                "score_percentiles": self.percentiles(game_type),
+            }
+
+        summary = {
+            "total_games": int(totals.get('games', 0)),
+            "human_win_rate": float(round(totals['wins'] / totals['games'] * 100, 1)) if totals.get('games', 0) else 0.0,
+            "score_percentiles": self.percentiles(),
+            "games": games,
+            "trends": self.trends(bucket, days),
+        }
+        self._summaries[key] = summary
+        return summary
+
+    def trends(self, bucket: str = 'day', days: int = 30) -> Dict[str, list]:
+        if self.daily.empty:
+            return {}
+        cutoff = pd.Timestamp.now(tz='UTC').floor('D') - pd.Timedelta(days=days)
+        recent = self.daily[self.daily.index.get_level_values('day') >= cutoff]
+        trends = {}
+        for game_type, frame in recent.groupby(level='game_type'):
+            series = frame.droplevel('game_type').resample(TREND_BUCKETS[bucket], label='left', closed='left').sum()
+            series = series[series['games'] > 0]
+            trends[game_type] = [
+                {
+                    "period": period.date().isoformat(),
+                    "games_played": int(row['games']),
+                    "human_win_rate": float(round(row['wins'] / row['games'] * 100, 1)),
+                    "avg_score": float(round(row['score_sum'] / row['games'], 1)),
+                }
+                for period, row in series.iterrows()
+            ]
+        return trends
+
+    # Snapshot persistence
+    def save(self, path: Path):
+        daily = self.daily.reset_index()
+        arrays = {f"hist__{game}": counts for game, counts in self.histograms.items()}
+        arrays.update({
+            'watermark': np.array([self.watermark]),
+            'daily_game_type': daily['game_type'].to_numpy(dtype=str),
+            'daily_day': daily['day'].dt.tz_convert(None).to_numpy(dtype='datetime64[ns]').astype(np.int64),
+        })
+        for column in DAILY_COLUMNS:
+            arrays[f"daily_{column}"] = daily[column].to_numpy()
+        tmp_path = Path(path).with_suffix('.tmp.npz')
+        np.savez(tmp_path, **arrays)
+        tmp_path.replace(path)
+
+    def load(self, path: Path):
+        with np.load(path) as data:
+            self.watermark = int(data['watermark'][0])
+            self.histograms = {name[len('hist__'):]: _capped(data[name]) for name in data.files
+                               if name.startswith('hist__')}
+            daily = pd.DataFrame({column: data[f"daily_{column}"] for column in DAILY_COLUMNS})
+            daily['game_type'] = data['daily_game_type']
+            daily['day'] = pd.to_datetime(data['daily_day'], utc=True)
+        self.daily = daily.set_index(['game_type', 'day'])
+        self._summaries.clear()
+
+
+def _capped(counts: np.ndarray) -> np.ndarray:
+    """``counts`` with everything above HISTOGRAM_MAX_SCORE moved into its bucket."""
+    if len(counts) <= HISTOGRAM_MAX_SCORE + 1:
+        return counts
+    capped = counts[:HISTOGRAM_MAX_SCORE + 1].copy()
+    capped[-1] += counts[HISTOGRAM_MAX_SCORE + 1:].sum()
+    return capped
@@ -0,0 +1,320 @@
+"""Streaming anomaly detection for client-reported scores.
+
+``ScoreDetector.check`` runs on every score submission in O(1): a few hard
+rules catch impossible entries (more points than correct answers allow, a
+full game in under a second, a game with no ``GAME_LIMITS``), and
+statistical rules compare the submission against running statistics:
+
+* per game_type, all-time Welford mean/variance of score and log time taken;
+* per user and game_type, a ring buffer of the user's last scores with a
+  running sum and sum of squares (a rolling mean/variance);
+* per user, a ring buffer of recent submission times, to catch more games
+  than could have been played in that time.
+
+Only clean submissions feed the statistics, so flagged scores cannot drag
+the baselines towards themselves. Flagged and quarantined scores are stored
+with their reasons and left out of users' totals (the leaderboard) and the
+global analytics.
+
+Run as a script to replay historical game_scores through the detector in
+chunks:
+
+    python anticheat.py --db cognitive_arena.db            # report only
+    python anticheat.py --db cognitive_arena.db --apply    # flag rows, fix users' totals
+"""
+import argparse
+import math
+import os
+import sqlite3
+import sys
+import time
+from array import array
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from memory_rounds import MAX_DIFFICULTY, MAX_SEQUENCE_LENGTH, answer_seconds, sequence_length, show_seconds
+from storage import attach_standard_views, score_time_key
+
+ACCEPT = 'accepted'
+FLAG = 'flagged'            # statistical outlier: kept for review
+QUARANTINE = 'quarantined'  # impossible by the game's own rules
+
+
+@dataclass(frozen=True)
+class GameLimits:
+    items: int                    # answers per game
+    max_points_per_item: int      # 100 plus the largest time bonus
+    min_seconds_per_item: float   # fastest plausible look-and-click
+
+
+# From the frontend scoring: 3 items per game, 100 points per correct answer
+# plus 2 per second left on a 30 s timer. A memory round is one item scored
+# by memory_rounds.score_recall, at most the hardest level answered at once,
+# and cannot end before the shortest sequence has been shown. A game_type
+# without limits is quarantined.
+GAME_LIMITS = {
+    'ai_image': GameLimits(items=3, max_points_per_item=160, min_seconds_per_item=0.75),
+    'text_ai': GameLimits(items=3, max_points_per_item=160, min_seconds_per_item=0.75),
+    'memory_challenge': GameLimits(
+        items=1, max_points_per_item=300 + MAX_DIFFICULTY * 50 + answer_seconds(MAX_SEQUENCE_LENGTH) * 10,
+        min_seconds_per_item=show_seconds(sequence_length(1))),
+}
+
+
+class Verdict(NamedTuple):
+    action: str
+    reasons: Tuple[str, ...] = ()
+
+    @property
+    def flag(self) -> Optional[str]:
+        """Value stored in game_scores.flag (None for clean scores)."""
+        return ','.join(self.reasons) if self.reasons else None
+
+
+class RunningStats:
+    """Welford's online mean and variance."""
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class RollingWindow:
+    """Mean and variance of the last ``size`` values, from a ring buffer."""
+    __slots__ = ('values', 'position', 'count', 'total', 'total_sq')
+
+    def __init__(self, size: int):
+        self.values = array('d', bytes(8 * size))
+        self.position = 0
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def add(self, value: float):
+        if self.count == len(self.values):
+            old = self.values[self.position]
+            self.total -= old
+            self.total_sq -= old * old
+        else:
+            self.count += 1
+        self.values[self.position] = value
+        self.position = (self.position + 1) % len(self.values)
+        self.total += value
+        self.total_sq += value * value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(max(0.0, (self.total_sq - self.total * self.total / self.count) / (self.count - 1)))
+
+
+class _UserState:
+    __slots__ = ('times', 'time_position', 'windows')
+
+    def __init__(self, rate_window: int):
+        self.times = array('d', [-math.inf] * rate_window)  # ring of recent submission times
+        self.time_position = 0
+        self.windows: Dict[str, RollingWindow] = {}
+
+
+class ScoreDetector:
+    """Per-process detector; state for the ``max_users`` most recent users is kept."""
+
+    def __init__(self, limits: Dict[str, GameLimits] = GAME_LIMITS, z_threshold: float = 4.0,
+                 warmup: int = 30, window: int = 32, personal_warmup: int = 8, rate_window: int = 16,
+                 max_users: int = 100000):
+        self.limits = limits
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.window = window
+        self.personal_warmup = personal_warmup
+        self.rate_window = rate_window
+        self.max_users = max_users
+        self.score_stats: Dict[str, RunningStats] = {}
+        self.time_stats: Dict[str, RunningStats] = {}
+        self._users: 'OrderedDict[str, _UserState]' = OrderedDict()
+        self.verdicts = Counter()
+
+    def check(self, user_id: Optional[str], game_type: str, score: int, accuracy: float, time_taken: int,
+              at: Optional[float] = None) -> Verdict:
+        """Judge one submission and fold it into the statistics if it is clean.
+
+        ``user_id`` None (the shared guest account) skips the per-user rules.
+        ``at`` is the submission time in epoch seconds (default now).
+        """
+        if at is None:
+            at = time.time()
+        limits = self.limits.get(game_type)
+        if limits is None:
+            # Nothing to judge it against, and no statistics kept for it
+            self.verdicts[QUARANTINE] += 1
+            return Verdict(QUARANTINE, ('unknown_game',))
+
+        reasons = self._impossible(limits, score, accuracy, time_taken)
+        action = QUARANTINE if reasons else ACCEPT
+
+        score_stats = self.score_stats.setdefault(game_type, RunningStats())
+        time_stats = self.time_stats.setdefault(game_type, RunningStats())
+        log_time = math.log1p(max(0, time_taken))
+        user = self._user(user_id) if user_id is not None else None
+        if not reasons:
+            if score_stats.count >= self.warmup:
+                if score - score_stats.mean > self.z_threshold * max(score_stats.std, 1.0):
+                    reasons.append('score_outlier')
+                if time_stats.mean - log_time > self.z_threshold * max(time_stats.std, 0.05):
+                    reasons.append('time_outlier')
+            if user is not None:
+                personal = user.windows.get(game_type)
+                if personal is not None and personal.count >= self.personal_warmup:
+                    spread = max(personal.std, 0.1 * personal.mean, 1.0)
+                    if score - personal.mean > self.z_threshold * spread:
+                        reasons.append('personal_outlier')
+                # The oldest of the last rate_window submissions, against the time that many games take
+                min_game_seconds = limits.items * limits.min_seconds_per_item
+                if at - user.times[user.time_position] < self.rate_window * min_game_seconds:
+                    reasons.append('submission_rate')
+            if reasons:
+                action = FLAG
+
+        if user is not None:
+            user.times[user.time_position] = at
+            user.time_position = (user.time_position + 1) % self.rate_window
+        if action == ACCEPT:
+            score_stats.add(score)
+            time_stats.add(log_time)
+            if user is not None:
+                personal = user.windows.get(game_type)
+                if personal is None:
+                    personal = user.windows[game_type] = RollingWindow(self.window)
+                personal.add(score)
+        self.verdicts[action] += 1
+        return Verdict(action, tuple(reasons))
+
+    @staticmethod
+    def _impossible(limits: GameLimits, score: int, accuracy: float, time_taken: int) -> list:
+        if score < 0 or time_taken < 0 or not 0 <= accuracy <= 100:
+            return ['out_of_range']
+        reasons = []
+        if accuracy > 0 and time_taken <= 0:
+            reasons.append('zero_time')
+        correct = math.ceil(accuracy * limits.items / 100 - 1e-6)
+        if score > correct * limits.max_points_per_item:
+            reasons.append('score_exceeds_answers')
+        # time_taken is rounded to whole seconds by the client
+        if accuracy > 0 and 0 < time_taken < limits.items * limits.min_seconds_per_item - 0.5:
+            reasons.append('too_fast')
+        return reasons
+
+    def _user(self, user_id: str) -> _UserState:
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = _UserState(self.rate_window)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return user
+
+
+# Replay over historical scores
+def replay(db_path, detector: ScoreDetector, chunk_rows: int = 50000, apply: bool = False,
+           progress=None) -> Counter:
+    """Run every unflagged score through ``detector`` in timestamp order.
+
+    Rows are read in keyset-paginated chunks. With ``apply``, newly flagged
+    rows get their flag set and are taken out of their users' totals, one
+    transaction per chunk.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    attach_standard_views(conn)
+    reasons = Counter()
+    # Keyset on (time, rowid): the time index ends in the rowid (the key on the compact layout)
+    key, _ = score_time_key(conn)
+    after = None
+    try:
+        while True:
+            resume = f'AND ({key}, rowid) > (?, ?)' if after else ''
+            rows = conn.execute(f'''
+                SELECT rowid, user_id, game_type, score, accuracy, time_taken, timestamp, {key} FROM game_scores
+                WHERE flag IS NULL {resume}
+                ORDER BY {key}, rowid
+                LIMIT ?
+            ''', (*(after or ()), chunk_rows)).fetchall()
+            if not rows:
+                break
+            flagged = []
+            for score_id, user_id, game_type, score, accuracy, time_taken, timestamp, _ in rows:
+                at = datetime.fromisoformat(timestamp).timestamp()
+                verdict = detector.check(None if user_id == 'guest' else user_id, game_type, score,
+                                         accuracy, time_taken, at)
+                if verdict.action != ACCEPT:
+                    reasons.update(verdict.reasons)
+                    flagged.append((verdict.flag, score_id, user_id, score))
+            if apply and flagged:
+                conn.execute('BEGIN')
+                conn.executemany('UPDATE game_scores SET flag = ? WHERE rowid = ?',
+                                 [(flag, score_id) for flag, score_id, _, _ in flagged])
+                totals: Dict[str, list] = {}
+                for _, _, user_id, score in flagged:
+                    games_score = totals.setdefault(user_id, [0, 0])
+                    games_score[0] += 1
+                    games_score[1] += score
+                conn.executemany('''
+                    UPDATE users SET total_games_played = total_games_played - ?, total_score = total_score - ?
+                    WHERE id = ?
+                ''', [(games, points, user_id) for user_id, (games, points) in totals.items()])
+                conn.execute('COMMIT')
+            after = (rows[-1][7], rows[-1][0])
+            if progress is not None:
+                progress(detector.verdicts)
+    finally:
+        conn.close()
+    return reasons
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=Path(__file__).parent / os.environ.get('DB_NAME', 'cognitive_arena.db'))
+    parser.add_argument('--chunk-rows', type=int, default=50000)
+    parser.add_argument('--z-threshold', type=float, default=4.0)
+    parser.add_argument('--apply', action='store_true', help="write flags and correct users' totals")
+    args = parser.parse_args(argv)
+
+    detector = ScoreDetector(z_threshold=args.z_threshold)
+    started = time.perf_counter()
+    reasons = replay(args.db, detector, args.chunk_rows, args.apply,
+                     progress=lambda verdicts: print(f"  {sum(verdicts.values())} scores checked", file=sys.stderr))
+    elapsed = time.perf_counter() - started
+    checked = sum(detector.verdicts.values())
+    print(f"Checked {checked} scores in {elapsed:.1f}s: " + ', '.join(
+        f"{detector.verdicts[action]} {action}" for action in (ACCEPT, FLAG, QUARANTINE)))
+    for reason, count in reasons.most_common():
+        print(f"  {reason:<24}{count:>10}")
+    if args.apply and checked > detector.verdicts[ACCEPT]:
+        print("Flags written. Delete the analytics snapshot and percentiles.db so /api/stats/global "
+              "and score percentiles rebuild without them.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
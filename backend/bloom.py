@@ -0,0 +1,179 @@
+"""Which usernames and emails are taken, answered from memory.
+
+Each worker keeps a Bloom filter of every account's username and another of
+every email. A filter never says "free" for a taken name, and says "maybe
+taken" for a free one with probability ``error_rate``. So registration
+and ``GET /api/auth/available`` skip the database for almost every new
+name and only query it on a "maybe". The unique indexes stay the authority:
+a registration that races another for the same name is turned away by
+the insert.
+
+The filters are built from storage in the background at startup, sized
+for the current accounts plus headroom, and the API answers from the
+database until they are ready. New accounts reach every worker's filters
+through the cache bus. Once the headroom is used up the filters are
+rebuilt at their new size, so the error rate stays near ``error_rate``.
+Python's string hash is salted per process, which is fine for a filter
+that never leaves it.
+
+``python bench.py availability --users 10000000`` measures build time,
+memory, lookups and the false-positive rate.
+"""
+import asyncio
+import logging
+import math
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_MASK64 = (1 << 64) - 1
+
+
+class BloomFilter:
+    """Bloom filter over strings, with ``hashes`` bit positions per item from one 64-bit hash.
+
+    The positions are ``h1 + i * h2`` for the two 32-bit halves of the hash
+    (Kirsch and Mitzenmacher, 2006). Lookups are pure Python; bulk adds
+    go through numpy, which is imported on first use.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        bits = -self.capacity * math.log(error_rate) / math.log(2) ** 2
+        self.size = max(64, int(math.ceil(bits / 64)) * 64)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray(self.size // 8)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+    def _positions(self, value: str) -> Iterable[int]:
+        h = hash(value) & _MASK64
+        low, high = h & 0xFFFFFFFF, (h >> 32) | 1
+        return ((low + i * high) % self.size for i in range(self.hashes))
+
+    def add(self, value: str):
+        bits = self._bits
+        for position in self._positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def add_many(self, values: List[str]):
+        import numpy as np
+
+        if not values:
+            return
+        h = np.fromiter(map(hash, values), dtype=np.int64, count=len(values)).view(np.uint64)
+        low, high = h & np.uint64(0xFFFFFFFF), (h >> np.uint64(32)) | np.uint64(1)
+        positions = (low[:, None] + np.arange(self.hashes, dtype=np.uint64) * high[:, None]) % np.uint64(self.size)
+        positions = positions.ravel()
+        # .at so repeated bytes within the batch all keep their bits
+        np.bitwise_or.at(np.frombuffer(self._bits, dtype=np.uint8), positions >> np.uint64(3),
+                         np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        self.count += len(values)
+
+    def __contains__(self, value: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class TakenNames:
+    """Bloom filters of the usernames and emails in use, kept current in this worker.
+
+    ``load`` is a repository's ``user_names`` and ``count`` its
+    ``count_users``. Until the first build finishes every name is "maybe
+    taken", which sends callers to the database as before.
+    """
+
+    FIELDS = ('username', 'email')
+
+    def __init__(self, load: Callable[[], AsyncIterator[List[Tuple[str, str]]]], count: Callable[[], Awaitable[int]],
+                 error_rate: float = 0.001, headroom: float = 1.5, min_capacity: int = 100000):
+        self._load = load
+        self._count = count
+        self.error_rate = error_rate
+        self.headroom = headroom
+        self.min_capacity = min_capacity
+        self._filters: Optional[Dict[str, BloomFilter]] = None
+        self._added: Optional[List[Tuple[str, str]]] = None  # while a build runs
+        self._task: Optional[asyncio.Task] = None
+        self.checks = {'free': 0, 'maybe': 0, 'not_ready': 0}
+
+    @property
+    def ready(self) -> bool:
+        return self._filters is not None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(f.nbytes for f in self._filters.values()) if self._filters else 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._rebuild())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _rebuild(self):
+        try:
+            await self.rebuild()
+        except Exception:
+            # Every name stays "maybe"; the database still answers
+            logger.exception("Building the taken-name filters failed")
+
+    async def rebuild(self):
+        """Read every account into new filters and swap them in."""
+        self._added = []
+        try:
+            capacity = max(self.min_capacity, int(await self._count() * self.headroom))
+            filters = {field: BloomFilter(capacity, self.error_rate) for field in self.FIELDS}
+            async for batch in self._load():
+                await asyncio.to_thread(self._add_batch, filters, batch)
+            # Accounts registered while the build was reading
+            for field, value in self._added:
+                filters[field].add(value)
+        finally:
+            self._added = None
+        self._filters = filters
+        logger.info("Taken-name filters built: %d accounts, %.1f MiB",
+                    filters['username'].count, self.nbytes / 2 ** 20)
+
+    @staticmethod
+    def _add_batch(filters: Dict[str, BloomFilter], batch: List[Tuple[str, str]]):
+        usernames, emails = zip(*batch)
+        filters['username'].add_many(list(usernames))
+        filters['email'].add_many(list(emails))
+
+    def add(self, field: str, value: str):
+        if self._added is not None:
+            self._added.append((field, value))
+        if self._filters is None:
+            return
+        bloom = self._filters[field]
+        bloom.add(value)
+        if bloom.count > bloom.capacity and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._rebuild())
+
+    def on_event(self, channel: str, key: Optional[str]):
+        """Cache bus subscriber: ``channel`` 'taken_username' or 'taken_email' with the name as key."""
+        if channel.startswith('taken_') and channel[6:] in self.FIELDS and key is not None:
+            self.add(channel[6:], key)
+
+    def might_be_taken(self, field: str, value: Optional[str]) -> bool:
+        """False only if no account has ``value``; True means the database has to say."""
+        if value is None:
+            return False
+        if self._filters is None:
+            self.checks['not_ready'] += 1
+            return True
+        taken = value in self._filters[field]
+        self.checks['maybe' if taken else 'free'] += 1
+        return taken
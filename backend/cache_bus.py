@@ -0,0 +1,178 @@
+"""Cross-worker cache invalidation.
+
+Each gunicorn worker keeps its own in-process caches. Publishing an
+invalidation on the bus clears the entry locally straight away and in every
+other worker on its next poll of a small shared SQLite table, so no external
+service is needed.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LocalCache:
+    """Per-process TTL cache keyed by (channel, key)."""
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, Hashable], Tuple[float, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, channel: str, key: Hashable = None, default: Any = None) -> Any:
+        entry = self._entries.get((channel, key))
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry[1]
+
+    def set(self, channel: str, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[(channel, key)] = (expires, value)
+
+    def invalidate(self, channel: str, key: Hashable = None):
+        """Drop one entry, or the whole channel when key is None."""
+        if key is not None:
+            self._entries.pop((channel, key), None)
+            return
+        for cache_key in [k for k in self._entries if k[0] == channel]:
+            del self._entries[cache_key]
+
+    def clear(self):
+        self._entries.clear()
+
+
+class InvalidationBus:
+    """In-process bus; only reaches subscribers in the current worker."""
+
+    def __init__(self):
+        self._subscribers: List[Callable[[str, Optional[str]], None]] = []
+
+    def subscribe(self, callback: Callable[[str, Optional[str]], None]):
+        self._subscribers.append(callback)
+
+    def _dispatch(self, channel: str, key: Optional[str]):
+        for callback in self._subscribers:
+            try:
+                callback(channel, key)
+            except Exception:
+                logger.exception("Cache bus subscriber failed for %s/%s", channel, key)
+
+    async def publish(self, channel: str, key: Optional[str] = None):
+        self._dispatch(channel, key)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class SQLiteInvalidationBus(InvalidationBus):
+    """Bus shared between processes through an append-only SQLite table.
+
+    Published events are dispatched locally immediately and appended to
+    ``cache_events``; every worker polls for rows newer than the last id it
+    has seen, skipping its own. Old rows are pruned after ``retention``
+    seconds.
+    """
+
+    def __init__(self, path, poll_interval: float = 0.01, retention: float = 60.0):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._db: Optional[aiosqlite.Connection] = None
+        self._last_id = 0
+        self._last_prune = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._db = await aiosqlite.connect(self.path)
+        await self._db.execute('PRAGMA journal_mode=WAL')
+        await self._db.execute('PRAGMA synchronous=NORMAL')
+        await self._db.execute('PRAGMA busy_timeout=1000')
+        await self._db.execute('''
+            CREATE TABLE IF NOT EXISTS cache_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                key TEXT,
+                origin TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        await self._db.commit()
+        # Start from the current tail; events published before this worker
+        # booted cannot refer to anything it has cached.
+        async with self._db.execute('SELECT COALESCE(MAX(id), 0) FROM cache_events') as cursor:
+            self._last_id = (await cursor.fetchone())[0]
+        self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def publish(self, channel: str, key: Optional[str] = None):
+        self._dispatch(channel, key)
+        if self._db is None:
+            return
+        await self._db.execute(
+            'INSERT INTO cache_events (channel, key, origin, created_at) VALUES (?, ?, ?, ?)',
+            (channel, key, self.origin, time.time())
+        )
+        await self._db.commit()
+
+    async def poll(self):
+        """Dispatch events published by other processes since the last poll."""
+        async with self._db.execute(
+            'SELECT id, channel, key, origin FROM cache_events WHERE id > ? ORDER BY id',
+            (self._last_id,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+        for event_id, channel, key, origin in rows:
+            self._last_id = event_id
+            if origin != self.origin:
+                self._dispatch(channel, key)
+
+        now = time.time()
+        if now - self._last_prune > self.retention:
+            self._last_prune = now
+            await self._db.execute('DELETE FROM cache_events WHERE created_at < ?',
+                                   (now - self.retention,))
+            await self._db.commit()
+
+    async def _poll_loop(self):
+        while True:
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Cache bus poll failed")
+            await asyncio.sleep(self.poll_interval)
+
+
+def create_bus(kind: str, path) -> InvalidationBus:
+    """Build the bus selected by the CACHE_BUS setting ('sqlite' or 'local')."""
+    if kind == 'local':
+        return InvalidationBus()
+    return SQLiteInvalidationBus(path)
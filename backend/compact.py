@@ -0,0 +1,158 @@
+"""Migrate a SQLite database from the standard layout to the compact one.
+
+The compact layout (``storage.CompactSQLiteRepository``) replaces uuid
+string keys with integers, ISO-8601 timestamps with epoch microseconds and
+game_type names with numbers from a lookup table, and clusters scores by
+(user, time). Users and scores keep their rowids as keys, so the analytics
+snapshot's watermark stays valid. Exports, analytics and the maintenance
+scripts read the compact tables through views with the old columns
+(``storage.attach_standard_views``).
+
+The migration runs in one transaction; stop the API first, then start it
+with SQLITE_SCHEMA=compact. The file only shrinks after the VACUUM at the
+end (skip it with --no-vacuum and run it later).
+
+Usage:
+    python compact.py --db cognitive_arena.db
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from storage import GAME_TYPES, CompactSQLiteRepository, SQLiteRepository, sqlite_layout, to_micros
+
+# Standard tables renamed out of the way, copied, then dropped
+STANDARD_TABLES = ('users', 'game_scores', 'skill_ratings', 'daily_score_rollups', 'achievement_progress',
+                   'daily_results')
+
+
+def _iso_micros(value):
+    return None if value is None else to_micros(datetime.fromisoformat(value))
+
+
+def _uuid_bytes(value):
+    return uuid.UUID(value).bytes
+
+
+def migrate(db_path, vacuum: bool = True, progress=None) -> int:
+    """Convert ``db_path`` in place; returns the number of scores moved."""
+    # Bring the file to the latest standard schema first
+    asyncio.run(SQLiteRepository(db_path).start())
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        if sqlite_layout(conn) == 'compact':
+            raise RuntimeError(f"{db_path} already has the compact layout")
+        conn.execute('PRAGMA cache_size=-262144')
+        conn.create_function('iso_micros', 1, _iso_micros, deterministic=True)
+        conn.create_function('uuid_bytes', 1, _uuid_bytes, deterministic=True)
+        say = progress or (lambda message: None)
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for table in STANDARD_TABLES:
+                conn.execute(f'ALTER TABLE {table} RENAME TO standard_{table}')
+            for statement in CompactSQLiteRepository.TABLES:
+                conn.execute(statement)
+
+            conn.executemany('INSERT OR IGNORE INTO game_types (name) VALUES (?)',
+                             [(game_type,) for game_type in GAME_TYPES])
+            conn.execute('''
+                INSERT OR IGNORE INTO game_types (name)
+                SELECT game_type FROM standard_game_scores
+                UNION SELECT game_type FROM standard_skill_ratings
+                UNION SELECT game_type FROM standard_daily_score_rollups
+            ''')
+            say("users")
+            conn.execute('''
+                INSERT INTO accounts (key, id, username, email, password, created_at,
+                                      total_games_played, total_score)
+                SELECT rowid, id, username, email, password, iso_micros(created_at),
+                       COALESCE(total_games_played, 0), COALESCE(total_score, 0)
+                FROM standard_users
+            ''')
+            say("scores")
+            # Sorted into the clustered order once, rather than inserted at random positions
+            moved = conn.execute('''
+                INSERT INTO scores (user_key, ts, key, game, score, accuracy, time_taken,
+                                    ai_baseline_score, ai_baseline_accuracy, flag, uuid)
+                SELECT a.key, iso_micros(s.timestamp), s.rowid, g.key, s.score, s.accuracy, s.time_taken,
+                       s.ai_baseline_score, s.ai_baseline_accuracy, s.flag, uuid_bytes(s.id)
+                FROM standard_game_scores s
+                JOIN accounts a ON a.id = s.user_id
+                JOIN game_types g ON g.name = s.game_type
+                ORDER BY 1, 2, 3
+            ''').rowcount
+            total = conn.execute('SELECT COUNT(*) FROM standard_game_scores').fetchone()[0]
+            if moved != total:
+                raise RuntimeError(f"{total - moved} scores belong to no user; the compact layout needs one")
+            conn.execute('''
+                INSERT INTO skill_ratings (user_key, game, rating, deviation, games, updated_at)
+                SELECT a.key, g.key, r.rating, r.deviation, r.games, iso_micros(r.updated_at)
+                FROM standard_skill_ratings r
+                JOIN accounts a ON a.id = r.user_id
+                JOIN game_types g ON g.name = r.game_type
+            ''')
+            conn.execute('''
+                INSERT INTO daily_score_rollups (user_key, game, day, games, flagged, score_sum,
+                                                 accuracy_sum, time_sum, best_score)
+                SELECT a.key, g.key, CAST(julianday(r.day) - 2440587.5 AS INTEGER), r.games, r.flagged,
+                       r.score_sum, r.accuracy_sum, r.time_sum, r.best_score
+                FROM standard_daily_score_rollups r
+                JOIN accounts a ON a.id = r.user_id
+                JOIN game_types g ON g.name = r.game_type
+            ''')
+            conn.execute('''
+                INSERT INTO achievement_progress (user_key, version, state, updated_at)
+                SELECT a.key, p.version, p.state, iso_micros(p.updated_at)
+                FROM standard_achievement_progress p
+                JOIN accounts a ON a.id = p.user_id
+            ''')
+            conn.execute('''
+                INSERT INTO daily_results (day, user_key, score, accuracy, time_taken, submitted_at)
+                SELECT CAST(julianday(d.day) - 2440587.5 AS INTEGER), a.key, d.score, d.accuracy, d.time_taken,
+                       iso_micros(d.submitted_at)
+                FROM standard_daily_results d
+                JOIN accounts a ON a.id = d.user_id
+            ''')
+            for table in STANDARD_TABLES:
+                conn.execute(f'DROP TABLE standard_{table}')
+            say("indexes")
+            for statement in CompactSQLiteRepository.INDEXES:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {CompactSQLiteRepository.SCHEMA_VERSION}')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        if vacuum:
+            say("vacuum")
+            conn.execute('VACUUM')
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=Path(__file__).parent / os.environ.get('DB_NAME', 'cognitive_arena.db'))
+    parser.add_argument('--no-vacuum', action='store_true', help="leave the freed pages in the file")
+    args = parser.parse_args(argv)
+
+    before = Path(args.db).stat().st_size
+    started = time.perf_counter()
+    moved = migrate(args.db, vacuum=not args.no_vacuum, progress=lambda step: print(f"  {step}", file=sys.stderr))
+    after = Path(args.db).stat().st_size
+    print(f"Migrated {moved} scores in {time.perf_counter() - started:.1f}s: "
+          f"{before / 2 ** 20:.1f} MiB -> {after / 2 ** 20:.1f} MiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""The daily challenge: one set of rounds a day, the same for every player.
+
+A day's rounds (an ai_image and a text_ai set, a memory sequence and a
+logical puzzle) come from a ``random.Random`` seeded with an HMAC of the
+UTC date under a server secret. So every worker builds the identical
+challenge on its own, nothing is stored, and tomorrow's rounds cannot be
+worked out from today's or from the source. ``DailyChallenges`` builds a
+day once, renders its public JSON (answers stripped) to bytes with an
+ETag, and keeps the answer key beside it; a scheduler job builds the
+next day ahead and swaps it in at midnight UTC. Serving the challenge is
+a clock comparison and a bytes response: no generation, no database.
+
+The challenge is public for the day, like a crossword, so scores count
+correct answers only and the time the client reports just breaks ties.
+Each player has one result a day (``StorageRepository.record_daily_result``).
+
+``DailyLeaderboard`` keeps each recent day's top ``size`` results in every
+worker. It is loaded from storage on first use and then kept current by
+the results themselves, published on the cache bus as they are saved, so
+reading it never queries the database; the rendered body is cached until
+an entry changes. ``python bench.py daily`` times the challenge and
+leaderboard endpoints and checks the board against storage.
+"""
+import asyncio
+import bisect
+import hashlib
+import hmac
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import orjson
+
+from storage import daily_rank_key
+
+# As the API's responses: UTC datetimes end in "Z"
+JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+DAY_SECONDS = 86400
+
+
+def utc_day(now: Optional[float] = None) -> date:
+    return datetime.fromtimestamp(time.time() if now is None else now, timezone.utc).date()
+
+
+def day_start(day: date) -> float:
+    """Midnight UTC at the start of ``day``, in epoch seconds."""
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()
+
+
+def challenge_seed(secret: str, day: date) -> int:
+    digest = hmac.new(secret.encode('utf-8'), f"daily:{day.isoformat()}".encode('ascii'), hashlib.sha256).digest()
+    return int.from_bytes(digest[:16], 'big')
+
+
+class DailyRound(NamedTuple):
+    game_type: str
+    payload: Dict[str, Any]                      # shown to the player
+    time_limit: int                              # seconds the client allows
+    score: Callable[[Any], Tuple[int, float]]    # answer -> (points, accuracy)
+
+
+class DailyScore(NamedTuple):
+    score: int
+    accuracy: float
+    rounds: List[int]  # points per round
+
+
+class DailyChallenge:
+    """One day's rounds, with the public JSON already rendered."""
+
+    __slots__ = ('day', 'rounds', 'body', 'etag', 'time_limit')
+
+    def __init__(self, day: date, rounds: Sequence[DailyRound]):
+        self.day = day
+        self.rounds = list(rounds)
+        self.time_limit = sum(r.time_limit for r in self.rounds)
+        self.body = orjson.dumps({
+            "day": day,
+            "rounds": [{"round": i, "game_type": r.game_type, "time_limit": r.time_limit, **r.payload}
+                       for i, r in enumerate(self.rounds)],
+            "time_limit": self.time_limit,
+        }, option=JSON_OPTIONS)
+        # The same bytes in every worker, so the tag is too
+        self.etag = f'"{day.isoformat()}-{hashlib.sha256(self.body).hexdigest()[:16]}"'
+
+    def score(self, answers: Sequence[Any]) -> DailyScore:
+        """Points for ``answers`` (one per round, in order; missing ones score nothing)."""
+        points, accuracy = [], 0.0
+        for i, daily_round in enumerate(self.rounds):
+            round_points, round_accuracy = daily_round.score(answers[i]) if i < len(answers) else (0, 0.0)
+            points.append(round_points)
+            accuracy += round_accuracy
+        return DailyScore(sum(points), round(accuracy / len(self.rounds), 1), points)
+
+
+class DailyChallenges:
+    """The challenges of yesterday, today and tomorrow, built once each in this worker.
+
+    ``build(day, rng)`` returns a day's rounds drawn from ``rng``; it is
+    called with the day's seeded generator, at most once per day.
+    ``refresh`` builds today and tomorrow and drops the day before yesterday
+    (kept so results submitted just after midnight still count); run it at
+    startup and then every ``until_refresh()`` seconds, just past midnight.
+    """
+
+    def __init__(self, build: Callable[[date, random.Random], Sequence[DailyRound]], secret: str,
+                 clock: Callable[[], float] = time.time):
+        self._build = build
+        self._secret = secret
+        self._clock = clock
+        self._challenges: Dict[date, DailyChallenge] = {}
+        self._current: Optional[DailyChallenge] = None
+        self._current_until = float('-inf')
+        self.built = 0
+
+    def get(self, day: date) -> DailyChallenge:
+        challenge = self._challenges.get(day)
+        if challenge is None:
+            challenge = self._challenges[day] = DailyChallenge(
+                day, self._build(day, random.Random(challenge_seed(self._secret, day))))
+            self.built += 1
+        return challenge
+
+    def current(self) -> DailyChallenge:
+        """Today's challenge; past midnight it rolls over on the first call, built ahead or not."""
+        now = self._clock()
+        if now >= self._current_until:
+            self._current = self.get(utc_day(now))
+            self._current_until = day_start(self._current.day) + DAY_SECONDS
+        return self._current
+
+    def seconds_left(self) -> float:
+        return max(0.0, self._current_until - self._clock())
+
+    def prepare(self, now: Optional[float] = None):
+        """Build today and tomorrow; forget anything before yesterday."""
+        today = utc_day(self._clock() if now is None else now)
+        self.get(today)
+        self.get(today + timedelta(days=1))
+        for day in [day for day in self._challenges if day < today - timedelta(days=1)]:
+            del self._challenges[day]
+
+    async def refresh(self):
+        self.prepare()
+        self.current()
+
+    def until_refresh(self) -> float:
+        """Seconds to just past the next midnight UTC, when tomorrow's challenge is built."""
+        now = self._clock()
+        return day_start(utc_day(now)) + DAY_SECONDS - now + 0.5
+
+    def __len__(self):
+        return len(self._challenges)
+
+
+class _Board:
+    __slots__ = ('entries', 'keys', 'users', 'body')
+
+    def __init__(self):
+        self.entries: List[Dict[str, Any]] = []
+        self.keys: List[Tuple] = []
+        self.users: set = set()
+        self.body: Optional[bytes] = None
+
+
+class DailyLeaderboard:
+    """The top ``size`` results of recent days, kept current in this worker.
+
+    ``load`` is a repository's ``daily_top``. Results are added with
+    ``add`` (or arrive as 'daily_result' cache bus events, keyed by
+    ``encode``); one arriving while its day is being loaded is applied
+    after the load, and a player already on the board is skipped, so a
+    result read by the load and also received as an event counts once.
+    """
+
+    CHANNEL = 'daily_result'
+
+    def __init__(self, load: Callable[[date, int], Awaitable[List[Dict[str, Any]]]], size: int = 100,
+                 days: int = 7):
+        self._load = load
+        self.size = size
+        self.days = days
+        self._boards: Dict[date, _Board] = {}
+        self._loading: Dict[date, asyncio.Future] = {}
+        self._pending: Dict[date, List[Dict[str, Any]]] = {}
+        self.loads = 0
+
+    @staticmethod
+    def encode(day: date, entry: Dict[str, Any]) -> str:
+        return orjson.dumps(dict(entry, day=day), option=JSON_OPTIONS).decode('utf-8')
+
+    @staticmethod
+    def decode(key: str) -> Tuple[date, Dict[str, Any]]:
+        entry = orjson.loads(key)
+        day = date.fromisoformat(entry.pop('day'))
+        entry['submitted_at'] = datetime.fromisoformat(entry['submitted_at'].replace('Z', '+00:00'))
+        return day, entry
+
+    async def _board(self, day: date) -> _Board:
+        board = self._boards.get(day)
+        if board is not None:
+            return board
+        loading = self._loading.get(day)
+        if loading is None:
+            loading = self._loading[day] = asyncio.ensure_future(self._fetch(day))
+            loading.add_done_callback(lambda _: self._loading.pop(day, None))
+        # Shielded: a reader that goes away does not cancel the load for the others
+        return await asyncio.shield(loading)
+
+    async def _fetch(self, day: date) -> _Board:
+        self._pending[day] = []
+        try:
+            entries = await self._load(day, self.size)
+            self.loads += 1
+            board = _Board()
+            for entry in entries + self._pending[day]:
+                self._insert(board, entry)
+        finally:
+            del self._pending[day]
+        self._boards[day] = board
+        self.prune(max(self._boards))
+        return board
+
+    def _insert(self, board: _Board, entry: Dict[str, Any]) -> bool:
+        if entry['user_id'] in board.users:
+            return False
+        key = daily_rank_key(entry)
+        if len(board.keys) >= self.size and key >= board.keys[-1]:
+            return False
+        position = bisect.bisect(board.keys, key)
+        board.keys.insert(position, key)
+        board.entries.insert(position, entry)
+        board.users.add(entry['user_id'])
+        if len(board.keys) > self.size:
+            board.keys.pop()
+            board.users.discard(board.entries.pop()['user_id'])
+        board.body = None
+        return True
+
+    def admits(self, day: date, entry: Dict[str, Any]) -> bool:
+        """Whether ``entry`` could make the day's board (True for a day not loaded here)."""
+        board = self._boards.get(day)
+        return board is None or len(board.keys) < self.size or daily_rank_key(entry) < board.keys[-1]
+
+    def add(self, day: date, entry: Dict[str, Any]):
+        pending = self._pending.get(day)
+        if pending is not None:
+            pending.append(entry)
+            return
+        board = self._boards.get(day)
+        # A day nobody has asked for here is read from storage, result included, when first asked
+        if board is not None:
+            self._insert(board, entry)
+
+    def on_event(self, channel: str, key: Optional[str]):
+        """Cache bus subscriber for 'daily_result' events."""
+        if channel == self.CHANNEL and key is not None:
+            self.add(*self.decode(key))
+
+    async def body(self, day: date) -> bytes:
+        """The day's leaderboard as rendered JSON."""
+        board = await self._board(day)
+        if board.body is None:
+            board.body = orjson.dumps({
+                "day": day,
+                "leaders": [dict(entry, rank=rank) for rank, entry in enumerate(board.entries, 1)],
+            }, option=JSON_OPTIONS)
+        return board.body
+
+    def prune(self, today: date):
+        """Forget the boards of days more than ``days`` back."""
+        for day in [day for day in self._boards if day <= today - timedelta(days=self.days)]:
+            del self._boards[day]
+
+    def __len__(self):
+        return len(self._boards)
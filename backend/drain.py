@@ -0,0 +1,85 @@
+"""Graceful shutdown for HTTP: stop taking requests, let the running ones finish.
+
+``RequestDrain`` counts the requests in flight. Once ``begin`` is called,
+``DrainMiddleware`` answers new requests with 503, ``Retry-After`` and
+``Connection: close`` (so a client or load balancer retries elsewhere
+instead of reusing this worker's connection) and refuses new WebSockets
+with close code 1012 (service restart). ``wait`` returns once the requests
+already running have finished. The shutdown hook drains first and only
+then stops the scheduler and the stores those requests write to, so a score
+the API acknowledged is always in the database and its percentile sketch
+flushed.
+"""
+import asyncio
+import json
+
+
+class RequestDrain:
+    """HTTP requests in flight in this worker, and whether new ones are still taken."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.draining = False
+        self.refused = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def enter(self):
+        self.in_flight += 1
+        self._idle.clear()
+
+    def leave(self):
+        self.in_flight -= 1
+        if not self.in_flight:
+            self._idle.set()
+
+    def begin(self):
+        self.draining = True
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for the requests in flight; False if some still are."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class DrainMiddleware:
+    """ASGI middleware turning requests away once ``drain.begin()`` has been called."""
+
+    def __init__(self, app, drain: RequestDrain, retry_after: int = 1):
+        self.app = app
+        self.drain = drain
+        self.retry_after = retry_after
+        self._body = json.dumps({"detail": "Server is shutting down"}).encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'websocket' and self.drain.draining:
+            await receive()  # websocket.connect
+            await send({'type': 'websocket.close', 'code': 1012})
+            return
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        if self.drain.draining:
+            self.drain.refused += 1
+            await send({
+                'type': 'http.response.start',
+                'status': 503,
+                'headers': [
+                    (b'content-type', b'application/json'),
+                    (b'content-length', str(len(self._body)).encode()),
+                    (b'retry-after', str(self.retry_after).encode()),
+                    (b'connection', b'close'),
+                ],
+            })
+            await send({'type': 'http.response.body', 'body': self._body})
+            return
+
+        self.drain.enter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.drain.leave()
@@ -0,0 +1,202 @@
+"""Streaming export of game_scores for offline analysis.
+
+Rows are read through a plain SQLite cursor in fixed-size ``fetchmany``
+chunks and encoded chunk by chunk, so memory stays bounded by the batch size
+no matter how many rows are exported. Each export is capped at a watermark
+(the newest timestamp when it started); passing that watermark back as
+``since`` exports only newer rows.
+
+Usage:
+    python export.py --format csv --output scores.csv
+    python export.py --format parquet --since 2025-01-01T00:00:00+00:00 --include-users
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from storage import attach_standard_views, score_time_key
+
+SCORE_COLUMNS = [
+    'id', 'user_id', 'game_type', 'score', 'accuracy', 'time_taken',
+    'ai_baseline_score', 'ai_baseline_accuracy', 'timestamp', 'flag',
+]
+USER_COLUMNS = ['username', 'user_created_at']
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+DEFAULT_BATCH_SIZE = 10000
+
+
+def open_readonly(db_path) -> sqlite3.Connection:
+    # Starlette pulls each chunk of a sync iterator from a threadpool, so the
+    # connection may be stepped from several (never concurrent) threads.
+    conn = sqlite3.connect(f"file:{Path(db_path).as_posix()}?mode=ro", uri=True,
+                           check_same_thread=False)
+    attach_standard_views(conn)
+    return conn
+
+
+def export_watermark(conn: sqlite3.Connection) -> Optional[str]:
+    key, _ = score_time_key(conn)
+    row = conn.execute(f'SELECT timestamp FROM game_scores ORDER BY {key} DESC LIMIT 1').fetchone()
+    return row[0] if row else None
+
+
+def iter_score_batches(conn: sqlite3.Connection, since: Optional[str], until: Optional[str],
+                       include_users: bool = False,
+                       batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[Tuple]]:
+    """Yield lists of at most ``batch_size`` rows with since < timestamp <= until."""
+    columns = ', '.join(f"s.{name}" for name in SCORE_COLUMNS)
+    if include_users:
+        columns += ', u.username, u.created_at'
+        source = 'game_scores s LEFT JOIN users u ON u.id = s.user_id'
+    else:
+        source = 'game_scores s'
+    key, convert = score_time_key(conn)
+    clauses, params = [], []
+    if since:
+        clauses.append(f's.{key} > ?')
+        params.append(convert(since))
+    if until:
+        clauses.append(f's.{key} <= ?')
+        params.append(convert(until))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    cursor = conn.execute(f"SELECT {columns} FROM {source} {where} ORDER BY s.{key}", params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+def encode_ndjson(batches: Iterator[List[Tuple]], columns: Sequence[str]) -> Iterator[bytes]:
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows).encode('utf-8')
+
+
+def encode_csv(batches: Iterator[List[Tuple]], columns: Sequence[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back in chunks."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def encode_parquet(batches: Iterator[List[Tuple]], columns: Sequence[str]) -> Iterator[bytes]:
+    """One row group per batch; bytes are yielded as soon as each group is written."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    types = {
+        'score': pa.int64(), 'time_taken': pa.int64(), 'ai_baseline_score': pa.int64(),
+        'accuracy': pa.float64(), 'ai_baseline_accuracy': pa.float64(),
+    }
+    schema = pa.schema([(name, types.get(name, pa.string())) for name in columns])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for rows in batches:
+            arrays = [pa.array(column, type=field.type) for column, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+ENCODERS = {'ndjson': encode_ndjson, 'csv': encode_csv, 'parquet': encode_parquet}
+
+
+def stream_export(db_path, fmt: str, since: Optional[str] = None, include_users: bool = False,
+                  batch_size: int = DEFAULT_BATCH_SIZE) -> Tuple[Optional[str], Iterator[bytes]]:
+    """Return (watermark, byte iterator) for an export of rows newer than ``since``."""
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    conn = open_readonly(db_path)
+    watermark = export_watermark(conn)
+    columns = SCORE_COLUMNS + (USER_COLUMNS if include_users else [])
+
+    def generate():
+        if watermark is None:
+            conn.close()
+            yield from ENCODERS[fmt](iter(()), columns)
+            return
+        batches = iter_score_batches(conn, since, watermark, include_users, batch_size)
+        try:
+            yield from ENCODERS[fmt](batches, columns)
+        finally:
+            batches.close()
+            conn.close()
+
+    return watermark, generate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=Path(__file__).parent / os.environ.get('DB_NAME', 'cognitive_arena.db'))
+    parser.add_argument('--format', choices=sorted(ENCODERS), default='ndjson')
+    parser.add_argument('--since', help="export rows newer than this watermark timestamp")
+    parser.add_argument('--include-users', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--output', help="output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    watermark, chunks = stream_export(args.db, args.format, args.since, args.include_users, args.batch_size)
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    # Pass this back as --since for the next incremental export
+    print(f"watermark: {watermark or args.since or ''}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
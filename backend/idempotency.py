@@ -0,0 +1,350 @@
+"""Idempotency-Key support for write endpoints.
+
+A client that retries a request with the same ``Idempotency-Key`` header
+gets the original response replayed instead of the write running twice.
+Records live in a bounded in-memory LRU; ``SQLiteIdempotencyStore`` adds a
+table shared by all workers, so a retry that lands on another worker is
+still a single indexed lookup rather than a second write.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+
+import aiosqlite
+import jwt
+
+# Outcomes of IdempotencyStore.claim
+NEW = 'new'                  # first request with this key: run it
+REPLAY = 'replay'            # finished before: send the stored response
+IN_PROGRESS = 'in_progress'  # the first request is still running
+MISMATCH = 'mismatch'        # key reused for a different request
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    status: int
+    content_type: Optional[str]
+    body: bytes
+
+
+class MemoryIdempotencyStore:
+    """Per-process idempotency records, LRU-bounded to ``max_entries``.
+
+    A record is ``[expires_at, fingerprint, response]``; ``response`` is None
+    while the first request runs, and such a claim lapses after ``lease``
+    seconds in case its worker died. Completed records expire after ``ttl``.
+    """
+
+    def __init__(self, ttl: float = 86400.0, max_entries: int = 10000, lease: float = 60.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lease = lease
+        self._records: 'OrderedDict[str, list]' = OrderedDict()
+        self.replays = 0
+        self.conflicts = 0
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def claim(self, key: str, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        now = time.time()
+        record = self._lookup(key, now)
+        if record is not None:
+            return self._resolve(record, fingerprint)
+        self._remember(key, [now + self.lease, fingerprint, None])
+        return NEW, None
+
+    async def complete(self, key: str, fingerprint: str, response: StoredResponse):
+        self._remember(key, [time.time() + self.ttl, fingerprint, response])
+
+    async def release(self, key: str):
+        """Forget a claim whose request failed, so a retry runs it again."""
+        self._records.pop(key, None)
+
+    def _lookup(self, key: str, now: float) -> Optional[list]:
+        record = self._records.get(key)
+        if record is None:
+            return None
+        if record[0] <= now:
+            del self._records[key]
+            return None
+        self._records.move_to_end(key)
+        return record
+
+    def _remember(self, key: str, record: list):
+        self._records[key] = record
+        self._records.move_to_end(key)
+        while len(self._records) > self.max_entries:
+            self._records.popitem(last=False)
+
+    def _resolve(self, record: list, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        if record[1] != fingerprint:
+            self.conflicts += 1
+            return MISMATCH, None
+        if record[2] is None:
+            self.conflicts += 1
+            return IN_PROGRESS, None
+        self.replays += 1
+        return REPLAY, record[2]
+
+    def __len__(self):
+        return len(self._records)
+
+
+class SQLiteIdempotencyStore(MemoryIdempotencyStore):
+    """Records shared by all workers through one SQLite table, with the LRU in front.
+
+    Retries that reach the worker which served the original are answered
+    from memory. Claiming a key is a single INSERT ... ON CONFLICT DO UPDATE
+    (only over an expired record) ... RETURNING, so two workers can never
+    both run the same request.
+    """
+
+    def __init__(self, path, ttl: float = 86400.0, max_entries: int = 10000, lease: float = 60.0,
+                 compact_interval: float = 300.0):
+        super().__init__(ttl, max_entries, lease)
+        self.path = path
+        self.compact_interval = compact_interval
+        self._db: Optional[aiosqlite.Connection] = None
+        self._next_compaction = 0.0
+
+    async def start(self):
+        # Autocommit: every statement below is its own transaction
+        self._db = await aiosqlite.connect(self.path, isolation_level=None)
+        await self._db.execute('PRAGMA journal_mode=WAL')
+        await self._db.execute('PRAGMA synchronous=NORMAL')
+        await self._db.execute('PRAGMA busy_timeout=1000')
+        await self._db.execute('''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                status INTEGER,
+                content_type TEXT,
+                body BLOB,
+                expires_at REAL NOT NULL
+            )
+        ''')
+
+    async def stop(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def claim(self, key, fingerprint):
+        now = time.time()
+        record = self._lookup(key, now)
+        if record is not None:
+            return self._resolve(record, fingerprint)
+
+        if now >= self._next_compaction:
+            self._next_compaction = now + self.compact_interval
+            await self._db.execute('DELETE FROM idempotency_keys WHERE expires_at <= ?', (now,))
+
+        async with self._db.execute('''
+            INSERT INTO idempotency_keys (key, fingerprint, expires_at) VALUES (:key, :fingerprint, :expires_at)
+            ON CONFLICT (key) DO UPDATE SET
+                fingerprint = excluded.fingerprint, status = NULL, content_type = NULL, body = NULL,
+                expires_at = excluded.expires_at
+            WHERE idempotency_keys.expires_at <= :now
+            RETURNING key
+        ''', {'key': key, 'fingerprint': fingerprint, 'expires_at': now + self.lease, 'now': now}) as cursor:
+            claimed = await cursor.fetchone() is not None
+        if claimed:
+            self._remember(key, [now + self.lease, fingerprint, None])
+            return NEW, None
+
+        async with self._db.execute(
+            'SELECT expires_at, fingerprint, status, content_type, body FROM idempotency_keys WHERE key = ?',
+            (key,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            # Released between the two statements; the client can simply retry
+            self.conflicts += 1
+            return IN_PROGRESS, None
+        expires_at, stored_fingerprint, status, content_type, body = row
+        response = StoredResponse(status, content_type, body) if status is not None else None
+        record = [expires_at, stored_fingerprint, response]
+        if response is not None:
+            self._remember(key, record)  # further retries on this worker skip the table
+        return self._resolve(record, fingerprint)
+
+    async def complete(self, key, fingerprint, response):
+        await super().complete(key, fingerprint, response)
+        await self._db.execute('''
+            UPDATE idempotency_keys SET status = ?, content_type = ?, body = ?, expires_at = ?
+            WHERE key = ?
+        ''', (response.status, response.content_type, response.body, time.time() + self.ttl, key))
+
+    async def release(self, key):
+        await super().release(key)
+        await self._db.execute('DELETE FROM idempotency_keys WHERE key = ? AND status IS NULL', (key,))
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware honouring ``Idempotency-Key`` on the given (method, path) routes.
+
+    A path segment written ``{name}`` matches any one segment, so
+    ``/api/games/memory/rounds/{round_id}`` covers every round; the key is
+    scoped to the concrete path.
+
+    Keys are scoped to the caller and the route. The caller is the user id in
+    the bearer token (signature check only, like the rate limiter); requests
+    without a token are guests, scoped by client address so one guest's key
+    never replays another's response, and invalid tokens pass straight
+    through to be rejected by the endpoint. A body over ``MAX_BODY_BYTES`` is
+    refused with 413 rather than buffered and hashed. A 2xx response is
+    stored and replayed to retries carrying the same key and the same query
+    and body, with ``Idempotency-Replayed: true``. Other responses are not
+    stored, so a failed request can be retried under the same key.
+    """
+
+    MAX_KEY_LENGTH = 255
+    MAX_BODY_BYTES = 64 * 1024  # score submissions are a few hundred bytes
+
+    def __init__(self, app, store: MemoryIdempotencyStore, routes: Iterable[Tuple[str, str]],
+                 jwt_secret: str, jwt_algorithms: Iterable[str] = ('HS256',)):
+        self.app = app
+        self.store = store
+        routes = set(routes)
+        self.templates = frozenset((method, tuple(path.split('/'))) for method, path in routes if '{' in path)
+        self.routes = frozenset(routes) - {(method, '/'.join(parts)) for method, parts in self.templates}
+        self.jwt_secret = jwt_secret
+        self.jwt_algorithms = list(jwt_algorithms)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self._matches(scope['method'], scope['path']):
+            await self.app(scope, receive, send)
+            return
+
+        idempotency_key, token = None, None
+        for name, value in scope['headers']:
+            if name == b'idempotency-key':
+                idempotency_key = value.decode('latin-1').strip()
+            elif name == b'authorization':
+                scheme, _, token = value.decode('latin-1').partition(' ')
+                if scheme.lower() != 'bearer':
+                    token = None
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > self.MAX_KEY_LENGTH:
+            await self._reject(send, 400, f"Idempotency-Key must be 1 to {self.MAX_KEY_LENGTH} characters")
+            return
+        caller = self._caller(token)
+        if caller is None:
+            await self.app(scope, receive, send)
+            return
+
+        if caller == 'guest':
+            caller = f"guest@{scope['client'][0] if scope.get('client') else ''}"
+
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message['type'] != 'http.request':
+                return  # client went away before sending the body
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.MAX_BODY_BYTES:
+                await self._reject(send, 413, f"Request body over {self.MAX_BODY_BYTES} bytes")
+                return
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+        body = b''.join(chunks)
+        fingerprint = hashlib.sha256(scope['query_string'] + b'?' + body).hexdigest()
+        key = f"{caller}:{scope['method']} {scope['path']}:{idempotency_key}"
+
+        outcome, stored = await self.store.claim(key, fingerprint)
+        if outcome == REPLAY:
+            await self._replay(send, stored)
+            return
+        if outcome == IN_PROGRESS:
+            await self._reject(send, 409, "A request with this Idempotency-Key is still in progress")
+            return
+        if outcome == MISMATCH:
+            await self._reject(send, 422, "Idempotency-Key was already used for a different request")
+            return
+        await self._run(scope, receive, send, key, fingerprint, body)
+
+    def _matches(self, method: str, path: str) -> bool:
+        if (method, path) in self.routes:
+            return True
+        if not self.templates:
+            return False
+        parts = path.split('/')
+        return any(
+            method == route_method and len(parts) == len(template) and all(
+                expected == part or (expected.startswith('{') and expected.endswith('}') and part)
+                for expected, part in zip(template, parts)
+            )
+            for route_method, template in self.templates
+        )
+
+    async def _run(self, scope, receive, send, key: str, fingerprint: str, body: bytes):
+        body_sent = False
+
+        async def replay_body():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            return await receive()
+
+        status, content_type, response_body, finished = 500, None, [], False
+
+        async def capture(message):
+            nonlocal status, content_type, finished
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                for name, value in message.get('headers', []):
+                    if name == b'content-type':
+                        content_type = value.decode('latin-1')
+            elif message['type'] == 'http.response.body':
+                response_body.append(message.get('body', b''))
+                finished = not message.get('more_body', False)
+            await send(message)
+
+        try:
+            await self.app(scope, replay_body, capture)
+        finally:
+            # Keep the response even if sending it failed: the write already happened
+            if finished and 200 <= status < 300:
+                await self.store.complete(key, fingerprint,
+                                          StoredResponse(status, content_type, b''.join(response_body)))
+            else:
+                await self.store.release(key)
+
+    def _caller(self, token: Optional[str]) -> Optional[str]:
+        if not token:
+            return 'guest'
+        try:
+            payload = jwt.decode(token, self.jwt_secret, algorithms=self.jwt_algorithms)
+        except jwt.PyJWTError:
+            return None
+        return payload.get('user_id')
+
+    @staticmethod
+    async def _replay(send, response: StoredResponse):
+        headers = [(b'content-length', str(len(response.body)).encode()), (b'idempotency-replayed', b'true')]
+        if response.content_type:
+            headers.append((b'content-type', response.content_type.encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': response.body})
+
+    @staticmethod
+    async def _reject(send, status: int, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,223 @@
+"""Local load test for the API.
+
+Seeds a throwaway SQLite database, boots the FastAPI app in-process (or
+targets a running server with --url) and drives a weighted mix of realistic
+requests from concurrent virtual users through an async HTTP client.
+Throughput and p50/p95/p99 latency per endpoint are printed and saved as
+JSON so runs can be compared across commits.
+
+Usage:
+    python loadtest.py --users 1000 --mean-games 20 --concurrency 50 --duration 30
+    python loadtest.py --url http://localhost:8000 --duration 60
+    python loadtest.py --compare bench_results/previous.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from bench import AppLifespan, percentile  # noqa: E402
+from seed import SEED_PASSWORD, SeedConfig, load_sqlite, seed_password_hash  # noqa: E402
+
+# Memory challenge scores only come from server-scored rounds
+GAME_TYPES = ['ai_image', 'text_ai']
+
+# (weight, name, needs_login)
+WORKLOAD = [
+    (25, 'ai_image_round', False),
+    (20, 'text_ai_round', False),
+    (15, 'memory_round', False),
+    (15, 'leaderboard', False),
+    (12, 'submit_score', True),
+    (8, 'user_stats', True),
+    (3, 'login', False),
+    (2, 'history', True),
+]
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, username: str, rng: random.Random):
+        self.client = client
+        self.username = username
+        self.rng = rng
+        self.token = None
+
+    async def login(self):
+        response = await self.client.post('/api/auth/login',
+                                          json={'username': self.username, 'password': SEED_PASSWORD})
+        if response.status_code == 200:
+            self.token = response.json()['token']
+        return response
+
+    def headers(self):
+        return {'Authorization': f"Bearer {self.token}"} if self.token else {}
+
+    async def request(self, name: str):
+        client, headers = self.client, self.headers()
+        if name == 'ai_image_round':
+            return await client.get('/api/games/ai-image/data')
+        if name == 'text_ai_round':
+            return await client.get('/api/games/text-ai/data')
+        if name == 'memory_round':
+            return await client.get('/api/games/memory/data', params={'difficulty': self.rng.randint(1, 3)})
+        if name == 'leaderboard':
+            return await client.get('/api/leaderboard')
+        if name == 'login':
+            return await self.login()
+        if name == 'submit_score':
+            score = self.rng.randint(0, 100)
+            return await client.post('/api/games/score', headers=headers, json={
+                'game_type': self.rng.choice(GAME_TYPES), 'score': score,
+                'accuracy': float(score), 'time_taken': self.rng.randint(1, 60),
+            })
+        if name == 'user_stats':
+            return await client.get('/api/stats/user', headers=headers)
+        if name == 'history':
+            return await client.get('/api/stats/user/history', headers=headers, params={'limit': 20})
+        raise ValueError(name)
+
+
+async def drive(client: httpx.AsyncClient, n_users: int, concurrency: int, duration: float,
+                max_requests: int, seed: int):
+    weights = [w for w, _, _ in WORKLOAD]
+    names = [n for _, n, _ in WORKLOAD]
+    needs_login = {n for _, n, login in WORKLOAD if login}
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    issued = 0
+    deadline = time.perf_counter() + duration
+
+    async def virtual_user(index: int):
+        nonlocal issued
+        rng = random.Random(seed * 1000 + index)
+        user = VirtualUser(client, f"user{rng.randrange(max(1, n_users))}", rng)
+        while time.perf_counter() < deadline and (not max_requests or issued < max_requests):
+            name = rng.choices(names, weights)[0]
+            if name in needs_login and user.token is None:
+                await user.login()
+            issued += 1
+            start = time.perf_counter()
+            try:
+                response = await user.request(name)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies[name].append(time.perf_counter() - start)
+            if not ok:
+                errors[name] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for name in names:
+        values = latencies[name]
+        if not values:
+            continue
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "rps": round(len(values) / elapsed, 1),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+        }
+    total = sum(len(v) for v in latencies.values())
+    return {"elapsed_s": round(elapsed, 2), "requests": total, "rps": round(total / elapsed, 1),
+            "errors": sum(errors.values()), "endpoints": endpoints}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_report(results, baseline=None):
+    print(f"{results['requests']} requests in {results['elapsed_s']}s "
+          f"({results['rps']} req/s, {results['errors']} errors)")
+    print(f"{'endpoint':<16}{'reqs':>8}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in results['endpoints'].items():
+        line = (f"{name:<16}{row['requests']:>8}{row['errors']:>6}{row['rps']:>9}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+        before = (baseline or {}).get('endpoints', {}).get(name)
+        if before and before['p95_ms']:
+            line += f"   p95 {(row['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100:+.1f}%"
+        print(line)
+
+
+async def main_async(args):
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+        results = await drive(client, args.users, args.concurrency, args.duration, args.requests, args.seed)
+        await client.aclose()
+        return results
+
+    workdir = Path(tempfile.mkdtemp(prefix='loadtest-'))
+    db_path = workdir / 'loadtest.db'
+    print(f"Seeding {args.users} users (~{args.mean_games:g} games each) into {db_path} ...")
+    config = SeedConfig(users=args.users, mean_games=args.mean_games, seed=args.seed)
+    await asyncio.to_thread(load_sqlite, db_path, config, seed_password_hash())
+
+    # server.py reads its configuration at import time
+    os.environ.update({
+        'DB_NAME': str(db_path),
+        'CACHE_BUS': 'local',
+        'RATE_LIMIT_ENABLED': '0',
+        'ANALYTICS_SNAPSHOT': str(workdir / 'analytics_snapshot.npz'),
+    })
+    import server
+
+    transport = httpx.ASGITransport(app=server.app, client=('127.0.0.1', 50000))
+    async with AppLifespan(server.app):
+        async with httpx.AsyncClient(transport=transport, base_url='http://loadtest', timeout=30) as client:
+            return await drive(client, args.users, args.concurrency, args.duration, args.requests, args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="target a running server instead of booting the app in-process")
+    parser.add_argument('--users', type=int, default=500, help="seeded users (virtual users log in as these)")
+    parser.add_argument('--mean-games', type=float, default=20.0, help="mean seeded games per user")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=15.0, help="seconds")
+    parser.add_argument('--requests', type=int, default=0, help="stop after this many requests (0 = no limit)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output-dir', default=ROOT_DIR / 'bench_results')
+    parser.add_argument('--compare', help="previous results JSON to diff p95 against")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(main_async(args))
+    results.update({
+        "revision": git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ('output_dir', 'compare')},
+    })
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(results, baseline)
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output = output_dir / f"loadtest-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{results['revision']}.json"
+    output.write_text(json.dumps(results, indent=2, default=str))
+    print(f"Saved {output}")
+    return 1 if results['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,432 @@
+"""Live head-to-head matches: rating-ordered matchmaking and the match coordinator.
+
+Players waiting for an opponent sit in one ``MatchQueue`` per game type,
+ordered by rating. Ratings are rounded into one-point buckets and a
+Fenwick tree over the bucket counts finds the nearest waiting rating above
+or below any point, so joining, leaving and matching are O(log buckets)
+however many players wait. Each player accepts opponents within a window
+that starts at ``window`` rating points and widens by ``growth`` per second
+of waiting, up to ``max_window``; a pair is made when the gap is inside the
+window of whichever of the two has waited longer.
+
+The queue is never swept. A player who cannot be paired on joining gets
+one check on a heap, due when the window reaches their nearest opponent;
+when a player leaves the queue, their former neighbours are checked
+again. A check either makes the pair or schedules the next one, so each
+costs a few tree lookups. Nobody waits forever: players still unpaired
+after ``max_wait`` seconds are taken out and told there is no opponent. As
+joins arrive in time order, they are found at the front of a queue of join
+times, without a sweep either.
+
+A pair becomes a ``LiveMatch``: both players get the same round at the
+same moment, the server times each answer from when the round went out,
+and whoever has not answered ``time_limit`` (plus a little network grace)
+later scores nothing. Like the memory rounds, queues and matches live in
+one process: with several workers, route every match connection to one.
+
+``python bench.py matchmaking`` times the queue with up to 100k players
+waiting and plays matches between simulated WebSocket clients.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from array import array
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RATING_BUCKETS = 4096  # one per rating point; ratings outside 0..4095 share the end buckets
+
+
+class Ticket(NamedTuple):
+    user_id: str
+    name: str
+    rating: float
+    joined_at: float  # monotonic seconds
+
+
+class AlreadyQueued(Exception):
+    """The player is already waiting for a match."""
+
+
+class MatchmakingFull(Exception):
+    """``capacity`` players are already waiting."""
+
+
+class NoOpponent(Exception):
+    """The player waited ``max_wait`` seconds without being paired."""
+
+
+class MatchQueue:
+    """Waiting players of one game, ordered by rating.
+
+    Buckets hold their tickets in arrival order (a dict keyed by user id),
+    and ``_tree`` is a Fenwick tree of how many tickets each bucket holds.
+    """
+
+    def __init__(self, buckets: int = RATING_BUCKETS):
+        self.buckets = buckets
+        self._tree = array('i', bytes(4 * (buckets + 1)))
+        self._top = 1 << (buckets.bit_length() - 1)
+        self._slots: Dict[int, Dict[str, Ticket]] = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _bucket(self, rating: float) -> int:
+        return min(self.buckets - 1, max(0, int(rating)))
+
+    def _update(self, bucket: int, delta: int):
+        i = bucket + 1
+        while i <= self.buckets:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, bucket: int) -> int:
+        """Tickets in buckets 0..``bucket``."""
+        total, i = 0, bucket + 1
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _find(self, k: int) -> int:
+        """The bucket holding the ``k``-th ticket (1-based) in rating order."""
+        position, step = 0, self._top
+        while step:
+            following = position + step
+            if following <= self.buckets and self._tree[following] < k:
+                position = following
+                k -= self._tree[following]
+            step >>= 1
+        return position
+
+    def add(self, ticket: Ticket):
+        bucket = self._bucket(ticket.rating)
+        slot = self._slots.setdefault(bucket, {})
+        slot[ticket.user_id] = ticket
+        self._update(bucket, 1)
+        self._count += 1
+
+    def remove(self, ticket: Ticket) -> bool:
+        bucket = self._bucket(ticket.rating)
+        slot = self._slots.get(bucket)
+        if slot is None or slot.pop(ticket.user_id, None) is None:
+            return False
+        if not slot:
+            del self._slots[bucket]
+        self._update(bucket, -1)
+        self._count -= 1
+        return True
+
+    def neighbours(self, rating: float, skip: Optional[str] = None) -> List[Ticket]:
+        """The longest-waiting ticket at ``rating``'s bucket and at the nearest ones below and above it."""
+        bucket = self._bucket(rating)
+        found = []
+        same = self._slots.get(bucket)
+        if same:
+            ticket = next((t for user_id, t in same.items() if user_id != skip), None)
+            if ticket is not None:
+                found.append(ticket)
+        below = self._prefix(bucket - 1) if bucket else 0
+        if below:
+            found.append(next(iter(self._slots[self._find(below)].values())))
+        upto = below + len(same or ())
+        if upto < self._count:
+            found.append(next(iter(self._slots[self._find(upto + 1)].values())))
+        return found
+
+    def nearest(self, rating: float, skip: Optional[str] = None) -> Optional[Ticket]:
+        """The waiting ticket closest in rating (the longer-waiting one on a tie), other than ``skip``'s."""
+        return min(self.neighbours(rating, skip), key=lambda t: (abs(t.rating - rating), t.joined_at), default=None)
+
+
+class Matchmaker:
+    """Pairs waiting players of each game type by rating, within a window that widens as they wait.
+
+    ``join`` returns a future; ``start_match(game_type, a, b)`` is called
+    with each pair, ``a`` the longer-waiting, and its return value resolves
+    both players' futures. A player still waiting after ``max_wait``
+    seconds (None: no limit) leaves the queue and their future fails with
+    NoOpponent.
+    """
+
+    def __init__(self, start_match: Callable[[str, Ticket, Ticket], Any], window: float = 50.0,
+                 growth: float = 25.0, max_window: float = 400.0, capacity: int = 100000, interval: float = 0.1,
+                 max_wait: Optional[float] = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.start_match = start_match
+        self.window = window
+        self.growth = growth
+        self.max_window = max_window
+        self.capacity = capacity
+        self.interval = interval
+        self.max_wait = max_wait
+        self.clock = clock
+        self._queues: Dict[str, MatchQueue] = {}
+        self._waiting: Dict[str, Tuple[str, Ticket, asyncio.Future]] = {}
+        self._due: List[Tuple[float, int, str, str, float]] = []  # (due, seq, game_type, user_id, joined_at)
+        self._seq = itertools.count()
+        self._joined: Deque[Tuple[float, str]] = deque()  # (joined_at, user_id), in join order
+        self._task: Optional[asyncio.Task] = None
+        self.matched = 0
+        self.timed_out = 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for _, _, future in self._waiting.values():
+            future.cancel()
+        self._waiting.clear()
+        self._queues.clear()
+        self._due.clear()
+        self._joined.clear()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.check_due(self.clock())
+            except Exception:
+                logger.exception("Matchmaking check failed")
+
+    def waiting(self) -> Dict[Tuple[str], int]:
+        """Players waiting, by game type (for the metrics gauge)."""
+        return {(game_type,): len(queue) for game_type, queue in self._queues.items()}
+
+    def window_at(self, ticket: Ticket, now: float) -> float:
+        return min(self.max_window, self.window + self.growth * max(0.0, now - ticket.joined_at))
+
+    def join(self, game_type: str, user_id: str, rating: float, name: str = '') -> asyncio.Future:
+        if user_id in self._waiting:
+            raise AlreadyQueued(user_id)
+        if len(self._waiting) >= self.capacity:
+            raise MatchmakingFull()
+        now = self.clock()
+        ticket = Ticket(user_id, name, rating, now)
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(game_type)
+        if queue is None:
+            queue = self._queues[game_type] = MatchQueue()
+        queue.add(ticket)
+        self._waiting[user_id] = (game_type, ticket, future)
+        if self.max_wait is not None:
+            self._joined.append((now, user_id))
+        self._check(game_type, ticket, now)
+        return future
+
+    def leave(self, user_id: str) -> bool:
+        """Take a player out of the queue; False if they were not waiting (or already paired)."""
+        entry = self._waiting.pop(user_id, None)
+        if entry is None:
+            return False
+        game_type, ticket, future = entry
+        self._queues[game_type].remove(ticket)
+        future.cancel()
+        self._recheck(game_type, (ticket,), self.clock())
+        return True
+
+    def check_due(self, now: float):
+        """Pair the players whose windows now reach an opponent, and time out those who waited ``max_wait``."""
+        due = []
+        while self._due and self._due[0][0] <= now:
+            due.append(heapq.heappop(self._due))
+        for _, _, game_type, user_id, joined_at in due:
+            entry = self._waiting.get(user_id)
+            # Skip players who were paired or left (or left and joined again) since
+            if entry is not None and entry[1].joined_at == joined_at:
+                self._check(game_type, entry[1], now)
+        if self.max_wait is not None:
+            self._expire(now - self.max_wait, now)
+
+    def _expire(self, cutoff: float, now: float):
+        while self._joined and self._joined[0][0] <= cutoff:
+            joined_at, user_id = self._joined.popleft()
+            entry = self._waiting.get(user_id)
+            if entry is None or entry[1].joined_at != joined_at:
+                continue  # paired or left since
+            game_type, ticket, future = self._waiting.pop(user_id)
+            self._queues[game_type].remove(ticket)
+            self.timed_out += 1
+            future.set_exception(NoOpponent(user_id))
+            self._recheck(game_type, (ticket,), now)
+
+    def _check(self, game_type: str, ticket: Ticket, now: float):
+        other = self._queues[game_type].nearest(ticket.rating, skip=ticket.user_id)
+        if other is None:
+            return  # alone: the next player to join checks against this one
+        first, second = (other, ticket) if (other.joined_at, other.user_id) < (ticket.joined_at, ticket.user_id) \
+            else (ticket, other)
+        gap = abs(other.rating - ticket.rating)
+        if gap <= self.window_at(first, now) + 1e-9:
+            self._pair(game_type, first, second, now)
+        elif self.growth > 0 and gap <= self.max_window:
+            due = first.joined_at + (gap - self.window) / self.growth
+            heapq.heappush(self._due, (max(due, now), next(self._seq), game_type, ticket.user_id, ticket.joined_at))
+        # Otherwise only a new neighbour can pair this player, and its arrival checks
+
+    def _recheck(self, game_type: str, gone: Iterable[Ticket], now: float):
+        """Check the neighbours of players who left the queue on the next tick: their nearest opponent changed."""
+        queue = self._queues[game_type]
+        for ticket in gone:
+            for neighbour in queue.neighbours(ticket.rating):
+                heapq.heappush(self._due, (now, next(self._seq), game_type, neighbour.user_id, neighbour.joined_at))
+
+    def _pair(self, game_type: str, first: Ticket, second: Ticket, now: float):
+        queue = self._queues[game_type]
+        futures = []
+        for ticket in (first, second):
+            queue.remove(ticket)
+            futures.append(self._waiting.pop(ticket.user_id)[2])
+        self.matched += 1
+        self._recheck(game_type, (first, second), now)
+        try:
+            match = self.start_match(game_type, first, second)
+        except Exception as exc:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for future in futures:
+            if not future.done():
+                future.set_result(match)
+
+
+class MatchRound(NamedTuple):
+    payload: Dict[str, Any]  # shown to both players
+    time_limit: float        # seconds from the round going out to the last answer accepted
+    score: Callable[[Any, float], Tuple[int, float, int]]  # (answer, seconds) -> (score, accuracy, time_taken)
+
+
+class PlayerResult(NamedTuple):
+    ticket: Ticket
+    answered: bool
+    score: int
+    accuracy: float
+    time_taken: int
+    elapsed: float  # seconds from the round going out to the answer, timed by the server
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'username': self.ticket.name, 'answered': self.answered, 'score': self.score,
+                'accuracy': self.accuracy, 'time_taken': self.time_taken, 'elapsed': round(self.elapsed, 3)}
+
+
+def match_winner(results: List[PlayerResult]) -> Optional[str]:
+    """User id of the winner: an answer beats none, then the higher score, then the faster answer. None on a draw."""
+    ranked = sorted(results, key=lambda r: (not r.answered, -r.score, r.elapsed))
+    best, runner_up = ranked[0], ranked[1]
+    if (best.answered, best.score, best.elapsed) == (runner_up.answered, runner_up.score, runner_up.elapsed) \
+            or not best.answered:
+        return None
+    return best.ticket.user_id
+
+
+class LiveMatch:
+    """One round between two players, timed by the server.
+
+    Each player's connection ``attach``\\ es a send function and passes
+    their answer to ``answer``, or calls ``forfeit`` if it drops. ``run``
+    sends the round once both are attached (or ``attach_timeout`` has
+    passed), collects the answers, hands the results to ``record`` and
+    sends each player the outcome with whatever ``record`` returned for
+    them. ``finished`` is set when the match is over, however it ended.
+    """
+
+    def __init__(self, match_id: str, game_type: str, players: Tuple[Ticket, Ticket], match_round: MatchRound,
+                 grace: float = 2.0, attach_timeout: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        self.id = match_id
+        self.game_type = game_type
+        self.players = players
+        self.round = match_round
+        self.grace = grace
+        self.attach_timeout = attach_timeout
+        self.clock = clock
+        loop = asyncio.get_running_loop()
+        self._answers: Dict[str, asyncio.Future] = {t.user_id: loop.create_future() for t in players}
+        self._senders: Dict[str, Callable[[Dict[str, Any]], Awaitable[None]]] = {}
+        self._attached = asyncio.Event()
+        self.finished = asyncio.Event()
+        self.started_at: Optional[float] = None
+        self.results: Optional[List[PlayerResult]] = None
+
+    def opponent(self, user_id: str) -> Ticket:
+        return self.players[1] if self.players[0].user_id == user_id else self.players[0]
+
+    def attach(self, user_id: str, send: Callable[[Dict[str, Any]], Awaitable[None]]):
+        self._senders[user_id] = send
+        self._signal_attached()
+
+    def _signal_attached(self):
+        if all(user_id in self._senders or self._answers[user_id].done() for user_id in self._answers):
+            self._attached.set()
+
+    def answer(self, user_id: str, answer: Any) -> bool:
+        """Take ``user_id``'s answer; False before the round went out or after their first answer."""
+        future = self._answers.get(user_id)
+        if future is None or future.done() or self.started_at is None:
+            return False
+        future.set_result((answer, self.clock() - self.started_at))
+        return True
+
+    def forfeit(self, user_id: str):
+        future = self._answers.get(user_id)
+        if future is not None and not future.done():
+            future.set_result(None)
+            self._signal_attached()
+
+    async def _send(self, messages: Dict[str, Dict[str, Any]]):
+        sends = [self._senders[user_id](message) for user_id, message in messages.items() if user_id in self._senders]
+        # A player who has gone away just misses the message
+        await asyncio.gather(*sends, return_exceptions=True)
+
+    async def run(self, record: Callable[['LiveMatch', List[PlayerResult]], Awaitable[Dict[str, Dict[str, Any]]]]):
+        try:
+            try:
+                await asyncio.wait_for(self._attached.wait(), self.attach_timeout)
+            except asyncio.TimeoutError:
+                pass  # whoever has not connected scores nothing
+            message = {'type': 'round', 'match_id': self.id, 'game_type': self.game_type,
+                       'round': self.round.payload, 'time_limit': self.round.time_limit}
+            self.started_at = self.clock()
+            await self._send({user_id: message for user_id in self._senders})
+            await asyncio.wait(list(self._answers.values()), timeout=self.round.time_limit + self.grace)
+            self.results = [self._result(ticket) for ticket in self.players]
+            try:
+                extra = await record(self, self.results)
+            except Exception:
+                logger.exception("Recording match %s failed", self.id)
+                extra = {}
+            winner = match_winner(self.results)
+            messages = {}
+            for result, other in zip(self.results, reversed(self.results)):
+                user_id = result.ticket.user_id
+                outcome = 'draw' if winner is None else 'win' if winner == user_id else 'loss'
+                messages[user_id] = {'type': 'result', 'match_id': self.id, 'outcome': outcome,
+                                     'you': result.to_dict(), 'opponent': other.to_dict(), **extra.get(user_id, {})}
+            await self._send(messages)
+        finally:
+            for future in self._answers.values():
+                if not future.done():
+                    future.cancel()
+            self.finished.set()
+
+    def _result(self, ticket: Ticket) -> PlayerResult:
+        future = self._answers[ticket.user_id]
+        if not future.done() or future.cancelled() or future.result() is None:
+            return PlayerResult(ticket, False, 0, 0.0, max(1, round(self.round.time_limit)), self.round.time_limit)
+        answer, elapsed = future.result()
+        if elapsed > self.round.time_limit + self.grace:
+            return PlayerResult(ticket, False, 0, 0.0, max(1, round(elapsed)), elapsed)
+        score, accuracy, time_taken = self.round.score(answer, elapsed)
+        return PlayerResult(ticket, True, score, accuracy, time_taken, elapsed)
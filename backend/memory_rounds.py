@@ -0,0 +1,333 @@
+"""Server-side state and scoring for memory challenge rounds.
+
+The server issues each round: it picks the sequence, remembers it together
+with the issue time, and scores the recall the client sends back, so the
+score written to game_scores never comes from the client. The sequence
+still has to be shown to the player, so this stops forged scores and
+impossible timings, not a bot that reads the sequence off the wire.
+
+With several workers, open rounds live in ``SQLiteRoundStore``, a table
+every worker reads, so a round can be submitted to any worker. A single
+process can keep them in ``RoundStore`` instead (through
+``LocalRoundStore``): a fixed-capacity set of flat arrays, with no Python
+objects per round. Both stores take a round out with ``take`` only once it
+has been scored, so a recall rejected as implausible leaves it open.
+"""
+import random
+import secrets
+import time
+from array import array
+from typing import List, NamedTuple, Optional, Sequence
+
+import aiosqlite
+
+MAX_DIFFICULTY = 10
+MAX_SEQUENCE_LENGTH = 4 + 2 * MAX_DIFFICULTY
+
+# Client timing (GameMemory.js): a 1 s lead-in, each item lit for 800 ms plus a
+# 200 ms gap, then len * 3 + 5 seconds on the countdown to answer
+SHOW_LEAD_SECONDS = 1.0
+SHOW_SECONDS_PER_ITEM = 1.0
+ANSWER_BASE_SECONDS = 5
+ANSWER_SECONDS_PER_ITEM = 3
+MIN_SECONDS_PER_KEY = 0.15  # faster than this is a script, not a memory
+LATE_GRACE_SECONDS = 2.0    # network time on top of the client's countdown
+
+
+def sequence_length(difficulty: int) -> int:
+    return 4 + 2 * difficulty
+
+
+def new_sequence(difficulty: int, rng: random.Random = random) -> List[int]:
+    return [rng.randint(1, 9) for _ in range(sequence_length(difficulty))]
+
+
+def show_seconds(length: int) -> float:
+    return SHOW_LEAD_SECONDS + length * SHOW_SECONDS_PER_ITEM
+
+
+def answer_seconds(length: int) -> int:
+    return ANSWER_BASE_SECONDS + length * ANSWER_SECONDS_PER_ITEM
+
+
+class MemoryRound(NamedTuple):
+    sequence: bytes
+    difficulty: int
+    issued_at: float
+
+
+class RoundResult(NamedTuple):
+    correct: int        # leading items recalled correctly
+    completed: bool
+    timed_out: bool
+    score: int
+    accuracy: float
+    time_taken: int     # seconds from issue to submission
+
+
+class ImplausibleRecall(ValueError):
+    """Recall arrived before the sequence could even have been shown and typed."""
+
+
+def score_recall(memory_round: MemoryRound, recall: Sequence[int], elapsed: float) -> RoundResult:
+    """Score a recall ``elapsed`` seconds after the round was issued.
+
+    Like the client, a round ends at the first wrong item. A completed round
+    scores 200, plus 10 per second left on the countdown, 50 per difficulty
+    level and 100 for getting it right first time (every round is a single
+    attempt). Incomplete or late rounds score 0.
+    """
+    sequence = memory_round.sequence
+    length = len(sequence)
+    if elapsed < show_seconds(length) + len(recall) * MIN_SECONDS_PER_KEY:
+        raise ImplausibleRecall(f"{len(recall)} items recalled {elapsed:.2f}s after issue")
+
+    correct = 0
+    for expected, given in zip(sequence, recall):
+        if expected != given:
+            break
+        correct += 1
+    time_left = answer_seconds(length) - (elapsed - show_seconds(length))
+    timed_out = time_left < -LATE_GRACE_SECONDS
+    completed = correct == length and not timed_out
+    score = 0
+    if completed:
+        score = 200 + max(0, int(time_left)) * 10 + memory_round.difficulty * 50 + 100
+    return RoundResult(correct, completed, timed_out, score, round(correct / length * 100, 1),
+                       max(1, round(elapsed)))
+
+
+class RoundStoreFull(Exception):
+    """Every slot holds a round that has not expired yet."""
+
+
+class RoundStore:
+    """Open rounds in fixed-size flat arrays, one slot per round.
+
+    A round id is ``<slot>-<token>`` in hex: the slot indexes every array
+    directly and the random 64-bit token, stored alongside, makes ids
+    unguessable and stale ids harmless once the slot is reused. Owners are
+    kept as the hash of the user id. A slot costs ``max_length`` sequence
+    bytes plus 30 bytes of fields.
+
+    The TTL is the same for every round, so issue order is expiry order: an
+    append-only queue of (slot, issued_at) is popped from the front as rounds
+    expire, reclaiming slots without scanning the store.
+    """
+
+    MAX_ID_LENGTH = 32
+
+    def __init__(self, capacity: int = 100000, ttl: float = 300.0, max_length: int = MAX_SEQUENCE_LENGTH):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.max_length = max_length
+        self._sequences = bytearray(capacity * max_length)
+        self._lengths = bytearray(capacity)
+        self._difficulty = bytearray(capacity)
+        self._tokens = array('Q', bytes(8 * capacity))  # 0 marks a free slot
+        self._owners = array('q', bytes(8 * capacity))
+        self._issued_at = array('d', bytes(8 * capacity))
+        self._free = array('I', range(capacity - 1, -1, -1))
+        self._queue_slots = array('I')
+        self._queue_issued = array('d')
+        self._head = 0
+        self.active = 0
+
+    def issue(self, owner: str, sequence: Sequence[int], difficulty: int, now: Optional[float] = None) -> str:
+        if len(sequence) > self.max_length:
+            raise ValueError(f"sequence longer than {self.max_length}")
+        if now is None:
+            now = time.monotonic()
+        self._expire(now)
+        if not self._free:
+            raise RoundStoreFull()
+
+        slot = self._free.pop()
+        token = secrets.randbits(64) or 1
+        base = slot * self.max_length
+        self._sequences[base:base + len(sequence)] = bytes(sequence)
+        self._lengths[slot] = len(sequence)
+        self._difficulty[slot] = difficulty
+        self._tokens[slot] = token
+        self._owners[slot] = hash(owner)
+        self._issued_at[slot] = now
+        self._queue_slots.append(slot)
+        self._queue_issued.append(now)
+        self.active += 1
+        return f"{slot:x}-{token:016x}"
+
+    def peek(self, round_id: str, owner: str, now: Optional[float] = None) -> Optional[MemoryRound]:
+        """``owner``'s round, left open, or None if unknown, expired or not theirs."""
+        slot = self._find(round_id, owner, now)
+        if slot is None:
+            return None
+        base = slot * self.max_length
+        return MemoryRound(bytes(self._sequences[base:base + self._lengths[slot]]),
+                           self._difficulty[slot], self._issued_at[slot])
+
+    def take(self, round_id: str, owner: str, now: Optional[float] = None) -> Optional[MemoryRound]:
+        """Remove and return ``owner``'s round, or None if unknown, expired or not theirs."""
+        memory_round = self.peek(round_id, owner, now)
+        if memory_round is not None:
+            self._release(self._parse(round_id)[0])
+        return memory_round
+
+    def _find(self, round_id: str, owner: str, now: Optional[float]) -> Optional[int]:
+        slot, token = self._parse(round_id)
+        if slot is None or slot >= self.capacity or self._tokens[slot] != token \
+                or self._owners[slot] != hash(owner):
+            return None
+        if now is None:
+            now = time.monotonic()
+        if now - self._issued_at[slot] >= self.ttl:
+            self._release(slot)
+            return None
+        return slot
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self._tokens, self._owners, self._issued_at, self._free, self._queue_slots, self._queue_issued)
+        return (len(self._sequences) + len(self._lengths) + len(self._difficulty)
+                + sum(len(a) * a.itemsize for a in arrays))
+
+    def __len__(self):
+        return self.active
+
+    def _parse(self, round_id: str):
+        if len(round_id) > self.MAX_ID_LENGTH:
+            return None, None
+        slot, _, token = round_id.partition('-')
+        try:
+            return int(slot, 16), int(token, 16)
+        except ValueError:
+            return None, None
+
+    def _release(self, slot: int):
+        self._tokens[slot] = 0
+        self._free.append(slot)
+        self.active -= 1
+
+    def _expire(self, now: float):
+        slots, issued = self._queue_slots, self._queue_issued
+        head, cutoff = self._head, now - self.ttl
+        while head < len(issued) and issued[head] <= cutoff:
+            slot = slots[head]
+            # Skip entries whose round was already taken (the slot may hold a newer round)
+            if self._tokens[slot] and self._issued_at[slot] == issued[head]:
+                self._release(slot)
+            head += 1
+        if head > 1024 and head * 2 > len(issued):
+            del slots[:head]
+            del issued[:head]
+            head = 0
+        self._head = head
+
+
+class LocalRoundStore:
+    """One process's ``RoundStore``, with the same async interface as ``SQLiteRoundStore``."""
+
+    clock = staticmethod(time.monotonic)  # the clock of MemoryRound.issued_at
+
+    def __init__(self, store: RoundStore):
+        self.store = store
+
+    @property
+    def active(self) -> int:
+        return self.store.active
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def issue(self, owner: str, sequence: Sequence[int], difficulty: int) -> str:
+        return self.store.issue(owner, sequence, difficulty)
+
+    async def peek(self, round_id: str, owner: str) -> Optional[MemoryRound]:
+        return self.store.peek(round_id, owner)
+
+    async def take(self, round_id: str, owner: str) -> Optional[MemoryRound]:
+        return self.store.take(round_id, owner)
+
+
+class SQLiteRoundStore:
+    """Open rounds in one SQLite table shared by all workers.
+
+    ``take`` is a single DELETE ... RETURNING, so of two submissions of a
+    round, on any workers, exactly one gets it. Times are epoch seconds, the
+    clock workers share. Expired rows are deleted at most every
+    ``prune_interval`` seconds, on issue; ``active`` is the count as of then.
+    """
+
+    clock = staticmethod(time.time)
+
+    def __init__(self, path, ttl: float = 300.0, prune_interval: float = 60.0,
+                 max_length: int = MAX_SEQUENCE_LENGTH):
+        self.path = path
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self.max_length = max_length
+        self.active = 0
+        self._db: Optional[aiosqlite.Connection] = None
+        self._next_prune = 0.0
+
+    async def start(self):
+        # Autocommit: every statement below is its own transaction
+        self._db = await aiosqlite.connect(self.path, isolation_level=None)
+        await self._db.execute('PRAGMA journal_mode=WAL')
+        await self._db.execute('PRAGMA synchronous=NORMAL')
+        await self._db.execute('PRAGMA busy_timeout=1000')
+        await self._db.execute('''
+            CREATE TABLE IF NOT EXISTS memory_rounds (
+                id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                sequence BLOB NOT NULL,
+                difficulty INTEGER NOT NULL,
+                issued_at REAL NOT NULL
+            )
+        ''')
+        await self._db.execute('CREATE INDEX IF NOT EXISTS memory_rounds_issued_at ON memory_rounds (issued_at)')
+        await self._prune(self.clock())
+
+    async def stop(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def issue(self, owner: str, sequence: Sequence[int], difficulty: int) -> str:
+        if len(sequence) > self.max_length:
+            raise ValueError(f"sequence longer than {self.max_length}")
+        now = self.clock()
+        if now >= self._next_prune:
+            await self._prune(now)
+        round_id = secrets.token_hex(12)
+        await self._db.execute('INSERT INTO memory_rounds VALUES (?, ?, ?, ?, ?)',
+                               (round_id, owner, bytes(sequence), difficulty, now))
+        self.active += 1
+        return round_id
+
+    async def peek(self, round_id: str, owner: str) -> Optional[MemoryRound]:
+        """``owner``'s round, left open, or None if unknown, expired or not theirs."""
+        async with self._db.execute(
+            'SELECT sequence, difficulty, issued_at FROM memory_rounds WHERE id = ? AND owner = ? AND issued_at > ?',
+            (round_id, owner, self.clock() - self.ttl)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return MemoryRound(*row) if row else None
+
+    async def take(self, round_id: str, owner: str) -> Optional[MemoryRound]:
+        """Remove and return ``owner``'s round, or None if unknown, expired, not theirs or already taken."""
+        async with self._db.execute(
+            'DELETE FROM memory_rounds WHERE id = ? AND owner = ? AND issued_at > ? '
+            'RETURNING sequence, difficulty, issued_at',
+            (round_id, owner, self.clock() - self.ttl)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return MemoryRound(*row) if row else None
+
+    async def _prune(self, now: float):
+        self._next_prune = now + self.prune_interval
+        await self._db.execute('DELETE FROM memory_rounds WHERE issued_at <= ?', (now - self.ttl,))
+        async with self._db.execute('SELECT COUNT(*) FROM memory_rounds') as cursor:
+            self.active = (await cursor.fetchone())[0]
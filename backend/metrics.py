@@ -0,0 +1,293 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain dicts keyed by label values and
+are only updated from the event loop thread, so recording a sample is a dict
+lookup and an add with no locking. Histogram buckets are fixed up front and
+an observation is a single bisect. Values that already live elsewhere (cache
+hit counts, executor queue depth) are read through callbacks at scrape time
+instead of being mirrored on every update.
+"""
+import asyncio
+import inspect
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from profiling import add_phase
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 fn: Optional[Callable] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.fn = fn
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def samples(self):
+        if self.fn is None:
+            return self.values.items()
+        value = self.fn()
+        return value.items() if isinstance(value, dict) else [((), value)]
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for label_values, value in self.samples():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, *label_values):
+        self.values[label_values] = value
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) - amount
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; each series is ``[count per bucket..., +Inf count, sum]``."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(series[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=(), fn=None) -> Counter:
+        return self._register(Counter(name, documentation, labels, fn))
+
+    def gauge(self, name, documentation, labels=(), fn=None) -> Gauge:
+        return self._register(Gauge(name, documentation, labels, fn))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and status codes, and in-flight requests.
+
+    Requests are labelled with the matched route template (``/api/leaderboard``)
+    rather than the raw path, so path parameters and 404 probes cannot blow
+    up the number of series. Requests that never reach a route (404s,
+    rate-limited requests) are labelled ``unmatched``.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry, exclude: Sequence[str] = ('/metrics',),
+                 enabled: bool = True):
+        self.app = app
+        self.exclude = frozenset(exclude)
+        self.enabled = enabled
+        # One histogram per (method, route, status): its _count series doubles as the request counter
+        self.latency = registry.histogram('http_request_duration_seconds', "HTTP request latency by route and status",
+                                          ('method', 'route', 'status'))
+        self.in_flight = 0
+        registry.gauge('http_requests_in_flight', "HTTP requests being served", fn=lambda: self.in_flight)
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope['type'] != 'http' or scope['path'] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        self.in_flight += 1
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - start
+            self.in_flight -= 1
+            route = scope.get('route')
+            # Histogram.observe inlined: this runs on every request
+            key = (scope['method'], route.path if route is not None else 'unmatched', status)
+            series = self.latency.series.get(key)
+            if series is None:
+                series = self.latency.series[key] = [0] * (len(self.latency.buckets) + 2)
+            series[bisect_left(self.latency.buckets, elapsed)] += 1
+            series[-1] += elapsed
+
+
+class InstrumentedRepository:
+    """Wrap a StorageRepository, timing every query method and counting rows.
+
+    Attributes (``name``, ``path``, ...) and lifecycle methods pass straight
+    through; async query methods are wrapped on first access.
+    """
+
+    UNTIMED = frozenset({'start', 'stop', 'connect'})
+
+    def __init__(self, repository, registry: MetricsRegistry):
+        self._repository = repository
+        self._seconds = registry.histogram('db_query_duration_seconds', "Storage query latency",
+                                           ('backend', 'operation'), buckets=DB_BUCKETS)
+        self._rows = registry.counter('db_rows_total', "Rows returned or written by storage queries",
+                                      ('backend', 'operation'))
+        self._errors = registry.counter('db_errors_total', "Storage queries that raised",
+                                        ('backend', 'operation'))
+
+    def __getattr__(self, name):
+        attr = getattr(self._repository, name)
+        if name.startswith('_') or name in self.UNTIMED or not inspect.iscoroutinefunction(attr):
+            return attr
+        timed = self._timed(name, attr)
+        setattr(self, name, timed)
+        return timed
+
+    def _timed(self, operation: str, method):
+        backend = self._repository.name
+        seconds, rows, errors = self._seconds, self._rows, self._errors
+
+        async def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                result = await method(*args, **kwargs)
+            except Exception:
+                errors.inc(backend, operation)
+                raise
+            finally:
+                elapsed = perf_counter() - start
+                seconds.observe(elapsed, backend, operation)
+                add_phase('db', elapsed)
+            rows.inc(backend, operation, amount=_row_count(operation, args, result))
+            return result
+
+        return timed
+
+
+def _row_count(operation: str, args, result) -> int:
+    if operation == 'record_scores':
+        return len(args[0])
+    if operation == 'record_score':
+        return 1
+    if isinstance(result, list):
+        return len(result)
+    # None / False for a miss; a record, a (record, hash) pair or True for a hit
+    return 0 if result is None or result is False else 1
+
+
+def _timed_call(fn, args):
+    return perf_counter(), fn(*args)
+
+
+class InstrumentedExecutor:
+    """Thread pool for blocking calls (bcrypt) with queue depth and wait/run timings.
+
+    ``in_flight`` is only touched on the event loop thread; anything beyond
+    ``max_workers`` in flight is waiting in the pool's queue.
+    """
+
+    def __init__(self, name: str, max_workers: int, registry: MetricsRegistry):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.in_flight = 0
+        registry.gauge(f"{name}_executor_queue_depth", f"{name} calls waiting for a worker thread",
+                       fn=lambda: max(0, self.in_flight - self.max_workers))
+        registry.gauge(f"{name}_executor_in_flight", f"{name} calls queued or running",
+                       fn=lambda: self.in_flight)
+        self.wait = registry.histogram(f"{name}_executor_wait_seconds",
+                                       f"Time {name} calls spent queued before running")
+        self.run_time = registry.histogram(f"{name}_executor_run_seconds", f"{name} call duration")
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        submitted = perf_counter()
+        self.in_flight += 1
+        try:
+            started, result = await loop.run_in_executor(self.executor, _timed_call, fn, args)
+        finally:
+            self.in_flight -= 1
+        finished = perf_counter()
+        self.wait.observe(started - submitted)
+        self.run_time.observe(finished - started)
+        add_phase(f"{self.name}_wait", started - submitted)
+        add_phase(self.name, finished - started)
+        return result
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,121 @@
+"""Migrate a SQLite database from the standard layout to the partitioned one.
+
+The partitioned layout (``storage.PartitionedSQLiteRepository``) keeps the
+standard tables but splits game_scores into one table per UTC month, so
+windowed leaderboards and recent history read only the months they cover,
+and retention archives a month by dropping its table. Scores keep their
+rowids, so the analytics snapshot's watermark stays valid.
+
+The migration runs in one transaction; stop the API first, then start it
+with SQLITE_SCHEMA=partitioned. The file only shrinks after the VACUUM at
+the end (skip it with --no-vacuum and run it later). ``--list`` shows a
+partitioned file's months with their scores and sizes.
+
+Usage:
+    python partitions.py --db cognitive_arena.db
+    python partitions.py --db cognitive_arena.db --list
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from storage import PartitionedSQLiteRepository, ScorePartition, SQLiteRepository, score_partitions
+
+
+def migrate(db_path, vacuum: bool = True, progress=None) -> int:
+    """Convert ``db_path`` in place; returns the number of scores moved."""
+    # Bring the file to the latest standard schema first (this refuses other layouts)
+    asyncio.run(SQLiteRepository(db_path).start())
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute('PRAGMA cache_size=-262144')
+        say = progress or (lambda message: None)
+        columns = SQLiteRepository.SCORE_COLUMNS
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Through the covering timestamp index
+            months = [row[0] for row in conn.execute('SELECT DISTINCT substr(timestamp, 1, 7) FROM game_scores')]
+            partitions = {ScorePartition.for_month(datetime.strptime(month, '%Y-%m').replace(tzinfo=timezone.utc))
+                          for month in months}
+            partitions.update(PartitionedSQLiteRepository._months_ahead())
+            conn.execute('ALTER TABLE game_scores RENAME TO standard_game_scores')
+            moved = 0
+            for partition in sorted(partitions):
+                say(partition.table)
+                conn.execute(SQLiteRepository.SCORE_TABLE.format(table=partition.table))
+                # Timestamps are stored as UTC ISO-8601 text, so the bounds compare as text
+                moved += conn.execute(f'''
+                    INSERT INTO {partition.table} (rowid, {columns})
+                    SELECT rowid, {columns} FROM standard_game_scores
+                    WHERE timestamp >= ? AND timestamp < ?
+                    ORDER BY rowid
+                ''', (partition.start.isoformat(), partition.end.isoformat())).rowcount
+            total = conn.execute('SELECT COUNT(*) FROM standard_game_scores').fetchone()[0]
+            if moved != total:
+                raise RuntimeError(f"{total - moved} scores have timestamps that are not UTC ISO-8601")
+            conn.execute('DROP TABLE standard_game_scores')
+            say("indexes")
+            for partition in partitions:
+                for statement in SQLiteRepository.SCORE_INDEXES:
+                    conn.execute(statement.format(table=partition.table))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        if vacuum:
+            say("vacuum")
+            conn.execute('VACUUM')
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    return moved
+
+
+def describe(db_path):
+    """(partition, scores, bytes with its indexes) for each month, oldest first."""
+    conn = sqlite3.connect(f"file:{Path(db_path).as_posix()}?mode=ro", uri=True)
+    try:
+        sizes = dict(conn.execute('''
+            SELECT m.tbl_name, SUM(d.pgsize) FROM dbstat d
+            JOIN sqlite_master m ON m.name = d.name
+            GROUP BY m.tbl_name
+        '''))
+        return [(partition, conn.execute(f'SELECT COUNT(*) FROM {partition.table}').fetchone()[0],
+                 sizes.get(partition.table, 0)) for partition in score_partitions(conn)]
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=Path(__file__).parent / os.environ.get('DB_NAME', 'cognitive_arena.db'))
+    parser.add_argument('--no-vacuum', action='store_true', help="leave the freed pages in the file")
+    parser.add_argument('--list', action='store_true', help="show the partitions instead of migrating")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        partitions = describe(args.db)
+        if not partitions:
+            print(f"{args.db} is not partitioned")
+            return 1
+        for partition, scores, size in partitions:
+            print(f"{partition.table}  {partition.start:%Y-%m}  {scores:>10} scores  {size / 2 ** 20:8.1f} MiB")
+        return 0
+
+    before = Path(args.db).stat().st_size
+    started = time.perf_counter()
+    moved = migrate(args.db, vacuum=not args.no_vacuum, progress=lambda step: print(f"  {step}", file=sys.stderr))
+    after = Path(args.db).stat().st_size
+    print(f"Migrated {moved} scores in {time.perf_counter() - started:.1f}s: "
+          f"{before / 2 ** 20:.1f} MiB -> {after / 2 ** 20:.1f} MiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
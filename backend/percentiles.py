@@ -0,0 +1,297 @@
+"""Score percentiles ("you beat X% of players") from streaming quantile sketches.
+
+Each game_type keeps a KLL sketch (Karnin, Lang and Liberty, 2016) of its
+accepted scores. A sketch holds a few hundred items however many scores it
+has seen, and ranking a score against it costs the same with ten scores or
+ten million. With the default ``k`` the rank error stays under 1% of the
+count, i.e. under 1 percentage point on the percentile (checked by
+tests/test_percentiles.py, and on seeded game scores by
+``python bench.py percentiles``).
+
+KLL sketches are mergeable. Each worker adds new scores to a local pending
+sketch. ``SQLitePercentileStore.checkpoint`` merges pending into the
+shared copy in a SQLite table and reloads the result; the API runs it as a
+scheduler job (and once more at shutdown), so every worker sees everyone's
+scores after one checkpoint interval. The shared table is built
+once from game_scores when it is empty. Delete the file to rebuild it, for
+example after ``anticheat.py --apply`` has flagged old scores.
+"""
+import asyncio
+import math
+import random
+import sqlite3
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, Optional
+
+import aiosqlite
+import orjson
+
+from storage import attach_standard_views
+
+
+class KLLSketch:
+    """KLL quantile sketch over numbers, with lazy compaction.
+
+    Level ``h`` holds items of weight ``2**h``. When the sketch is full, the
+    lowest level over its capacity is sorted and every other item (from a
+    random offset) moves up a level with double weight. Capacities shrink by
+    a factor 2/3 going down from the top level (to no less than
+    ``MIN_CAPACITY``), so about ``3 * k`` items are retained in total.
+
+    Levels above 0 are kept sorted, so ``rank`` is one binary search per
+    level plus a scan of level 0, whatever the number of items seen.
+    """
+
+    MIN_CAPACITY = 8
+
+    def __init__(self, k: int = 200, rng: Optional[random.Random] = None):
+        self.k = k
+        self.n = 0
+        self.levels = [[]]
+        self._rng = rng or random.Random()
+        self._max_size = self._capacity(0)
+        self._size = 0
+
+    def _capacity(self, level: int) -> int:
+        return max(self.MIN_CAPACITY, int(math.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1))))
+
+    def update(self, value: float):
+        self.levels[0].append(value)
+        self.n += 1
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def merge(self, other: 'KLLSketch'):
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+            if level:
+                self.levels[level].sort()
+        self.n += other.n
+        self._size = sum(map(len, self.levels))
+        while self._size >= self._max_size:
+            self._compress()
+
+    def rank(self, value: float) -> int:
+        """Estimated number of items strictly below ``value``."""
+        below = sum(1 for item in self.levels[0] if item < value)
+        for level in range(1, len(self.levels)):
+            below += bisect_left(self.levels[level], value) << level
+        return below
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def retained(self) -> int:
+        return self._size
+
+    def to_bytes(self) -> bytes:
+        return orjson.dumps({'k': self.k, 'n': self.n, 'levels': self.levels})
+
+    @classmethod
+    def from_bytes(cls, data: bytes, rng: Optional[random.Random] = None) -> 'KLLSketch':
+        state = orjson.loads(data)
+        sketch = cls(state['k'], rng)
+        sketch.levels, sketch.n = state['levels'], state['n']
+        sketch._max_size = sum(sketch._capacity(level) for level in range(len(sketch.levels)))
+        sketch._size = sum(map(len, sketch.levels))
+        return sketch
+
+    def _grow(self):
+        self.levels.append([])
+        self._max_size = sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def _compress(self):
+        for level in range(len(self.levels)):
+            items = self.levels[level]
+            if len(items) < self._capacity(level):
+                continue
+            if level + 1 == len(self.levels):
+                self._grow()
+            items.sort()
+            # With an odd count the smallest item stays behind at this weight
+            keep = items[:len(items) % 2]
+            above = self.levels[level + 1]
+            above.extend(items[len(keep) + self._rng.getrandbits(1)::2])
+            above.sort()  # two sorted runs: a linear merge
+            self.levels[level] = keep
+            self._size = sum(map(len, self.levels))
+            if self._size < self._max_size:
+                break
+
+
+class ScorePercentiles:
+    """Per-process percentiles: every score added here, nothing shared."""
+
+    def __init__(self, k: int = 200):
+        self.k = k
+        self._base: Dict[str, KLLSketch] = {}      # last checkpoint
+        self._flushing: Dict[str, KLLSketch] = {}  # being written by a checkpoint
+        self._pending: Dict[str, KLLSketch] = {}   # added since
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def checkpoint(self):
+        pass
+
+    def add(self, game_type: str, score: float):
+        sketch = self._pending.get(game_type)
+        if sketch is None:
+            sketch = self._pending[game_type] = KLLSketch(self.k)
+        sketch.update(score)
+
+    def percentile(self, game_type: str, score: float) -> Optional[float]:
+        """Percentage of recorded ``game_type`` scores below ``score``, or None before the first."""
+        below = total = 0
+        for sketches in (self._base, self._flushing, self._pending):
+            sketch = sketches.get(game_type)
+            if sketch is not None:
+                below += sketch.rank(score)
+                total += sketch.n
+        if not total:
+            return None
+        return round(100 * below / total, 1)
+
+    def counts(self) -> Dict[str, int]:
+        totals: Dict[str, int] = {}
+        for sketches in (self._base, self._flushing, self._pending):
+            for game_type, sketch in sketches.items():
+                totals[game_type] = totals.get(game_type, 0) + sketch.n
+        return totals
+
+    def retained(self) -> Dict[str, int]:
+        """Items held per game_type, the memory actually used."""
+        totals: Dict[str, int] = {}
+        for sketches in (self._base, self._flushing, self._pending):
+            for game_type, sketch in sketches.items():
+                totals[game_type] = totals.get(game_type, 0) + sketch.retained
+        return totals
+
+
+def _sketch_scores(rows: Iterable, k: int) -> Dict[str, KLLSketch]:
+    sketches: Dict[str, KLLSketch] = {}
+    for game_type, score in rows:
+        sketch = sketches.get(game_type)
+        if sketch is None:
+            sketch = sketches[game_type] = KLLSketch(k)
+        sketch.update(score)
+    return sketches
+
+
+def sketch_game_scores(db_path, k: int = 200) -> Dict[str, KLLSketch]:
+    """One pass over the unflagged scores in a SQLite game_scores table."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        attach_standard_views(conn)
+        return _sketch_scores(conn.execute('SELECT game_type, score FROM game_scores WHERE flag IS NULL'), k)
+    finally:
+        conn.close()
+
+
+class SQLitePercentileStore(ScorePercentiles):
+    """Sketches shared by all workers through one SQLite table.
+
+    A checkpoint merges this worker's pending sketches into the stored ones
+    in one write transaction and reloads them, picking up the other workers'
+    scores. ``source_path`` is the SQLite database whose game_scores fill the
+    table the first time; without it the table starts empty.
+    """
+
+    def __init__(self, path, source_path=None, k: int = 200):
+        super().__init__(k)
+        self.path = path
+        self.source_path = source_path
+        self._db: Optional[aiosqlite.Connection] = None
+
+    async def start(self):
+        # Autocommit, with explicit write transactions below
+        self._db = await aiosqlite.connect(self.path, isolation_level=None)
+        await self._db.execute('PRAGMA journal_mode=WAL')
+        await self._db.execute('PRAGMA synchronous=NORMAL')
+        await self._db.execute('PRAGMA busy_timeout=5000')
+        await self._db.execute('''
+            CREATE TABLE IF NOT EXISTS percentile_sketches (
+                game_type TEXT PRIMARY KEY,
+                sketch BLOB NOT NULL,
+                count INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        # Scanning game_scores can take seconds, so it runs outside the write lock:
+        # other workers' starts and checkpoints would wait on it. The first worker to
+        # insert fills the table; the others drop their scan and load it
+        if self.source_path is not None and await self._empty():
+            sketches = await asyncio.to_thread(sketch_game_scores, self.source_path, self.k)
+            await self._db.execute('BEGIN IMMEDIATE')
+            try:
+                if await self._empty():
+                    await self._save(sketches)
+                await self._db.execute('COMMIT')
+            except BaseException:
+                await self._db.execute('ROLLBACK')
+                raise
+        self._base = await self._load()
+
+    async def stop(self):
+        if self._db is not None:
+            try:
+                await self.checkpoint()
+            finally:
+                await self._db.close()
+                self._db = None
+
+    async def checkpoint(self):
+        """Merge pending scores into the shared sketches and reload them."""
+        flushing, self._pending = self._pending, {}
+        if not flushing:
+            self._base = await self._load()
+            return
+        self._flushing = flushing
+        try:
+            await self._db.execute('BEGIN IMMEDIATE')
+            try:
+                sketches = await self._load()
+                for game_type, sketch in flushing.items():
+                    stored = sketches.get(game_type)
+                    if stored is None:
+                        stored = sketches[game_type] = KLLSketch(self.k)
+                    stored.merge(sketch)
+                await self._save({game_type: sketches[game_type] for game_type in flushing})
+                await self._db.execute('COMMIT')
+            except BaseException:
+                await self._db.execute('ROLLBACK')
+                raise
+            self._base = sketches
+        except BaseException:
+            # Keep the scores for the next checkpoint
+            for game_type, sketch in flushing.items():
+                if game_type in self._pending:
+                    sketch.merge(self._pending[game_type])
+                self._pending[game_type] = sketch
+            raise
+        finally:
+            self._flushing = {}
+
+    async def _empty(self) -> bool:
+        async with self._db.execute('SELECT 1 FROM percentile_sketches LIMIT 1') as cursor:
+            return await cursor.fetchone() is None
+
+    async def _load(self) -> Dict[str, KLLSketch]:
+        async with self._db.execute('SELECT game_type, sketch FROM percentile_sketches') as cursor:
+            return {game_type: KLLSketch.from_bytes(sketch) async for game_type, sketch in cursor}
+
+    async def _save(self, sketches: Dict[str, KLLSketch]):
+        now = time.time()
+        await self._db.executemany('''
+            INSERT INTO percentile_sketches (game_type, sketch, count, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (game_type) DO UPDATE SET
+                sketch = excluded.sketch, count = excluded.count, updated_at = excluded.updated_at
+        ''', [(game_type, sketch.to_bytes(), sketch.n, now) for game_type, sketch in sketches.items()])
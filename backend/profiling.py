@@ -0,0 +1,299 @@
+"""On-demand profiling and slow-request capture.
+
+* Every request carries a ``RequestTrace`` in a context variable. Instrumented
+  code adds wall time to named phases: ``auth`` (the user dependency), ``db``
+  (storage queries), ``bcrypt``/``bcrypt_wait`` (password thread pool),
+  ``handler`` (the endpoint body) and ``serialize`` (endpoint return to
+  response start). Phases nest; db time is also part of auth or handler.
+* Requests slower than a threshold are kept in a bounded ring buffer with
+  their breakdown and the await chain they were stuck in when they crossed
+  the threshold. A timer that fires late means the event loop itself was
+  blocked; how late is recorded as ``loop_lag_ms``.
+* An admin can send ``X-Profile: 1`` to run a request under cProfile; the
+  report is kept in a small ring buffer under the returned ``X-Profile-Id``.
+* ``StackSampler`` samples thread stacks for N seconds and returns
+  collapsed stacks (input for flamegraph.pl or speedscope).
+"""
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import wraps
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional
+
+import jwt
+from fastapi.routing import APIRoute
+
+
+class RequestTrace:
+    __slots__ = ('phases', 'counts', 'handler_done', 'stack', 'loop_lag')
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.handler_done: Optional[float] = None
+        self.stack: Optional[List[str]] = None
+        self.loop_lag: Optional[float] = None
+
+    def add(self, phase: str, seconds: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar('current_trace', default=None)
+
+
+def add_phase(phase: str, seconds: float):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(phase, seconds)
+
+
+def traced(phase: str):
+    """Decorator adding an async function's run time to the current request's ``phase``."""
+    def decorate(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                add_phase(phase, perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def _mark_handler_done(start: float):
+    trace = current_trace.get()
+    if trace is not None:
+        now = perf_counter()
+        trace.add('handler', now - start)
+        trace.handler_done = now
+
+
+class TracedRoute(APIRoute):
+    """APIRoute that times the endpoint body apart from dependencies and serialization."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, self._traced_endpoint(endpoint), **kwargs)
+
+    @staticmethod
+    def _traced_endpoint(endpoint):
+        if asyncio.iscoroutinefunction(endpoint):
+            @wraps(endpoint)
+            async def traced_endpoint(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    _mark_handler_done(start)
+        else:
+            @wraps(endpoint)
+            def traced_endpoint(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return endpoint(*args, **kwargs)
+                finally:
+                    _mark_handler_done(start)
+        return traced_endpoint
+
+
+def _frame_label(code, lineno: int) -> str:
+    return f"{code.co_name} ({Path(code.co_filename).name}:{lineno})"
+
+
+def await_chain(task: asyncio.Task) -> List[str]:
+    """Frames of a suspended task, outermost first, following each ``await``.
+
+    ``Task.get_stack`` only returns the outermost frame of a suspended
+    coroutine, which for a request is always the server's handler.
+    """
+    frames = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None)
+        if frame is None:
+            # A future or other frameless awaitable (executor job, aiosqlite query, ...)
+            frames.append(f"<awaiting {type(coro).__name__}>")
+            break
+        frames.append(_frame_label(frame.f_code, frame.f_lineno))
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None)
+    return frames
+
+
+class SlowRequestLog:
+    """Ring buffer of requests that took longer than ``threshold`` seconds."""
+
+    def __init__(self, threshold: float, size: int = 100):
+        self.threshold = threshold
+        self.entries = deque(maxlen=size)
+
+    def capture_stack(self, trace: RequestTrace, task: asyncio.Task, due: float):
+        trace.loop_lag = max(0.0, perf_counter() - due)
+        trace.stack = await_chain(task)
+
+    def record(self, scope, status: int, duration: float, trace: RequestTrace):
+        route = scope.get('route')
+        self.entries.append({
+            "id": uuid.uuid4().hex[:12],
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "method": scope['method'],
+            "path": scope['path'],
+            "route": route.path if route is not None else None,
+            "status": status,
+            "duration_ms": round(duration * 1000, 2),
+            "phases_ms": {name: round(seconds * 1000, 2) for name, seconds in trace.phases.items()},
+            "phase_counts": dict(trace.counts),
+            "loop_lag_ms": round(trace.loop_lag * 1000, 2) if trace.loop_lag is not None else None,
+            "stack": trace.stack,
+        })
+
+    def recent(self, limit: int = 50) -> List[dict]:
+        return list(reversed(self.entries))[:limit]
+
+
+class ProfileStore:
+    """The last few per-request cProfile reports, by id."""
+
+    def __init__(self, size: int = 20, top: int = 60):
+        self.top = top
+        self._reports = deque(maxlen=size)
+
+    def add(self, profile_id: str, profiler: cProfile.Profile, scope, duration: float):
+        out = io.StringIO()
+        out.write(f"{scope['method']} {scope['path']} {duration * 1000:.2f} ms (pid {os.getpid()})\n")
+        out.write("Note: cProfile sees every coroutine the event loop ran meanwhile, not just this request.\n\n")
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(self.top)
+        self._reports.append((profile_id, out.getvalue()))
+
+    def get(self, profile_id: str) -> Optional[str]:
+        for stored_id, report in self._reports:
+            if stored_id == profile_id:
+                return report
+        return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware attaching a RequestTrace to every request.
+
+    Records slow requests into ``slow_log`` and runs cProfile for requests
+    carrying ``X-Profile: 1`` with an admin bearer token (checked from the
+    JWT alone, like the rate limiter).
+    """
+
+    def __init__(self, app, slow_log: SlowRequestLog, profiles: ProfileStore, jwt_secret: str,
+                 jwt_algorithms: Iterable[str] = ('HS256',), admin_usernames: Iterable[str] = ()):
+        self.app = app
+        self.slow_log = slow_log
+        self.profiles = profiles
+        self.jwt_secret = jwt_secret
+        self.jwt_algorithms = list(jwt_algorithms)
+        self.admin_usernames = set(admin_usernames)
+        self._profiling = False  # cProfile can only profile one request at a time
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = current_trace.set(trace)
+        profile_id = None
+        if not self._profiling and self._profile_requested(scope):
+            profile_id = uuid.uuid4().hex[:12]
+        status = 500
+
+        async def send_traced(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                if trace.handler_done is not None:
+                    trace.add('serialize', perf_counter() - trace.handler_done)
+                if profile_id is not None:
+                    message['headers'] = list(message.get('headers', [])) + [
+                        (b'x-profile-id', profile_id.encode())]
+            await send(message)
+
+        loop = asyncio.get_running_loop()
+        start = perf_counter()
+        due = start + self.slow_log.threshold
+        timer = loop.call_later(self.slow_log.threshold, self.slow_log.capture_stack,
+                                trace, asyncio.current_task(), due)
+        profiler = None
+        if profile_id is not None:
+            self._profiling = True
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            duration = perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                self.profiles.add(profile_id, profiler, scope, duration)
+            timer.cancel()
+            current_trace.reset(token)
+            if duration >= self.slow_log.threshold:
+                self.slow_log.record(scope, status, duration, trace)
+
+    def _profile_requested(self, scope) -> bool:
+        requested, token = False, None
+        for name, value in scope['headers']:
+            if name == b'x-profile':
+                requested = value in (b'1', b'true')
+            elif name == b'authorization':
+                scheme, _, token = value.decode('latin-1').partition(' ')
+                if scheme.lower() != 'bearer':
+                    token = None
+        if not requested or not token:
+            return False
+        try:
+            payload = jwt.decode(token, self.jwt_secret, algorithms=self.jwt_algorithms)
+        except jwt.PyJWTError:
+            return False
+        return payload.get('username') in self.admin_usernames
+
+
+class StackSampler:
+    """Wall-clock sampling profiler over ``sys._current_frames``.
+
+    Runs on its own thread; each tick records the stack of every watched
+    thread. Stacks are keyed root-first, ready to render as collapsed stacks.
+    """
+
+    def __init__(self, interval: float = 0.005, thread_ids: Optional[Iterable[int]] = None):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+
+    def run(self, seconds: float) -> Counter:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code, frame.f_code.co_firstlineno))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                stacks[tuple(reversed(labels))] += 1
+            time.sleep(self.interval)
+        return stacks
+
+    @staticmethod
+    def collapse(stacks: Counter) -> str:
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,270 @@
+"""Token-bucket rate limiting for the API.
+
+Policies are looked up by (method, path) and checked in an ASGI middleware,
+so over-limit requests are rejected before routing, request parsing or any
+dependency such as ``get_current_user`` touches the database.
+
+IP-scoped policies need the client's address, not the reverse proxy's.
+Give the middleware ``trusted_proxies``: a request whose peer is one of
+them is keyed by the right-most X-Forwarded-For entry that is not itself a
+trusted proxy. Entries a client wrote further left are never used, so the
+header cannot be spoofed past the proxy. uvicorn's own proxy headers must
+then trust no more than the proxies (its FORWARDED_ALLOW_IPS): with ``*``
+it puts the left-most entry, which the client writes, in the peer's place
+before this middleware sees the request.
+"""
+import ipaddress
+import json
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import aiosqlite
+import jwt
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+@dataclass(frozen=True)
+class RatePolicy:
+    name: str
+    rate: float        # tokens refilled per second
+    capacity: float    # burst size
+    scope: str = 'ip'  # 'ip' or 'user' (falls back to ip for anonymous requests)
+
+
+def parse_policy_overrides(spec: str, policies: Iterable[RatePolicy]) -> Dict[str, RatePolicy]:
+    """``policies`` by name, with the limits in ``spec`` applied.
+
+    ``spec`` is comma-separated ``name=count/seconds`` entries, optionally
+    ``:burst`` (default: ``count``), e.g. ``register=20/3600,login=30/60:10``.
+    Raises ValueError on an unknown name or a malformed entry.
+    """
+    by_name = {policy.name: policy for policy in policies}
+    for entry in (e.strip() for e in spec.split(',') if e.strip()):
+        try:
+            name, limit = entry.split('=', 1)
+            limit, _, burst = limit.partition(':')
+            count, seconds = limit.split('/', 1)
+            rate, capacity = float(count) / float(seconds), float(burst or count)
+        except ValueError:
+            raise ValueError(f"Malformed rate limit {entry!r}: expected name=count/seconds[:burst]") from None
+        name = name.strip()
+        if name not in by_name:
+            raise ValueError(f"Unknown rate limit policy {name!r}; known: {', '.join(sorted(by_name))}")
+        if rate <= 0 or capacity < 1:
+            raise ValueError(f"Rate limit {entry!r} must allow at least one request")
+        by_name[name] = replace(by_name[name], rate=rate, capacity=capacity)
+    return by_name
+
+
+def parse_networks(spec: str) -> List[Network]:
+    """Comma-separated addresses or CIDR ranges; ``*`` for any address."""
+    networks = []
+    for entry in (e.strip() for e in spec.split(',') if e.strip()):
+        if entry == '*':
+            networks += [ipaddress.ip_network('0.0.0.0/0'), ipaddress.ip_network('::/0')]
+        else:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+    return networks
+
+
+class MemoryBucketStore:
+    """Per-process token buckets; O(1) per check with periodic compaction.
+
+    A bucket is ``[tokens, updated_at, full_at]``. Buckets that have refilled
+    to capacity are indistinguishable from new ones, so compaction drops them.
+    """
+
+    def __init__(self, compact_interval: float = 60.0):
+        self.compact_interval = compact_interval
+        self._buckets: Dict[str, List[float]] = {}
+        self._next_compaction = time.monotonic() + compact_interval
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def acquire(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> float:
+        return self.take(key, rate, capacity, cost)
+
+    def take(self, key: str, rate: float, capacity: float, cost: float = 1.0,
+             now: Optional[float] = None) -> float:
+        """Spend ``cost`` tokens; return 0 if allowed, else seconds until it would be."""
+        if now is None:
+            now = time.monotonic()
+        if now >= self._next_compaction:
+            self.compact(now)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = capacity
+        else:
+            tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+
+        if tokens < cost:
+            retry_after = (cost - tokens) / rate
+        else:
+            tokens -= cost
+            retry_after = 0.0
+        self._buckets[key] = [tokens, now, now + (capacity - tokens) / rate]
+        return retry_after
+
+    def compact(self, now: Optional[float] = None):
+        if now is None:
+            now = time.monotonic()
+        self._buckets = {key: b for key, b in self._buckets.items() if b[2] > now}
+        self._next_compaction = now + self.compact_interval
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    """Token buckets shared by all workers through one SQLite table.
+
+    Each check is a single UPSERT ... RETURNING, so concurrent workers never
+    read-modify-write the same bucket across statements.
+    """
+
+    def __init__(self, path, compact_interval: float = 60.0):
+        self.path = path
+        self.compact_interval = compact_interval
+        self._db: Optional[aiosqlite.Connection] = None
+        self._next_compaction = 0.0
+
+    async def start(self):
+        self._db = await aiosqlite.connect(self.path)
+        await self._db.execute('PRAGMA journal_mode=WAL')
+        await self._db.execute('PRAGMA synchronous=OFF')
+        await self._db.execute('PRAGMA busy_timeout=1000')
+        await self._db.execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                full_at REAL NOT NULL,
+                allowed INTEGER NOT NULL
+            )
+        ''')
+        await self._db.commit()
+
+    async def stop(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def acquire(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> float:
+        now = time.time()
+        if now >= self._next_compaction:
+            self._next_compaction = now + self.compact_interval
+            await self._db.execute('DELETE FROM rate_buckets WHERE full_at <= ?', (now,))
+
+        # refilled = MIN(capacity, tokens + elapsed * rate), computed in-statement
+        refilled = 'MIN(:capacity, tokens + (:now - updated_at) * :rate)'
+        async with self._db.execute(f'''
+            INSERT INTO rate_buckets (key, tokens, updated_at, full_at, allowed)
+            VALUES (:key, :capacity - :cost, :now, :now + :cost / :rate, 1)
+            ON CONFLICT (key) DO UPDATE SET
+                allowed = {refilled} >= :cost,
+                tokens = CASE WHEN {refilled} >= :cost THEN {refilled} - :cost ELSE {refilled} END,
+                full_at = :now + (:capacity - CASE WHEN {refilled} >= :cost
+                                                   THEN {refilled} - :cost ELSE {refilled} END) / :rate,
+                updated_at = :now
+            RETURNING tokens, allowed
+        ''', {'key': key, 'capacity': capacity, 'cost': cost, 'now': now, 'rate': rate}) as cursor:
+            tokens, allowed = await cursor.fetchone()
+        await self._db.commit()
+        return 0.0 if allowed else (cost - tokens) / rate
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying per-route token-bucket policies."""
+
+    def __init__(self, app, policies: Dict[Tuple[str, str], RatePolicy], store,
+                 jwt_secret: str, jwt_algorithms: Iterable[str] = ('HS256',),
+                 default_policy: Optional[RatePolicy] = None, enabled: bool = True,
+                 trusted_proxies: Iterable[Network] = ()):
+        self.app = app
+        self.policies = policies
+        self.trusted_proxies = list(trusted_proxies)
+        self.store = store
+        self.jwt_secret = jwt_secret
+        self.jwt_algorithms = list(jwt_algorithms)
+        self.default_policy = default_policy
+        self.enabled = enabled
+        self.rejected = 0
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        policy = self.policies.get((scope['method'], scope['path']))
+        if policy is None:
+            if self.default_policy is None or not scope['path'].startswith('/api'):
+                await self.app(scope, receive, send)
+                return
+            policy = self.default_policy
+
+        key = f"{policy.name}:{self._client_key(scope, policy)}"
+        retry_after = await self.store.acquire(key, policy.rate, policy.capacity)
+        if retry_after <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        self.rejected += 1
+        body = json.dumps({"detail": "Too many requests"}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 429,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', str(max(1, int(retry_after + 0.999))).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    def _client_key(self, scope, policy: RatePolicy) -> str:
+        if policy.scope == 'user':
+            user_id = self._token_user_id(scope)
+            if user_id is not None:
+                return f"user:{user_id}"
+        return f"ip:{self._client_ip(scope)}"
+
+    def _trusted(self, address: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in network for network in self.trusted_proxies)
+
+    def _client_ip(self, scope) -> str:
+        client = scope.get('client')
+        peer = client[0] if client else 'unknown'
+        if not self.trusted_proxies or not self._trusted(peer):
+            return peer
+        forwarded = [value.decode('latin-1') for name, value in scope['headers'] if name == b'x-forwarded-for']
+        hops = [hop.strip() for hop in ','.join(forwarded).split(',') if hop.strip()]
+        # Each proxy appends the address it saw: walk back past our own proxies
+        for hop in reversed(hops):
+            if not self._trusted(hop):
+                return hop
+        return hops[0] if hops else peer
+
+    def _token_user_id(self, scope) -> Optional[str]:
+        # Signature check only, no DB lookup; invalid tokens are limited by IP
+        for name, value in scope['headers']:
+            if name == b'authorization':
+                scheme, _, token = value.decode('latin-1').partition(' ')
+                if scheme.lower() != 'bearer' or not token:
+                    return None
+                try:
+                    payload = jwt.decode(token, self.jwt_secret, algorithms=self.jwt_algorithms)
+                except jwt.PyJWTError:
+                    return None
+                return payload.get('user_id')
+        return None
@@ -0,0 +1,431 @@
+"""Retention for game_scores: daily rollups, monthly archives and incremental VACUUM.
+
+Raw scores older than the retention window are moved out of the database in
+small chunks, oldest first. For each chunk:
+
+1. the rows are appended as one gzip member to
+   ``<archive_dir>/game_scores-YYYY-MM.ndjson.gz`` (the export's NDJSON
+   format, one file per month) and fsynced;
+2. one short write transaction folds them into ``daily_score_rollups`` (per
+   user, game and UTC day), deletes them, and records the archive file's
+   new size.
+
+A crash between the two steps leaves bytes past the recorded size; the next
+run truncates them, so every row ends up archived exactly once. Freed pages
+are then handed back to the filesystem a few at a time with
+``PRAGMA incremental_vacuum``, so no step holds the write lock for long.
+
+On the partitioned layout (``storage.PartitionedSQLiteRepository``) a
+month entirely past the cutoff is archived and rolled up from a read, then
+one write transaction stores its rollups and drops its table; only the
+month the cutoff falls in goes row by row.
+
+Users' totals (and so the leaderboard) never read raw rows, and
+``user_game_stats`` adds the rollups to the raw rows, so both stay correct.
+Score history, exports and anti-cheat replays cover the retention window
+only; the analytics snapshot and percentile sketches keep archived scores
+as long as they are not rebuilt.
+
+The API runs this in the background when RETENTION_DAYS is set, as a
+leader job of its scheduler, so in one worker at a time. By hand:
+
+    python retention.py --db cognitive_arena.db --days 180
+    python retention.py --db cognitive_arena.db --full-vacuum   # once, offline (see below)
+
+Incremental vacuum needs ``auto_vacuum=INCREMENTAL``, which new databases
+get from the storage layer. A file created before that needs one full
+VACUUM to switch; until then the freed pages are reused by new rows but the
+file does not shrink.
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from export import SCORE_COLUMNS, encode_ndjson
+from storage import ScorePartition, attach_standard_views, score_partitions, score_time_key, sqlite_layout
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_NAME = re.compile(r'^game_scores-(\d{4}-\d{2})\.ndjson\.gz$')
+
+EPOCH_DAY = date(1970, 1, 1).toordinal()
+# daily_score_rollups key columns per layout, and the values bound for a
+# (user_id, game_type, 'YYYY-MM-DD') key
+ROLLUP_KEYS = {
+    'standard': ('user_id, game_type, day', '?, ?, ?', lambda user_id, game_type, day: (user_id, game_type, day)),
+    'compact': ('user_key, game, day',
+                '(SELECT key FROM accounts WHERE id = ?), (SELECT key FROM game_types WHERE name = ?), ?',
+                lambda user_id, game_type, day: (user_id, game_type, date.fromisoformat(day).toordinal() - EPOCH_DAY)),
+}
+ROLLUP_KEYS['partitioned'] = ROLLUP_KEYS['standard']
+
+
+def archive_path(archive_dir: Path, month: str) -> Path:
+    return Path(archive_dir) / f"game_scores-{month}.ndjson.gz"
+
+
+@dataclass
+class RetentionRun:
+    archived: int = 0
+    chunks: int = 0
+    pages_freed: int = 0
+    longest_write: float = 0.0  # seconds, the longest write transaction
+    complete: bool = True       # False if stopped or out of time before the end
+
+
+def connect(db_path) -> sqlite3.Connection:
+    # Autocommit, with explicit short write transactions
+    conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=5000')
+    attach_standard_views(conn)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_files (
+            month TEXT PRIMARY KEY,
+            bytes INTEGER NOT NULL,
+            rows INTEGER NOT NULL
+        )
+    ''')
+    return conn
+
+
+def recover_archives(conn: sqlite3.Connection, archive_dir: Path):
+    """Cut every archive file back to the size recorded by the last committed chunk."""
+    recorded = dict(conn.execute('SELECT month, bytes FROM archive_files'))
+    if not Path(archive_dir).is_dir():
+        return
+    for path in Path(archive_dir).iterdir():
+        match = ARCHIVE_NAME.match(path.name)
+        if match is None:
+            continue
+        size = recorded.get(match.group(1), 0)
+        if path.stat().st_size > size:
+            logger.warning("Truncating %s to %d bytes (uncommitted archive chunk)", path, size)
+            with open(path, 'r+b') as archive:
+                archive.truncate(size)
+
+
+def _fold(rows, by_month: Dict[str, List[tuple]], rollups: Dict[tuple, list]):
+    """Add score rows (SCORE_COLUMNS order) to ``by_month`` and their totals to ``rollups``."""
+    for row in rows:
+        _, user_id, game_type, score, accuracy, time_taken, _, _, timestamp, flag = row[:10]
+        by_month.setdefault(timestamp[:7], []).append(row[:10])
+        totals = rollups.get((user_id, game_type, timestamp[:10]))
+        if totals is None:
+            rollups[(user_id, game_type, timestamp[:10])] = [1, int(flag is not None), score, accuracy,
+                                                              time_taken, score]
+        else:
+            totals[0] += 1
+            totals[1] += flag is not None
+            totals[2] += score
+            totals[3] += accuracy
+            totals[4] += time_taken
+            totals[5] = max(totals[5], score)
+
+
+def _append_archives(archive_dir: Path, by_month: Dict[str, List[tuple]]) -> Dict[str, int]:
+    """Append each month's rows as one gzip member and fsync; returns the files' new sizes."""
+    Path(archive_dir).mkdir(parents=True, exist_ok=True)
+    sizes = {}
+    for month, month_rows in by_month.items():
+        path = archive_path(archive_dir, month)
+        member = gzip.compress(b''.join(encode_ndjson([month_rows], SCORE_COLUMNS)), compresslevel=6)
+        with open(path, 'ab') as archive:
+            archive.write(member)
+            archive.flush()
+            os.fsync(archive.fileno())
+            sizes[month] = archive.tell()
+    return sizes
+
+
+def _record_archived(conn: sqlite3.Connection, rollups: Dict[tuple, list], sizes: Dict[str, int],
+                     counts: Dict[str, int], layout: str):
+    """Fold ``rollups`` into daily_score_rollups and record the archive files' sizes (in a transaction)."""
+    key_columns, key_values, bind_key = ROLLUP_KEYS[layout]
+    conn.executemany(f'''
+        INSERT INTO daily_score_rollups
+            ({key_columns}, games, flagged, score_sum, accuracy_sum, time_sum, best_score)
+        VALUES ({key_values}, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT ({key_columns}) DO UPDATE SET
+            games = games + excluded.games, flagged = flagged + excluded.flagged,
+            score_sum = score_sum + excluded.score_sum, accuracy_sum = accuracy_sum + excluded.accuracy_sum,
+            time_sum = time_sum + excluded.time_sum, best_score = MAX(best_score, excluded.best_score)
+    ''', [(*bind_key(*key), *totals) for key, totals in rollups.items()])
+    conn.executemany('''
+        INSERT INTO archive_files (month, bytes, rows) VALUES (?, ?, ?)
+        ON CONFLICT (month) DO UPDATE SET bytes = excluded.bytes, rows = rows + excluded.rows
+    ''', [(month, sizes[month], counts[month]) for month in sizes])
+
+
+def archive_chunk(conn: sqlite3.Connection, archive_dir: Path, cutoff: str, chunk_rows: int,
+                  layout: str = 'standard'):
+    """Archive, roll up and delete up to ``chunk_rows`` scores older than ``cutoff``.
+
+    Returns (rows moved, seconds in the write transaction).
+    """
+    time_key, convert = score_time_key(conn)
+    # The newest row is never removed, so rowids keep growing (analytics
+    # refreshes by rowid) even if every score is past the cutoff
+    rows = conn.execute(f'''
+        SELECT {', '.join(SCORE_COLUMNS)}, rowid FROM game_scores
+        WHERE {time_key} < ? AND rowid != (SELECT rowid FROM game_scores ORDER BY rowid DESC LIMIT 1)
+        ORDER BY {time_key}
+        LIMIT ?
+    ''', (convert(cutoff), chunk_rows)).fetchall()
+    if not rows:
+        return 0, 0.0
+
+    by_month: Dict[str, List[tuple]] = {}
+    rollups: Dict[tuple, list] = {}
+    _fold(rows, by_month, rollups)
+    sizes = _append_archives(archive_dir, by_month)
+
+    started = time.perf_counter()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _record_archived(conn, rollups, sizes, {month: len(month_rows) for month, month_rows in by_month.items()},
+                         layout)
+        conn.executemany('DELETE FROM game_scores WHERE rowid = ?', [(row[-1],) for row in rows])
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return len(rows), time.perf_counter() - started
+
+
+def archive_partition(conn: sqlite3.Connection, archive_dir: Path, partition: ScorePartition,
+                      batch_rows: int = 20000):
+    """Archive and roll up a whole month of the partitioned layout, then drop its table.
+
+    The rows are archived (a gzip member per ``batch_rows``) and summed up
+    before taking the write lock; the write transaction only stores the
+    rollups and drops the table, however many scores the month held.
+    Returns (rows moved, seconds in the write transaction), or (0, 0.0)
+    if the partition holds the newest score or changed in the meantime.
+    """
+    newest = conn.execute(f'SELECT MAX(rowid) FROM {partition.table}').fetchone()[0]
+    if newest is not None and newest == conn.execute(
+            'SELECT rowid FROM game_scores ORDER BY rowid DESC LIMIT 1').fetchone()[0]:
+        return 0, 0.0
+    rollups: Dict[tuple, list] = {}
+    sizes: Dict[str, int] = {}
+    counts: Dict[str, int] = {}
+    cursor = conn.execute(f"SELECT {', '.join(SCORE_COLUMNS)} FROM {partition.table} ORDER BY timestamp")
+    while True:
+        rows = cursor.fetchmany(batch_rows)
+        if not rows:
+            break
+        by_month: Dict[str, List[tuple]] = {}
+        _fold(rows, by_month, rollups)
+        sizes.update(_append_archives(archive_dir, by_month))
+        for month, month_rows in by_month.items():
+            counts[month] = counts.get(month, 0) + len(month_rows)
+
+    started = time.perf_counter()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if conn.execute(f'SELECT COUNT(*) FROM {partition.table}').fetchone()[0] != sum(counts.values()):
+            # A late score arrived for this month; the files go back to their recorded sizes
+            conn.execute('ROLLBACK')
+            recover_archives(conn, archive_dir)
+            return 0, 0.0
+        _record_archived(conn, rollups, sizes, counts, 'partitioned')
+        conn.execute(f'DROP TABLE {partition.table}')
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    seconds = time.perf_counter() - started
+    attach_standard_views(conn)  # this connection's game_scores view named the dropped table
+    return sum(counts.values()), seconds
+
+
+def incremental_vacuum(conn: sqlite3.Connection, pages: int) -> int:
+    """Return up to ``pages`` free pages to the filesystem; how many were freed."""
+    before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    if before:
+        # One sqlite3_step frees one page; executescript steps the pragma to completion
+        conn.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+    return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def run_retention(db_path, archive_dir, days: float, chunk_rows: int = 250, pause: float = 0.05,
+                  vacuum_pages: int = 1024, deadline: Optional[float] = None,
+                  stop: Optional[threading.Event] = None) -> RetentionRun:
+    """Move scores older than ``days`` out of ``db_path``, then vacuum.
+
+    Sleeps ``pause`` seconds between write transactions so API writes get
+    the lock in between; stops early at ``deadline`` (time.monotonic) or
+    when ``stop`` is set, leaving the rest for the next run.
+    """
+    cutoff_at = datetime.now(timezone.utc) - timedelta(days=days)
+    cutoff = cutoff_at.isoformat()
+    run = RetentionRun()
+
+    def keep_going():
+        if (stop is not None and stop.is_set()) or (deadline is not None and time.monotonic() >= deadline):
+            run.complete = False
+            return False
+        return True
+
+    conn = connect(db_path)
+    try:
+        layout = sqlite_layout(conn)
+        recover_archives(conn, archive_dir)
+        if layout == 'partitioned':
+            # Months entirely past the cutoff go whole; the rest row by row below
+            for partition in score_partitions(conn):
+                if partition.end > cutoff_at or not keep_going():
+                    break
+                moved, seconds = archive_partition(conn, archive_dir, partition)
+                run.archived += moved
+                run.chunks += 1
+                run.longest_write = max(run.longest_write, seconds)
+                time.sleep(pause)
+        while keep_going():
+            moved, seconds = archive_chunk(conn, archive_dir, cutoff, chunk_rows, layout)
+            if not moved:
+                break
+            run.archived += moved
+            run.chunks += 1
+            run.longest_write = max(run.longest_write, seconds)
+            time.sleep(pause)
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            while keep_going():
+                started = time.perf_counter()
+                freed = incremental_vacuum(conn, vacuum_pages)
+                if not freed:
+                    break
+                run.pages_freed += freed
+                run.longest_write = max(run.longest_write, time.perf_counter() - started)
+                time.sleep(pause)
+    finally:
+        conn.close()
+    return run
+
+
+class RetentionJob:
+    """``run_retention`` as a scheduler job, for the worker holding the scheduler's leader lease.
+
+    Each run also claims a lease row in the database (an UPSERT that only
+    takes over an expired lease) for ``max_run_seconds``, which bounds the
+    run: a worker that has just taken over leadership cannot start a second
+    run beside one still finishing elsewhere. The lease is given back when
+    the run ends, so the next one need not wait for it to expire. The run
+    itself is on a thread.
+    """
+
+    def __init__(self, db_path, archive_dir, days: float, max_run_seconds: float = 300.0, **options):
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.days = days
+        self.max_run_seconds = max_run_seconds
+        self.options = options
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.runs = 0
+        self.archived = 0
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Make a run in progress stop at the end of its current chunk, and later ones return at once."""
+        self._stop.set()
+
+    def _lease(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+
+    def _claim(self) -> bool:
+        conn = self._lease()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS retention_lease (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            now = time.time()
+            return conn.execute('''
+                INSERT INTO retention_lease (id, owner, expires_at) VALUES (1, :owner, :expires_at)
+                ON CONFLICT (id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE retention_lease.expires_at <= :now
+                RETURNING owner
+            ''', {'owner': self.owner, 'expires_at': now + self.max_run_seconds, 'now': now}).fetchone() is not None
+        finally:
+            conn.close()
+
+    def _release(self):
+        conn = self._lease()
+        try:
+            conn.execute('UPDATE retention_lease SET expires_at = 0 WHERE owner = ?', (self.owner,))
+        finally:
+            conn.close()
+
+    def _run_once(self) -> Optional[RetentionRun]:
+        if self._stop.is_set() or not self._claim():
+            return None
+        try:
+            return run_retention(self.db_path, self.archive_dir, self.days, stop=self._stop,
+                                 deadline=time.monotonic() + self.max_run_seconds, **self.options)
+        finally:
+            self._release()
+
+    async def run(self):
+        run = await asyncio.to_thread(self._run_once)
+        if run is not None:
+            self.runs += 1
+            self.archived += run.archived
+            if run.archived or run.pages_freed:
+                logger.info("Retention archived %d scores, freed %d pages (longest write %.0f ms)",
+                            run.archived, run.pages_freed, run.longest_write * 1000)
+
+
+def full_vacuum(db_path):
+    """Switch an existing file to incremental auto-vacuum. Rewrites the whole file, holding the lock."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=Path(__file__).parent / os.environ.get('DB_NAME', 'cognitive_arena.db'))
+    parser.add_argument('--archive-dir', default=Path(__file__).parent / os.environ.get('ARCHIVE_DIR', 'archive'))
+    parser.add_argument('--days', type=float, default=float(os.environ.get('RETENTION_DAYS', 0) or 180),
+                        help="keep raw scores this many days")
+    parser.add_argument('--chunk-rows', type=int, default=250)
+    parser.add_argument('--pause', type=float, default=0.05, help="seconds between write transactions")
+    parser.add_argument('--full-vacuum', action='store_true',
+                        help="switch to incremental vacuum with one full VACUUM (stop the API first)")
+    args = parser.parse_args(argv)
+
+    if args.full_vacuum:
+        started = time.perf_counter()
+        full_vacuum(args.db)
+        print(f"Vacuumed {args.db} in {time.perf_counter() - started:.1f}s; auto_vacuum is now incremental")
+        return 0
+    started = time.perf_counter()
+    run = run_retention(args.db, Path(args.archive_dir), args.days, args.chunk_rows, args.pause)
+    print(f"Archived {run.archived} scores in {run.chunks} chunks and freed {run.pages_freed} pages "
+          f"in {time.perf_counter() - started:.1f}s; longest write transaction {run.longest_write * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""Background jobs for the API: periodic and one-shot, in each worker's event loop.
+
+Write-behind flushes, rollups, archival and cache warming all used to be
+a hand-rolled ``while True: sleep`` task each. ``Scheduler`` runs them
+instead. A job is an async function run ``every`` so many seconds (or at
+a delay a function works out, such as "just past midnight"), or ``once``
+after a delay. A run never overlaps the job's previous one, and a failure
+is logged and counted without stopping the job. Intervals are jittered so
+workers started together do not hit the database in step.
+
+Jobs marked ``leader`` run in one worker at a time. Workers compete for a
+``LeaderLease``: a row in a small SQLite file, taken over by an UPSERT only
+once its holder has let it expire and renewed every ``ttl / 3`` seconds.
+A worker that fails to renew counts itself out before the row expires, and
+a worker that stops hands the lease back, so another worker takes over
+within one renewal instead of one ``ttl``. A leader job that may run
+longer than the lease should carry its own fence (retention keeps its
+per-run lease).
+
+``stop`` is the shutdown half: jobs not running are cancelled, running
+ones get ``timeout`` seconds to finish, ``flush`` jobs (write-behind
+queues) run one last time, and the lease is released.
+``python bench.py shutdown`` kills workers under load and checks that
+nothing acknowledged is lost and that exactly one worker leads.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+Interval = Union[float, Callable[[], float]]
+
+
+class LeaderLease:
+    """A named lease in a SQLite file, held by at most one worker at a time.
+
+    ``held`` is this worker's view: true from a successful claim until
+    ``ttl - margin`` seconds after it was attempted, so it always ends before
+    the row does, even when a renewal is late or fails.
+    """
+
+    def __init__(self, path, name: str = 'scheduler', ttl: float = 15.0, margin: float = 1.0):
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self.margin = min(margin, ttl / 3)
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.acquired = 0
+        self._db: Optional[aiosqlite.Connection] = None
+        self._valid_until = float('-inf')
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def held(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    async def start(self):
+        self._db = await aiosqlite.connect(self.path, isolation_level=None)
+        await self._db.execute('PRAGMA journal_mode=WAL')
+        await self._db.execute('PRAGMA synchronous=NORMAL')
+        await self._db.execute('PRAGMA busy_timeout=1000')
+        await self._db.execute('''
+            CREATE TABLE IF NOT EXISTS leader_leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        await self.renew()
+        self._task = asyncio.create_task(self._renew_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._db is not None:
+            try:
+                await self.release()
+            except Exception:
+                # It expires on its own
+                logger.exception("Releasing the leader lease failed")
+            finally:
+                await self._db.close()
+                self._db = None
+
+    async def renew(self) -> bool:
+        """Claim the lease if it is free or expired, or extend it if this worker holds it."""
+        attempted = time.monotonic()
+        now = time.time()
+        try:
+            async with self._db.execute('''
+                INSERT INTO leader_leases (name, owner, expires_at) VALUES (:name, :owner, :expires_at)
+                ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE leader_leases.expires_at <= :now OR leader_leases.owner = excluded.owner
+                RETURNING owner
+            ''', {'name': self.name, 'owner': self.owner, 'expires_at': now + self.ttl, 'now': now}) as cursor:
+                claimed = await cursor.fetchone() is not None
+        except Exception:
+            logger.exception("Renewing the leader lease failed")
+            claimed = False
+        if claimed:
+            if not self.held:
+                self.acquired += 1
+                logger.info("Worker %s is now the scheduler leader", self.owner)
+            self._valid_until = attempted + self.ttl - self.margin
+        return self.held
+
+    async def release(self):
+        self._valid_until = float('-inf')
+        await self._db.execute('UPDATE leader_leases SET expires_at = 0 WHERE name = ? AND owner = ?',
+                               (self.name, self.owner))
+
+    async def _renew_loop(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            await self.renew()
+
+
+class Job:
+    __slots__ = ('name', 'fn', 'interval', 'delay', 'jitter', 'leader', 'flush', 'repeat',
+                 'runs', 'failures', 'skipped', 'last_seconds', 'running')
+
+    def __init__(self, name: str, fn: Callable[[], Awaitable], interval: Optional[Interval], delay: Optional[Interval],
+                 jitter: float, leader: bool, flush: bool):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.delay = delay
+        self.jitter = jitter
+        self.leader = leader
+        self.flush = flush
+        self.repeat = interval is not None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0  # runs due while another worker led
+        self.last_seconds = 0.0
+        self.running: Optional[asyncio.Future] = None
+
+
+class Scheduler:
+    """Jobs run on this worker's event loop; ``lease`` decides which worker runs the leader jobs."""
+
+    def __init__(self, lease: Optional[LeaderLease] = None, rng: Optional[random.Random] = None):
+        self.lease = lease
+        self.rng = rng or random.Random()
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    def every(self, name: str, interval: Interval, fn: Callable[[], Awaitable], jitter: float = 0.1,
+              delay: Optional[Interval] = None, leader: bool = False, flush: bool = False) -> Job:
+        """Run ``fn`` every ``interval`` seconds, first after ``delay`` (default: one interval).
+
+        ``interval`` and ``delay`` may be functions returning seconds, read
+        each time. ``jitter`` spreads each wait by up to that fraction either
+        way. ``flush`` also runs the job once more at ``stop``.
+        """
+        return self._add(Job(name, fn, interval, interval if delay is None else delay, jitter, leader, flush))
+
+    def once(self, name: str, fn: Callable[[], Awaitable], delay: Interval = 0.0, leader: bool = False) -> Job:
+        return self._add(Job(name, fn, None, delay, 0.0, leader, False))
+
+    def _add(self, job: Job) -> Job:
+        if job.name in self.jobs:
+            raise ValueError(f"Job {job.name!r} is already scheduled")
+        if job.leader and self.lease is None:
+            raise ValueError(f"Job {job.name!r} needs a leader lease")
+        self.jobs[job.name] = job
+        if self._tasks:
+            self._tasks.append(asyncio.create_task(self._loop(job)))
+        return job
+
+    @property
+    def is_leader(self) -> bool:
+        return self.lease is not None and self.lease.held
+
+    async def start(self):
+        self._stopping = False
+        if self.lease is not None and any(job.leader for job in self.jobs.values()):
+            # Claimed before the first run, so a leader job due at once is not skipped
+            await self.lease.start()
+        self._tasks = [asyncio.create_task(self._loop(job)) for job in self.jobs.values()]
+
+    async def stop(self, timeout: float = 10.0):
+        """Cancel waiting jobs, let running ones finish, run the flush jobs and release the lease."""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        running = [job.running for job in self.jobs.values() if job.running is not None]
+        if running:
+            done, pending = await asyncio.wait(running, timeout=timeout)
+            for future in pending:
+                logger.warning("Cancelling a background job still running after %.0fs", timeout)
+                future.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in self.jobs.values():
+            if job.flush and (not job.leader or self.is_leader):
+                try:
+                    await asyncio.wait_for(self._run(job), timeout)
+                except asyncio.TimeoutError:
+                    logger.error("Final run of %s timed out after %.0fs", job.name, timeout)
+        if self.lease is not None:
+            await self.lease.stop()
+
+    def _wait(self, job: Job, seconds: Interval) -> float:
+        seconds = seconds() if callable(seconds) else seconds
+        if job.jitter:
+            seconds *= 1 + self.rng.uniform(-job.jitter, job.jitter)
+        return max(0.0, seconds)
+
+    async def _loop(self, job: Job):
+        await asyncio.sleep(self._wait(job, job.delay))
+        while not self._stopping:
+            if job.leader and not self.is_leader:
+                job.skipped += 1
+            else:
+                job.running = asyncio.ensure_future(self._run(job))
+                try:
+                    # Shielded: stop() cancels this loop, but lets the run finish
+                    await asyncio.shield(job.running)
+                finally:
+                    job.running = None
+            if not job.repeat:
+                return
+            await asyncio.sleep(self._wait(job, job.interval))
+
+    async def _run(self, job: Job):
+        started = time.perf_counter()
+        try:
+            await job.fn()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            job.failures += 1
+            logger.exception("Background job %s failed", job.name)
+        else:
+            job.runs += 1
+        finally:
+            job.last_seconds = time.perf_counter() - started
+
+    def runs(self) -> Dict[Tuple[str, str], int]:
+        """Finished runs by (job, result), for a metrics counter."""
+        counts = {}
+        for job in self.jobs.values():
+            counts[(job.name, 'ok')] = job.runs
+            counts[(job.name, 'error')] = job.failures
+            counts[(job.name, 'skipped')] = job.skipped
+        return counts
@@ -0,0 +1,247 @@
+"""Synthetic data for benchmarking leaderboards and stats at scale.
+
+Generates users and game_scores with realistic shapes and bulk-loads them
+into SQLite or MongoDB. Output is fully determined by --seed.
+
+* Play counts follow a Pareto (power-law) distribution: most users play a
+  handful of games, a few play thousands.
+* Each user has a latent skill; per-game accuracy sits below the matching
+  AI_BASELINES accuracy by a per-game gap, improves with practice and is
+  noisy from game to game. Scores and ai_baseline_score follow the same
+  formulas as the frontend and submit_game_score.
+
+All seeded users share one password (SEED_PASSWORD) so load tests can log in.
+
+Usage:
+    python seed.py --db bench.db --users 500000 --mean-games 20
+    python seed.py --backend mongo --mongo-url mongodb://localhost:27017 --users 100000
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR))
+
+SEED_PASSWORD = 'seed-password'
+
+# Same numbers as server.AI_BASELINES plus how far below the AI the average
+# human starts, and how many rounds make up one game
+GAME_PROFILES = {
+    'ai_image': {'ai_accuracy': 92.5, 'average_time': 3.2, 'human_gap': 14.0, 'rounds': 3},
+    'text_ai': {'ai_accuracy': 88.7, 'average_time': 5.1, 'human_gap': 18.0, 'rounds': 3},
+    'memory_challenge': {'ai_accuracy': 78.3, 'average_time': 12.5, 'human_gap': 6.0, 'rounds': 5},
+}
+GAME_TYPES = list(GAME_PROFILES)
+
+
+def seed_password_hash() -> str:
+    import bcrypt
+    return bcrypt.hashpw(SEED_PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+@dataclass
+class SeedConfig:
+    users: int = 10000
+    mean_games: float = 20.0
+    pareto_alpha: float = 1.5
+    days: int = 365
+    seed: int = 42
+    chunk_users: int = 20000
+
+
+def _uuid_strings(rng: np.random.Generator, n: int) -> List[str]:
+    high = rng.integers(0, 2 ** 63, size=n, dtype=np.int64).tolist()
+    low = rng.integers(0, 2 ** 63, size=n, dtype=np.int64).tolist()
+    return [str(uuid.UUID(int=(h << 64) | l, version=4)) for h, l in zip(high, low)]
+
+
+def _iso_strings(epoch_us: np.ndarray) -> List[str]:
+    text = np.datetime_as_string(epoch_us.astype('datetime64[us]'), unit='us')
+    return np.char.add(text, '+00:00').tolist()
+
+
+def generate(config: SeedConfig, now: datetime) -> Iterator[Tuple[list, list]]:
+    """Yield (user_rows, score_rows) per chunk of users.
+
+    user_rows: (id, username, email, created_at_us, games, total_score)
+    score_rows: columns as lists - ids, user_ids, game_types, scores, accuracy,
+    time_taken, ai_baseline_score, ai_baseline_accuracy, timestamp_us
+    """
+    rng = np.random.default_rng(config.seed)
+    now_us = int(now.timestamp() * 1e6)
+    span_us = config.days * 86400 * 10 ** 6
+    xm = config.mean_games * (config.pareto_alpha - 1) / config.pareto_alpha
+    cap = int(config.mean_games * 50)
+    profiles = [GAME_PROFILES[g] for g in GAME_TYPES]
+    ai_accuracy = np.array([p['ai_accuracy'] for p in profiles])
+    human_gap = np.array([p['human_gap'] for p in profiles])
+    rounds = np.array([p['rounds'] for p in profiles])
+    average_time = np.array([p['average_time'] for p in profiles])
+
+    for start in range(0, config.users, config.chunk_users):
+        n = min(config.chunk_users, config.users - start)
+        user_ids = _uuid_strings(rng, n)
+        games = np.minimum(((rng.pareto(config.pareto_alpha, n) + 1) * xm).astype(np.int64), cap)
+        skill = rng.normal(0.0, 1.0, n)
+        joined_us = now_us - rng.integers(0, span_us, n)
+
+        total = int(games.sum())
+        owner = np.repeat(np.arange(n), games)
+        # Position of each game within its user's history, for the practice curve
+        first = np.repeat(np.cumsum(games) - games, games)
+        practice = np.arange(total) - first
+        game_index = rng.integers(0, len(GAME_TYPES), total)
+
+        accuracy = (ai_accuracy[game_index] - human_gap[game_index] + 10.0 * skill[owner]
+                    + 8.0 * (1 - np.exp(-practice / 25.0)) + rng.normal(0.0, 9.0, total))
+        accuracy = np.clip(accuracy, 0.0, 100.0)
+        time_bonus = rng.integers(0, 51, total)
+        score = np.rint(accuracy / 100 * rounds[game_index] * (100 + time_bonus)).astype(np.int64)
+        ai_baseline_score = (score * (ai_accuracy[game_index] / 100)).astype(np.int64)
+        time_taken = np.maximum(1, rng.lognormal(np.log(average_time[game_index] * rounds[game_index] * 1.6),
+                                                 0.35, total)).astype(np.int64)
+        joined = joined_us[owner]
+        timestamp_us = joined + (rng.random(total) * (now_us - joined)).astype(np.int64)
+
+        score_totals = np.bincount(owner, weights=score, minlength=n).astype(np.int64)
+        user_rows = [
+            (user_ids[i], f"user{start + i}", f"user{start + i}@example.com", int(joined_us[i]),
+             int(games[i]), int(score_totals[i]))
+            for i in range(n)
+        ]
+        score_columns = [
+            _uuid_strings(rng, total),
+            [user_ids[i] for i in owner.tolist()],
+            [GAME_TYPES[i] for i in game_index.tolist()],
+            score.tolist(),
+            np.round(accuracy, 1).tolist(),
+            time_taken.tolist(),
+            ai_baseline_score.tolist(),
+            ai_accuracy[game_index].tolist(),
+            timestamp_us,
+        ]
+        yield user_rows, score_columns
+
+
+def load_sqlite(db_path: Path, config: SeedConfig, password_hash: str) -> Tuple[int, int]:
+    from storage import SQLiteRepository
+
+    repo = SQLiteRepository(db_path)
+    asyncio.run(repo.start())  # schema + indexes
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # Bulk-load settings: no journal or fsync, big page cache; secondary
+    # indexes are dropped here and rebuilt once at the end by repo.start()
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-262144')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    indexes = [name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")]
+    for name in indexes:
+        conn.execute(f'DROP INDEX {name}')
+    conn.execute('PRAGMA user_version = 0')  # so the second repo.start() recreates them
+
+    n_users = n_scores = 0
+    for user_rows, columns in generate(config, datetime.now(timezone.utc)):
+        created = _iso_strings(np.array([row[3] for row in user_rows]))
+        conn.execute('BEGIN')
+        conn.executemany('''
+            INSERT INTO users (id, username, email, password, created_at, total_games_played, total_score)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(uid, name, email, password_hash, created_at, games, total)
+              for (uid, name, email, _, games, total), created_at in zip(user_rows, created)])
+        columns[8] = _iso_strings(columns[8])
+        conn.executemany('''
+            INSERT INTO game_scores (id, user_id, game_type, score, accuracy, time_taken,
+                                     ai_baseline_score, ai_baseline_accuracy, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', zip(*columns))
+        conn.execute('COMMIT')
+        n_users += len(user_rows)
+        n_scores += len(columns[0])
+        print(f"  {n_users} users, {n_scores} scores", file=sys.stderr)
+    conn.close()
+
+    print("  rebuilding indexes", file=sys.stderr)
+    asyncio.run(repo.start())
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('ANALYZE')
+    conn.close()
+    return n_users, n_scores
+
+
+def load_mongo(url: str, db_name: str, config: SeedConfig, password_hash: str) -> Tuple[int, int]:
+    from pymongo import MongoClient
+    from storage import MongoRepository
+
+    db = MongoClient(url)[db_name]
+    n_users = n_scores = 0
+    for user_rows, columns in generate(config, datetime.now(timezone.utc)):
+        db.users.insert_many([
+            {"id": uid, "username": name, "email": email, "password": password_hash,
+             "created_at": datetime.fromtimestamp(created_us / 1e6, timezone.utc),
+             "total_games_played": games, "total_score": total}
+            for uid, name, email, created_us, games, total in user_rows
+        ], ordered=False)
+        timestamps = columns[8].astype('datetime64[ms]').astype(datetime).tolist()
+        db.game_scores.insert_many([
+            {"id": sid, "user_id": uid, "game_type": game, "score": score, "accuracy": accuracy,
+             "time_taken": taken, "ai_baseline_score": ai_score, "ai_baseline_accuracy": ai_accuracy,
+             "timestamp": ts}
+            for sid, uid, game, score, accuracy, taken, ai_score, ai_accuracy, ts
+            in zip(*columns[:8], timestamps)
+        ], ordered=False)
+        n_users += len(user_rows)
+        n_scores += len(columns[0])
+        print(f"  {n_users} users, {n_scores} scores", file=sys.stderr)
+
+    # Indexes are built once after the load rather than maintained per insert
+    asyncio.run(MongoRepository(url, db_name).start())
+    return n_users, n_scores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=['sqlite', 'mongo'], default='sqlite')
+    parser.add_argument('--db', default=ROOT_DIR / 'seed.db', help="SQLite file to create")
+    parser.add_argument('--mongo-url', default=os.environ.get('MONGO_URL'))
+    parser.add_argument('--mongo-db', default='cognitive_arena_seed')
+    parser.add_argument('--users', type=int, default=SeedConfig.users)
+    parser.add_argument('--mean-games', type=float, default=SeedConfig.mean_games)
+    parser.add_argument('--pareto-alpha', type=float, default=SeedConfig.pareto_alpha)
+    parser.add_argument('--days', type=int, default=SeedConfig.days)
+    parser.add_argument('--seed', type=int, default=SeedConfig.seed)
+    args = parser.parse_args(argv)
+
+    config = SeedConfig(users=args.users, mean_games=args.mean_games, pareto_alpha=args.pareto_alpha,
+                        days=args.days, seed=args.seed)
+    password_hash = seed_password_hash()
+    started = time.perf_counter()
+    if args.backend == 'sqlite':
+        if Path(args.db).exists():
+            parser.error(f"{args.db} already exists")
+        n_users, n_scores = load_sqlite(Path(args.db), config, password_hash)
+    else:
+        if not args.mongo_url:
+            parser.error("--mongo-url (or MONGO_URL) is required for the mongo backend")
+        n_users, n_scores = load_mongo(args.mongo_url, args.mongo_db, config, password_hash)
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {n_users} users and {n_scores} scores in {elapsed:.1f}s "
+          f"({n_scores / elapsed:,.0f} scores/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,43 +1,254 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, WebSocket, WebSocketDisconnect, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
-import aiosqlite
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import Callable, List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 import jwt
 import bcrypt
+import orjson
 import random
 import json
+import base64
+import time
+import asyncio
+import threading
+
+from achievements import AchievementRules, AchievementTracker
+from anticheat import ACCEPT, ScoreDetector
+from bloom import TakenNames
+from cache_bus import LocalCache, create_bus
+from daily import DAY_SECONDS, DailyChallenges, DailyLeaderboard, DailyRound
+from drain import DrainMiddleware, RequestDrain
+from export import EXPORT_FORMATS, stream_export
+from idempotency import IdempotencyMiddleware, MemoryIdempotencyStore, SQLiteIdempotencyStore
+from matchmaking import (AlreadyQueued, LiveMatch, Matchmaker, MatchmakingFull, MatchRound, NoOpponent, PlayerResult,
+                         Ticket, match_winner)
+from memory_rounds import (MAX_SEQUENCE_LENGTH, ImplausibleRecall, LocalRoundStore, MemoryRound, RoundStore,
+                           RoundStoreFull, SQLiteRoundStore, answer_seconds, new_sequence, score_recall,
+                           show_seconds)
+from metrics import (PROMETHEUS_CONTENT_TYPE, InstrumentedExecutor, InstrumentedRepository, MetricsMiddleware,
+                     MetricsRegistry)
+from percentiles import ScorePercentiles, SQLitePercentileStore
+from profiling import ProfileStore, ProfilingMiddleware, SlowRequestLog, StackSampler, TracedRoute, traced
+from rate_limit import (MemoryBucketStore, RateLimitMiddleware, RatePolicy, SQLiteBucketStore, parse_networks,
+                        parse_policy_overrides)
+from retention import RetentionJob
+from scheduler import LeaderLease, Scheduler
+from skill import LADDERS, SkillModel, SkillRating
+from storage import (GAME_TYPES, DuplicateUserError, StaleProgressError, StaleRatingError, UserRecord,
+                     create_repository, empty_game_stats)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Metrics, exposed in Prometheus text format at /metrics
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+metrics = MetricsRegistry()
+
 # Database setup
-DATABASE_PATH = ROOT_DIR / os.environ.get('DB_NAME', 'cognitive_arena.db')
+storage = InstrumentedRepository(create_repository(ROOT_DIR), metrics) if METRICS_ENABLED \
+    else create_repository(ROOT_DIR)
+# Exports and analytics read the SQLite file directly; None on other backends
+DATABASE_PATH = storage.path if storage.name == 'sqlite' else None
+
+# Cross-worker caches
+cache = LocalCache(ttl=float(os.environ.get('CACHE_TTL_SECONDS', 30)))
+cache_bus = create_bus(os.environ.get('CACHE_BUS', 'sqlite'),
+                       ROOT_DIR / os.environ.get('CACHE_BUS_DB', 'cache_bus.db'))
+cache_bus.subscribe(cache.invalidate)
+metrics.counter('cache_hits_total', "Local cache hits", fn=lambda: cache.hits)
+metrics.counter('cache_misses_total', "Local cache misses", fn=lambda: cache.misses)
+metrics.gauge('cache_hit_ratio', "Local cache hits / lookups since start",
+              fn=lambda: cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0)
+
+# Usernames and emails in use, as Bloom filters in each worker: registrations and
+# availability checks of new names skip the users table. New accounts arrive on the bus
+taken_names = TakenNames(storage.user_names, storage.count_users,
+                         error_rate=float(os.environ.get('NAME_FILTER_ERROR_RATE', 0.001)))
+cache_bus.subscribe(taken_names.on_event)
+metrics.counter('name_filter_checks_total', "Username/email checks by filter answer (free, maybe, not_ready)",
+                ('result',), fn=lambda: {(result,): count for result, count in taken_names.checks.items()})
+metrics.gauge('name_filter_bytes', "Memory held by the taken-name filters", fn=lambda: taken_names.nbytes)
+
+# Global analytics snapshot, refreshed incrementally from game_scores. Built on
+# first use: analytics needs pandas/numpy, which would double worker import time
+ANALYTICS_SNAPSHOT = ROOT_DIR / os.environ.get('ANALYTICS_SNAPSHOT', 'analytics_snapshot.npz')
+analytics = None
+ANALYTICS_REFRESH_SECONDS = float(os.environ.get('ANALYTICS_REFRESH_SECONDS', 60))
+analytics_refresh_lock = asyncio.Lock()
 
 # JWT Settings
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24
 
+# bcrypt is deliberately slow; run it on a small thread pool instead of the event loop
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', min(4, os.cpu_count() or 1)))
+password_executor = InstrumentedExecutor('bcrypt', BCRYPT_WORKERS, metrics)
+
+# Slow-request capture and on-demand profiling (/api/admin/slow-requests, /api/admin/profile)
+slow_requests = SlowRequestLog(threshold=float(os.environ.get('SLOW_REQUEST_MS', 500)) / 1000,
+                               size=int(os.environ.get('SLOW_REQUEST_LOG_SIZE', 100)))
+request_profiles = ProfileStore()
+sampling_lock = asyncio.Lock()
+
+# Anomaly detection on client-reported scores; flagged scores stay out of the leaderboard
+score_detector = ScoreDetector(z_threshold=float(os.environ.get('ANTICHEAT_Z_THRESHOLD', 4.0)))
+metrics.counter('score_verdicts_total', "Client-reported scores by anti-cheat verdict", ('verdict',),
+                fn=lambda: {(action,): count for action, count in score_detector.verdicts.items()})
+
+# "You beat X% of players": per-game quantile sketches of accepted scores,
+# merged across workers through a SQLite checkpoint
+if os.environ.get('PERCENTILE_BACKEND', 'sqlite') == 'memory':
+    score_percentiles = ScorePercentiles()
+else:
+    score_percentiles = SQLitePercentileStore(ROOT_DIR / os.environ.get('PERCENTILE_DB', 'percentiles.db'),
+                                              source_path=DATABASE_PATH)
+metrics.gauge('score_percentile_sketch_items', "Items held by the score percentile sketches", ('game_type',),
+              fn=lambda: {(game_type,): items for game_type, items in score_percentiles.retained().items()})
+
+# Open memory challenge rounds; the server keeps the sequence and scores the recall.
+# Shared by the workers, so any of them can score a round another one issued
+MEMORY_ROUND_TTL = float(os.environ.get('MEMORY_ROUND_TTL_SECONDS', 300))
+if os.environ.get('MEMORY_ROUNDS_BACKEND', 'sqlite') == 'memory':
+    memory_rounds = LocalRoundStore(RoundStore(capacity=int(os.environ.get('MEMORY_ROUNDS_CAPACITY', 100000)),
+                                               ttl=MEMORY_ROUND_TTL))
+else:
+    memory_rounds = SQLiteRoundStore(ROOT_DIR / os.environ.get('MEMORY_ROUNDS_DB', 'memory_rounds.db'),
+                                     ttl=MEMORY_ROUND_TTL)
+metrics.gauge('memory_rounds_active', "Memory challenge rounds issued and not yet submitted or expired",
+              fn=lambda: memory_rounds.active)
+
+# Adaptive difficulty: each player's rating picks their next memory round's level.
+# A saved rating is dropped from the other workers' caches through the cache bus
+skill_model = SkillModel(LADDERS, load=storage.get_skill_ratings,
+                         target=float(os.environ.get('SKILL_TARGET_SUCCESS', 0.7)),
+                         max_entries=int(os.environ.get('SKILL_CACHE_SIZE', 100000)))
+cache_bus.subscribe(skill_model.on_event)
+metrics.counter('skill_cache_hits_total', "Skill ratings served from the per-worker cache",
+                fn=lambda: skill_model.hits)
+metrics.counter('skill_cache_misses_total', "Skill ratings loaded from storage", fn=lambda: skill_model.misses)
+metrics.counter('skill_conflicts_total', "Skill rating saves refused because another worker saved first",
+                fn=lambda: skill_model.conflicts)
+
+# Achievements advance with each recorded score, from per-user counters saved beside it
+achievement_tracker = AchievementTracker(AchievementRules(), load=storage.get_achievement_progress,
+                                         max_entries=int(os.environ.get('ACHIEVEMENT_CACHE_SIZE', 100000)))
+metrics.counter('achievement_cache_hits_total', "Achievement progress served from the per-worker cache",
+                fn=lambda: achievement_tracker.hits)
+metrics.counter('achievement_cache_misses_total', "Achievement progress loaded from storage",
+                fn=lambda: achievement_tracker.misses)
+metrics.counter('achievement_conflicts_total', "Achievement saves refused because another worker saved first",
+                fn=lambda: achievement_tracker.conflicts)
+
+# Live head-to-head matches (per worker): players wait for an
+# opponent rated within a window that widens the longer they wait
+matchmaker = Matchmaker(lambda game_type, first, second: start_live_match(game_type, first, second),
+                        window=float(os.environ.get('MATCH_WINDOW', 50)),
+                        growth=float(os.environ.get('MATCH_WINDOW_GROWTH', 25)),
+                        max_window=float(os.environ.get('MATCH_MAX_WINDOW', 400)),
+                        capacity=int(os.environ.get('MATCH_QUEUE_CAPACITY', 100000)),
+                        max_wait=float(os.environ.get('MATCH_MAX_WAIT', 60)))
+live_matches: Dict[str, asyncio.Task] = {}
+metrics.gauge('matchmaking_waiting_players', "Players waiting for an opponent", ('game_type',),
+              fn=matchmaker.waiting)
+metrics.gauge('live_matches_active', "Head-to-head matches in progress", fn=lambda: len(live_matches))
+metrics.counter('live_matches_total', "Head-to-head matches started", fn=lambda: matchmaker.matched)
+metrics.counter('matchmaking_timeouts_total', "Players who waited MATCH_MAX_WAIT without an opponent",
+                fn=lambda: matchmaker.timed_out)
+
+# Daily challenge: each UTC day's rounds are seeded by the date, built ahead by a
+# scheduler job and served as pre-rendered bytes; the top results are kept in
+# every worker and updated through the cache bus
+daily_challenges = DailyChallenges(lambda day, rng: new_daily_rounds(day, rng),
+                                   os.environ.get('DAILY_CHALLENGE_SECRET', JWT_SECRET))
+DAILY_SUBMIT_GRACE_SECONDS = float(os.environ.get('DAILY_SUBMIT_GRACE_SECONDS', 600))
+DAILY_PUZZLE_SECONDS = 60
+daily_leaderboard = DailyLeaderboard(storage.daily_top, size=int(os.environ.get('DAILY_LEADERBOARD_SIZE', 100)))
+cache_bus.subscribe(daily_leaderboard.on_event)
+metrics.counter('daily_challenges_built_total', "Daily challenges generated by this worker",
+                fn=lambda: daily_challenges.built)
+metrics.counter('daily_leaderboard_loads_total', "Daily leaderboards read from storage by this worker",
+                fn=lambda: daily_leaderboard.loads)
+
+# Retention: scores older than RETENTION_DAYS move to daily rollups and monthly
+# archive files (SQLite only; 0 keeps every raw score)
+RETENTION_DAYS = float(os.environ.get('RETENTION_DAYS', 0))
+retention = None
+if RETENTION_DAYS and DATABASE_PATH is not None:
+    retention = RetentionJob(DATABASE_PATH, ROOT_DIR / os.environ.get('ARCHIVE_DIR', 'archive'), RETENTION_DAYS)
+    metrics.counter('retention_archived_scores_total', "Scores moved to the archive by this worker",
+                    fn=lambda: retention.archived)
+
+# Background jobs, on each worker's event loop. Leader jobs run in one worker at a
+# time: whichever holds the lease in SCHEDULER_DB
+scheduler = Scheduler(LeaderLease(ROOT_DIR / os.environ.get('SCHEDULER_DB', 'scheduler.db'),
+                                  ttl=float(os.environ.get('SCHEDULER_LEASE_SECONDS', 15))))
+# Write-behind: this worker's new scores go into the shared sketches, and once more at shutdown
+scheduler.every('percentile_checkpoint', float(os.environ.get('PERCENTILE_CHECKPOINT_SECONDS', 10)),
+                score_percentiles.checkpoint, flush=True)
+# Just past midnight UTC; a request that comes first builds the day itself
+scheduler.every('daily_challenges', daily_challenges.until_refresh, daily_challenges.refresh, jitter=0)
+
+
+async def warm_daily_leaderboard():
+    await daily_leaderboard.body(daily_challenges.current().day)
+
+scheduler.once('daily_leaderboard_warm', warm_daily_leaderboard)
+if retention is not None:
+    scheduler.every('retention', float(os.environ.get('RETENTION_INTERVAL_SECONDS', 3600)), retention.run,
+                    delay=0, leader=True)
+metrics.counter('scheduler_job_runs_total', "Background job runs by job and result (ok, error, skipped)",
+                ('job', 'result'), fn=scheduler.runs)
+metrics.gauge('scheduler_leader', "1 while this worker holds the scheduler's leader lease",
+              fn=lambda: int(scheduler.is_leader))
+
+# Graceful shutdown: new requests get 503 while the ones in flight finish
+SHUTDOWN_DRAIN_SECONDS = float(os.environ.get('SHUTDOWN_DRAIN_SECONDS', 20))
+request_drain = RequestDrain()
+metrics.counter('shutdown_refused_requests_total', "Requests turned away while this worker shut down",
+                fn=lambda: request_drain.refused)
+
 # Security
 security = HTTPBearer(auto_error=False)
+ADMIN_USERNAMES = {name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name.strip()}
+
+# UTC datetimes end in "Z", as pydantic writes them
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by orjson.
+
+    orjson is several times faster than json.dumps and serializes datetimes
+    and dataclasses (UserRecord) itself, so hot endpoints can hand it storage
+    results directly instead of going through pydantic and jsonable_encoder.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
 
 # Create the main app
-app = FastAPI(title="AI Cognitive Platform API")
+app = FastAPI(title="AI Cognitive Platform API", default_response_class=FastJSONResponse)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
 
 @app.get("/")
 async def home():
     return {"message": "Welcome to AI Cognitive Platform API!"}
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=TracedRoute)
 
 # Models
 class User(BaseModel):
@@ -67,52 +278,27 @@ class GameScore(BaseModel):
     ai_baseline_score: int
     ai_baseline_accuracy: float
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    flag: Optional[str] = None  # anti-cheat reasons; flagged scores are not in the user's totals
 
 class GameScoreCreate(BaseModel):
     game_type: str
-    score: int
+    score: int = Field(le=2 ** 31 - 1)  # far above any game's maximum; the detector judges the rest
     accuracy: float
     time_taken: int
 
-# Database initialization
-async def init_database():
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        # Create users table
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                total_games_played INTEGER DEFAULT 0,
-                total_score INTEGER DEFAULT 0
-            )
-        ''')
-        
-        # Create game_scores table
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS game_scores (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                game_type TEXT NOT NULL,
-                score INTEGER NOT NULL,
-                accuracy REAL NOT NULL,
-                time_taken INTEGER NOT NULL,
-                ai_baseline_score INTEGER NOT NULL,
-                ai_baseline_accuracy REAL NOT NULL,
-                timestamp TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Create a guest user if it doesn't exist
-        await db.execute('''
-            INSERT OR IGNORE INTO users (id, username, email, password, created_at)
-            VALUES ('guest', 'Guest', 'guest@example.com', '', ?)
-        ''', (datetime.now(timezone.utc).isoformat(),))
-        
-        await db.commit()
+class MemoryRoundSubmit(BaseModel):
+    recall: List[int] = Field(max_length=MAX_SEQUENCE_LENGTH)
+
+class DailySubmit(BaseModel):
+    day: date
+    answers: List[Any] = Field(max_length=10)  # one per round, in order
+    time_taken: int = Field(ge=1, le=DAY_SECONDS)  # seconds, as the client timed them
+
+def as_utc(value: datetime) -> datetime:
+    """Treat naive datetimes as UTC so they compare with stored timestamps"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
 
 # Authentication helpers
 def hash_password(password: str) -> str:
@@ -129,40 +315,39 @@ def create_jwt_token(user_id: str, username: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+@traced('auth')
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     # If no credentials are provided, return the default Guest user
-    if credentials is None:
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            async with db.execute('SELECT * FROM users WHERE id = ?', ('guest',)) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    return User(
-                        id=row[0], username=row[1], email=row[2],
-                        created_at=datetime.fromisoformat(row[4]),
-                        total_games_played=row[5], total_score=row[6]
-                    )
+    return await user_for_token(credentials.credentials if credentials is not None else None)
 
-    try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+async def user_for_token(token: Optional[str]) -> UserRecord:
+    """The account a bearer token belongs to (the guest without one); raises 401 otherwise"""
+    if token is None:
+        user_id = 'guest'
+    else:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except jwt.PyJWTError:
+            raise HTTPException(status_code=401, detail="Invalid token")
         user_id = payload.get('user_id')
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        
-        async with aiosqlite.connect(DATABASE_PATH) as db:
-            async with db.execute('SELECT * FROM users WHERE id = ?', (user_id,)) as cursor:
-                row = await cursor.fetchone()
-                if row is None:
-                    raise HTTPException(status_code=401, detail="User not found")
-                
-                return User(
-                    id=row[0], username=row[1], email=row[2],
-                    created_at=datetime.fromisoformat(row[4]),
-                    total_games_played=row[5], total_score=row[6]
-                )
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    cached = cache.get('user', user_id)
+    if cached is not None:
+        return cached
+    user = await storage.get_user(user_id)
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    cache.set('user', user_id, user)
+    return user
+
+async def require_admin(current_user: UserRecord = Depends(get_current_user)):
+    if current_user.id == 'guest' or current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
 
 # AI Baseline Data (Simulated for MVP)
 AI_BASELINES = {
@@ -184,8 +369,8 @@ AI_BASELINES = {
 }
 
 # Game Data (Simulated for MVP)
-def get_ai_image_game_data():
-    """Generate AI Image vs Real Image game data"""
+def get_ai_image_game_data(rng: random.Random = random):
+    """Generate AI Image vs Real Image game data (from ``rng``, e.g. a seeded one)"""
     images = [
         {
             "id": 1,
@@ -218,10 +403,10 @@ def get_ai_image_game_data():
             "description": "AI Technology"
         }
     ]
-    return random.sample(images, 3)
+    return rng.sample(images, 3)
 
-def get_text_ai_game_data():
-    """Generate Text vs AI game data"""
+def get_text_ai_game_data(rng: random.Random = random):
+    """Generate Text vs AI game data (from ``rng``, e.g. a seeded one)"""
     texts = [
         {
             "id": 1,
@@ -248,36 +433,40 @@ def get_text_ai_game_data():
             "source": "Human Writer"
         }
     ]
-    return random.sample(texts, 3)
+    return rng.sample(texts, 3)
 
-def get_memory_game_data(difficulty: int = 1):
-    """Generate Memory Challenge game data"""
-    sequence_length = 4 + (difficulty * 2)  # Start with 4, increase by 2 per difficulty
-    sequence = [random.randint(1, 9) for _ in range(sequence_length)]
-    return {"sequence": sequence, "difficulty": difficulty}
+async def get_memory_game_data(user_id: str, difficulty: int = 1):
+    """Issue a Memory Challenge round; the sequence stays on the server for scoring"""
+    sequence = new_sequence(difficulty)  # 4 + 2 per difficulty level
+    try:
+        round_id = await memory_rounds.issue(user_id, sequence, difficulty)
+    except RoundStoreFull:
+        raise HTTPException(status_code=503, detail="Too many memory rounds in progress",
+                            headers={"Retry-After": "5"})
+    return {"round_id": round_id, "sequence": sequence, "difficulty": difficulty,
+            "time_limit": answer_seconds(len(sequence))}
 
 # New Game Functions
-def generate_logical_puzzle(difficulty: int = 1):
-    """Generate logical reasoning puzzles"""
+def generate_logical_puzzle(difficulty: int = 1, rng: random.Random = random):
+    """Generate logical reasoning puzzles (difficulty 1-3 scales the number sequences)"""
     puzzle_types = ['number_sequence', 'pattern_matching', 'logic_grid']
-    puzzle_type = random.choice(puzzle_types)
+    puzzle_type = rng.choice(puzzle_types)
     
     if puzzle_type == 'number_sequence':
-        # Generate arithmetic or geometric sequences
-        if random.choice([True, False]):
-            # Arithmetic sequence
-            start = random.randint(1, 10)
-            diff = random.randint(2, 8)
-            sequence = [start + i * diff for i in range(5)]
-            answer = sequence[-1] + diff
-            question = f"What is the next number in this sequence: {', '.join(map(str, sequence[:-1]))}?"
+        # Generate arithmetic or geometric sequences; harder ones have larger steps
+        if rng.choice([True, False]):
+            # Arithmetic sequence; on hard the step itself grows by one each term
+            start = rng.randint(1, 10 * difficulty)
+            diff = rng.randint(2, 4 + 4 * difficulty)
+            growth = 1 if difficulty >= 3 else 0
+            sequence = [start + i * diff + growth * i * (i - 1) // 2 for i in range(5)]
         else:
             # Geometric sequence
-            start = random.randint(2, 5)
-            ratio = random.randint(2, 3)
-            sequence = [start * (ratio ** i) for i in range(4)]
-            answer = sequence[-1] * ratio
-            question = f"What is the next number in this sequence: {', '.join(map(str, sequence))}?"
+            start = rng.randint(2, 5)
+            ratio = rng.randint(2, 2 + difficulty)
+            sequence = [start * (ratio ** i) for i in range(5)]
+        answer = sequence[-1]
+        question = f"What is the next number in this sequence: {', '.join(map(str, sequence[:-1]))}?"
         
         return {
             "id": str(uuid.uuid4()),
@@ -294,7 +483,7 @@ def generate_logical_puzzle(difficulty: int = 1):
             {"pattern": "AABB", "next": "A", "options": ["A", "B", "C", "D"]},
             {"pattern": "ABCD", "next": "A", "options": ["A", "B", "C", "D"]},
         ]
-        pattern_data = random.choice(patterns)
+        pattern_data = rng.choice(patterns)
         return {
             "id": str(uuid.uuid4()),
             "type": "pattern_matching",
@@ -319,7 +508,7 @@ def generate_logical_puzzle(difficulty: int = 1):
                 "answer": "Alice"
             }
         ]
-        puzzle = random.choice(logic_puzzles)
+        puzzle = rng.choice(logic_puzzles)
         return {
             "id": str(uuid.uuid4()),
             "type": "logic_grid",
@@ -440,114 +629,478 @@ def analyze_image_authenticity(image_data):
 async def root():
     return {"message": "AI Cognitive Platform API", "version": "1.0.0"}
 
+async def names_taken(username: Optional[str], email: Optional[str]) -> bool:
+    # Names the filters rule out need no query; a "maybe" is settled by the unique indexes
+    maybe_username = taken_names.might_be_taken('username', username)
+    maybe_email = taken_names.might_be_taken('email', email)
+    if not (maybe_username or maybe_email):
+        return False
+    return await storage.user_exists(username if maybe_username else None, email if maybe_email else None)
+
 @api_router.post("/auth/register")
 async def register(user_data: UserCreate):
-    # Check if user exists
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        async with db.execute('SELECT id FROM users WHERE username = ? OR email = ?', 
-                             (user_data.username, user_data.email)) as cursor:
-            if await cursor.fetchone():
-                raise HTTPException(status_code=400, detail="Username or email already exists")
-        
-        # Create user
-        hashed_password = hash_password(user_data.password)
-        user_id = str(uuid.uuid4())
-        created_at = datetime.now(timezone.utc).isoformat()
-        
-        await db.execute('''
-            INSERT INTO users (id, username, email, password, created_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, user_data.username, user_data.email, hashed_password, created_at))
-        await db.commit()
-        
-        token = create_jwt_token(user_id, user_data.username)
-        user = User(id=user_id, username=user_data.username, email=user_data.email, 
-                   created_at=datetime.fromisoformat(created_at))
-        
-        return {"message": "User created successfully", "token": token, "user": user}
+    # Turn away taken names before paying for bcrypt; the insert still decides races
+    if await names_taken(user_data.username, user_data.email):
+        raise HTTPException(status_code=400, detail="Username or email already exists")
+
+    # Create user
+    hashed_password = await password_executor.run(hash_password, user_data.password)
+    user = User(username=user_data.username, email=user_data.email)
+    try:
+        await storage.create_user(user.model_dump(), hashed_password)
+    except DuplicateUserError:
+        raise HTTPException(status_code=400, detail="Username or email already exists")
+    await cache_bus.publish('taken_username', user.username)
+    await cache_bus.publish('taken_email', user.email)
+
+    token = create_jwt_token(user.id, user.username)
+    return {"message": "User created successfully", "token": token, "user": user}
+
+@api_router.get("/auth/available")
+async def check_available(username: Optional[str] = None, email: Optional[str] = None):
+    if username is None and email is None:
+        raise HTTPException(status_code=400, detail="Pass a username, an email, or both")
+    available = {}
+    if username is not None:
+        available['username'] = not await names_taken(username, None)
+    if email is not None:
+        available['email'] = not await names_taken(None, email)
+    return {"available": available}
 
 @api_router.post("/auth/login")
 async def login(login_data: UserLogin):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        async with db.execute('SELECT * FROM users WHERE username = ?', (login_data.username,)) as cursor:
-            row = await cursor.fetchone()
-            if not row or not verify_password(login_data.password, row[3]):
-                raise HTTPException(status_code=401, detail="Invalid credentials")
-            
-            token = create_jwt_token(row[0], row[1])
-            user = User(
-                id=row[0], username=row[1], email=row[2],
-                created_at=datetime.fromisoformat(row[4]),
-                total_games_played=row[5], total_score=row[6]
-            )
-            
-            return {"message": "Login successful", "token": token, "user": user}
+    credentials = await storage.get_user_credentials(login_data.username)
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    user, password_hash = credentials
+    if not await password_executor.run(verify_password, login_data.password, password_hash):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    token = create_jwt_token(user.id, user.username)
+
+    return FastJSONResponse({"message": "Login successful", "token": token, "user": user})
 
 @api_router.get("/auth/me")
-async def get_current_user_profile(current_user: User = Depends(get_current_user)):
-    return current_user
+async def get_current_user_profile(current_user: UserRecord = Depends(get_current_user)):
+    # Returning a response skips FastAPI's jsonable_encoder pass over the result
+    return FastJSONResponse(current_user)
 
 @api_router.get("/games/ai-image/data")
-async def get_ai_image_data(current_user: User = Depends(get_current_user)):
+async def get_ai_image_data(current_user: UserRecord = Depends(get_current_user)):
     return {"images": get_ai_image_game_data()}
 
 @api_router.get("/games/text-ai/data")
-async def get_text_ai_data(current_user: User = Depends(get_current_user)):
+async def get_text_ai_data(current_user: UserRecord = Depends(get_current_user)):
     return {"texts": get_text_ai_game_data()}
 
 @api_router.get("/games/memory/data")
-async def get_memory_data(difficulty: int = 1, current_user: User = Depends(get_current_user)):
-    return get_memory_game_data(difficulty)
+async def get_memory_data(current_user: UserRecord = Depends(get_current_user)):
+    # The difficulty comes from the player's rating, not the client
+    rating = await skill_model.get(current_user.id, 'memory_challenge')
+    return await get_memory_game_data(current_user.id, skill_model.next_level('memory_challenge', rating))
 
-@api_router.post("/games/score")
-async def submit_game_score(score_data: GameScoreCreate, current_user: User = Depends(get_current_user)):
-    # Get AI baseline for comparison
-    baseline = AI_BASELINES.get(score_data.game_type, {})
+@api_router.post("/games/memory/rounds/{round_id}")
+async def submit_memory_round(round_id: str, submission: MemoryRoundSubmit,
+                              current_user: UserRecord = Depends(get_current_user)):
+    memory_round = await memory_rounds.peek(round_id, current_user.id)
+    if memory_round is None:
+        raise HTTPException(status_code=404, detail="Round not found, expired or already submitted")
+    try:
+        result = score_recall(memory_round, submission.recall, memory_rounds.clock() - memory_round.issued_at)
+    except ImplausibleRecall:
+        # The round stays open: a rejected recall does not use it up
+        raise HTTPException(status_code=422, detail="Recall submitted faster than the sequence can be shown")
+    # Only one submission of a round gets it, whichever worker it reached
+    if await memory_rounds.take(round_id, current_user.id) is None:
+        raise HTTPException(status_code=404, detail="Round not found, expired or already submitted")
+
+    percentile = score_percentiles.percentile('memory_challenge', result.score)
+    # The shared guest account is not rated
+    play = (lambda rating: skill_model.play('memory_challenge', rating, memory_round.difficulty,
+                                            float(result.completed))) if current_user.id != 'guest' else None
+    ai_baseline_score, unlocked, new_rating = await record_game_score(
+        current_user.id, 'memory_challenge', result.score, result.accuracy, result.time_taken, play=play)
+    return {
+        "correct": result.correct,
+        "completed": result.completed,
+        "timed_out": result.timed_out,
+        "score": result.score,
+        "accuracy": result.accuracy,
+        "time_taken": result.time_taken,
+        "ai_baseline": ai_baseline_score,
+        "percentile": percentile,
+        "next_difficulty": skill_model.next_level('memory_challenge', new_rating or SkillRating()),
+        "achievements_unlocked": unlocked,
+    }
+
+async def record_game_score(user_id: str, game_type: str, score: int, accuracy: float, time_taken: int,
+                            flag: Optional[str] = None,
+                            play: Optional[Callable[[SkillRating], SkillRating]] = None):
+    """Store a score with its AI baseline and update the user's totals (and skill rating, as
+    ``play`` moves the current one, and achievement progress, in the same transaction); returns
+    the baseline score, the achievements unlocked and the new rating"""
+    baseline = AI_BASELINES.get(game_type, {})
     ai_baseline_accuracy = baseline.get('accuracy', 80.0)
-    ai_baseline_score = int(score_data.score * (ai_baseline_accuracy / 100) * baseline.get('score_multiplier', 100) / 100)
+    ai_baseline_score = int(score * (ai_baseline_accuracy / 100) * baseline.get('score_multiplier', 100) / 100)
     
-    # Create game score record
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        score_id = str(uuid.uuid4())
-        timestamp = datetime.now(timezone.utc).isoformat()
-        
-        await db.execute('''
-            INSERT INTO game_scores (id, user_id, game_type, score, accuracy, time_taken, 
-                                   ai_baseline_score, ai_baseline_accuracy, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (score_id, current_user.id, score_data.game_type, score_data.score,
-              score_data.accuracy, score_data.time_taken, ai_baseline_score,
-              ai_baseline_accuracy, timestamp))
-        
-        # Update user stats
-        await db.execute('''
-            UPDATE users SET total_games_played = total_games_played + 1,
-                           total_score = total_score + ?
-            WHERE id = ?
-        ''', (score_data.score, current_user.id))
-        
-        await db.commit()
+    # Create game score record and update user stats
+    game_score = GameScore(
+        user_id=user_id,
+        game_type=game_type,
+        score=score,
+        accuracy=accuracy,
+        time_taken=time_taken,
+        ai_baseline_score=ai_baseline_score,
+        ai_baseline_accuracy=ai_baseline_accuracy,
+        flag=flag
+    )
+    document = game_score.model_dump()
+    rating, state, unlocked = None, None, []
+    for attempt in range(3):
+        if play is not None:
+            rating = play(await skill_model.get(user_id, game_type))
+        if user_id != 'guest' and flag is None:
+            state, unlocked = achievement_tracker.apply(await achievement_tracker.get(user_id), document)
+        try:
+            await storage.record_score(document, [rating.to_row(user_id, game_type)] if rating else (),
+                                       [state.to_row(user_id)] if state is not None else ())
+            break
+        except StaleProgressError:
+            # Another worker saved this player's progress first: start again from theirs
+            achievement_tracker.forget(user_id)
+        except StaleRatingError:
+            # Or their rating: play the round again against theirs
+            skill_model.forget(user_id, game_type)
+    else:
+        raise HTTPException(status_code=503, detail="Score not recorded, please retry")
+    if state is not None:
+        achievement_tracker.remember(user_id, state)
+    if rating is not None:
+        # Published first, since it also drops the rating from this worker's cache
+        await cache_bus.publish(SkillModel.CHANNEL, SkillModel.encode(user_id, game_type))
+        skill_model.remember(user_id, game_type, rating)
+    if flag is None:
+        score_percentiles.add(game_type, score)
+
+    # Totals changed: drop this user's cached profile and the leaderboard in every worker
+    await cache_bus.publish('user', user_id)
+    await cache_bus.publish('leaderboard')
+    return ai_baseline_score, [achievement.id for achievement in unlocked], rating
+
+@api_router.post("/games/score")
+async def submit_game_score(score_data: GameScoreCreate, current_user: UserRecord = Depends(get_current_user)):
+    if score_data.game_type not in GAME_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown game_type, expected one of {', '.join(GAME_TYPES)}")
+    if score_data.game_type == 'memory_challenge':
+        raise HTTPException(status_code=400,
+                            detail="Memory challenge rounds are scored by the server: POST /api/games/memory/rounds/{round_id}")
+    # The shared guest account gets the per-game checks only
+    verdict = score_detector.check(None if current_user.id == 'guest' else current_user.id, score_data.game_type,
+                                   score_data.score, score_data.accuracy, score_data.time_taken)
+    # Ranked against the scores before this one
+    percentile = score_percentiles.percentile(score_data.game_type, score_data.score)
+    ai_baseline_score, unlocked, _ = await record_game_score(current_user.id, score_data.game_type,
+                                                             score_data.score, score_data.accuracy,
+                                                             score_data.time_taken, flag=verdict.flag)
     
     return {
-        "message": "Score submitted successfully",
+        "message": "Score submitted successfully" if verdict.action == ACCEPT else "Score held for review",
+        "status": verdict.action,
         "your_score": score_data.score,
         "ai_baseline": ai_baseline_score,
-        "performance": "Better than AI" if score_data.score > ai_baseline_score else "AI performed better"
+        "performance": "Better than AI" if score_data.score > ai_baseline_score else "AI performed better",
+        "percentile": percentile,
+        "achievements_unlocked": unlocked,
+    }
+
+# Live matches: both players get the same round, scored and timed by the server
+MATCH_SECONDS_PER_ITEM = 8
+
+
+def new_match_round(game_type: str, rating: float) -> MatchRound:
+    """One round of ``game_type`` for two players rated about ``rating``, with its answer key kept here"""
+    if game_type == 'memory_challenge':
+        difficulty = skill_model.next_level(game_type, SkillRating(rating))
+        sequence = new_sequence(difficulty)
+        memory_round = MemoryRound(bytes(sequence), difficulty, 0.0)
+
+        def score(recall, elapsed):
+            recall = recall[:len(sequence)] if isinstance(recall, list) else []
+            try:
+                result = score_recall(memory_round, recall, elapsed)
+            except ImplausibleRecall:
+                return 0, 0.0, max(1, round(elapsed))
+            return result.score, result.accuracy, result.time_taken
+        return MatchRound({"sequence": sequence, "difficulty": difficulty},
+                          show_seconds(len(sequence)) + answer_seconds(len(sequence)), score)
+
+    items = get_ai_image_game_data() if game_type == 'ai_image' else get_text_ai_game_data()
+    key = [item['is_ai'] for item in items]
+    time_limit = MATCH_SECONDS_PER_ITEM * len(items)
+
+    def score(guesses, elapsed):
+        # One guess (is it AI?) per item, in order; a clean sweep earns 10 per second left
+        guesses = guesses if isinstance(guesses, list) else []
+        correct = sum(1 for guess, is_ai in zip(guesses, key) if guess is is_ai)
+        bonus = max(0, int(time_limit - elapsed)) * 10 if correct == len(key) else 0
+        return correct * 100 + bonus, round(correct / len(key) * 100, 1), max(1, round(elapsed))
+    return MatchRound({"items": [{k: v for k, v in item.items() if k not in ('is_ai', 'source')} for item in items]},
+                      time_limit, score)
+
+
+def start_live_match(game_type: str, first: Ticket, second: Ticket) -> LiveMatch:
+    match = LiveMatch(str(uuid.uuid4()), game_type, (first, second),
+                      new_match_round(game_type, (first.rating + second.rating) / 2))
+    task = asyncio.create_task(match.run(record_live_match))
+    live_matches[match.id] = task
+    task.add_done_callback(lambda _: live_matches.pop(match.id, None))
+    return match
+
+
+async def record_live_match(match: LiveMatch, results: List[PlayerResult]) -> Dict[str, Dict[str, Any]]:
+    """Save both scores with the players' ratings updated for the result; returns each player's new rating"""
+    if not any(result.answered for result in results):
+        return {}  # both gone: no game to record
+    winner = match_winner(results)
+    now = time.time()
+    extra = {}
+    for result, other in zip(results, reversed(results)):
+        user_id = result.ticket.user_id
+        outcome = 0.5 if winner is None else float(winner == user_id)
+        # Against the opponent's rating before this match, as the pairing saw it
+        _, unlocked, rating = await record_game_score(
+            user_id, match.game_type, result.score, result.accuracy, result.time_taken,
+            play=lambda rating: rating.play(other.ticket.rating, outcome, now))
+        extra[user_id] = {"rating": round(rating.rating), "achievements_unlocked": unlocked}
+    return extra
+
+
+@api_router.websocket("/matches/ws")
+async def live_match_socket(websocket: WebSocket, token: Optional[str] = None):
+    # Browsers cannot set headers on a WebSocket, so the token comes in the query string
+    try:
+        user = await user_for_token(token)
+    except HTTPException:
+        user = None
+    if user is None or user.id == 'guest':
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    try:
+        await play_live_match(websocket, user)
+    except WebSocketDisconnect:
+        return
+    await websocket.close()
+
+
+async def play_live_match(websocket: WebSocket, user: UserRecord):
+    """Queue the player for the game in their join message, then relay their answer to the match"""
+    message = await websocket.receive_json()
+    game_type = message.get('game_type') if isinstance(message, dict) and message.get('type') == 'join' else None
+    if game_type not in GAME_TYPES:
+        await websocket.send_json({"type": "error", "detail": f"Send {{\"type\": \"join\", \"game_type\": ...}} "
+                                                              f"with one of {', '.join(GAME_TYPES)}"})
+        return
+    rating = await skill_model.get(user.id, game_type)
+    try:
+        pairing = matchmaker.join(game_type, user.id, rating.rating, user.username)
+    except AlreadyQueued:
+        await websocket.send_json({"type": "error", "detail": "Already waiting for a match"})
+        return
+    except MatchmakingFull:
+        await websocket.send_json({"type": "error", "detail": "Too many players waiting, try again shortly"})
+        return
+    await websocket.send_json({"type": "queued", "game_type": game_type, "rating": round(rating.rating)})
+
+    match = None
+    receiver = asyncio.ensure_future(websocket.receive_json())
+    try:
+        # Waiting: the only thing the client can do is leave (or drop)
+        await asyncio.wait((pairing, receiver), return_when=asyncio.FIRST_COMPLETED)
+        if not pairing.done():
+            matchmaker.leave(user.id)
+            receiver.result()  # re-raises a disconnect
+            return
+        if not pairing.cancelled() and isinstance(pairing.exception(), NoOpponent):
+            await websocket.send_json({"type": "no_opponent", "game_type": game_type,
+                                       "detail": "No opponent found, try again later"})
+            return
+        if pairing.cancelled() or pairing.exception() is not None:
+            await websocket.send_json({"type": "error", "detail": "Matchmaking stopped, try again shortly"})
+            return
+        match = pairing.result()
+        opponent = match.opponent(user.id)
+        await websocket.send_json({"type": "matched", "match_id": match.id, "game_type": game_type,
+                                   "opponent": {"username": opponent.name, "rating": round(opponent.rating)}})
+        match.attach(user.id, websocket.send_json)
+        finished = asyncio.ensure_future(match.finished.wait())
+        try:
+            while not match.finished.is_set():
+                await asyncio.wait((receiver, finished), return_when=asyncio.FIRST_COMPLETED)
+                if receiver.done():
+                    message = receiver.result()
+                    if isinstance(message, dict) and message.get('type') == 'answer':
+                        match.answer(user.id, message.get('answer'))
+                    receiver = asyncio.ensure_future(websocket.receive_json())
+        finally:
+            finished.cancel()
+    finally:
+        receiver.cancel()
+        matchmaker.leave(user.id)
+        if match is not None:
+            match.forfeit(user.id)  # a no-op once answered or over
+
+# Daily challenge: the same rounds for everyone each UTC day, built ahead and served as bytes
+DAILY_ROUND_POINTS = 300
+
+
+def daily_guess_round(game_type: str, items: List[Dict[str, Any]]) -> DailyRound:
+    key = [item['is_ai'] for item in items]
+
+    def score(guesses):
+        # One guess (is it AI?) per item, in order
+        guesses = guesses if isinstance(guesses, list) else []
+        correct = sum(1 for guess, is_ai in zip(guesses, key) if guess is is_ai)
+        return DAILY_ROUND_POINTS * correct // len(key), round(correct / len(key) * 100, 1)
+    return DailyRound(game_type, {"items": [{k: v for k, v in item.items() if k not in ('is_ai', 'source')}
+                                            for item in items]},
+                      MATCH_SECONDS_PER_ITEM * len(items), score)
+
+
+def new_daily_rounds(day: date, rng: random.Random) -> List[DailyRound]:
+    """A day's rounds, drawn from its seeded ``rng``; harder through the week (level 1 on Monday to 3 on Sunday)"""
+    difficulty = 1 + day.weekday() // 3
+    images = get_ai_image_game_data(rng)
+    texts = get_text_ai_game_data(rng)
+    sequence = new_sequence(difficulty, rng)
+    puzzle = generate_logical_puzzle(difficulty, rng)
+
+    def recall_score(recall):
+        # As in a memory round, the recall ends at the first wrong item
+        recall = recall if isinstance(recall, list) else []
+        correct = 0
+        for expected, given in zip(sequence, recall):
+            if expected != given:
+                break
+            correct += 1
+        return DAILY_ROUND_POINTS * correct // len(sequence), round(correct / len(sequence) * 100, 1)
+
+    def puzzle_score(answer):
+        correct = answer is not None and str(answer).strip().lower() == str(puzzle['answer']).lower()
+        return (DAILY_ROUND_POINTS, 100.0) if correct else (0, 0.0)
+
+    return [
+        daily_guess_round('ai_image', images),
+        daily_guess_round('text_ai', texts),
+        DailyRound('memory_challenge', {"sequence": sequence, "difficulty": difficulty},
+                   int(show_seconds(len(sequence))) + answer_seconds(len(sequence)), recall_score),
+        DailyRound('logical_reasoning', {"puzzle": {k: v for k, v in puzzle.items() if k not in ('id', 'answer')}},
+                   DAILY_PUZZLE_SECONDS, puzzle_score),
+    ]
+
+
+@api_router.get("/daily")
+async def get_daily_challenge(if_none_match: Optional[str] = Header(None)):
+    # No auth and no storage: the same pre-rendered bytes for everyone until midnight UTC
+    challenge = daily_challenges.current()
+    headers = {"ETag": challenge.etag, "Cache-Control": f"public, max-age={int(daily_challenges.seconds_left())}"}
+    if if_none_match == challenge.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(challenge.body, media_type="application/json", headers=headers)
+
+
+@api_router.post("/daily/submit")
+async def submit_daily_challenge(submission: DailySubmit, current_user: UserRecord = Depends(get_current_user)):
+    if current_user.id == 'guest':
+        raise HTTPException(status_code=401, detail="Sign in to play the daily challenge")
+    today = daily_challenges.current().day
+    # Yesterday's challenge still takes results for a few minutes after midnight
+    just_closed = (submission.day == today - timedelta(days=1)
+                   and DAY_SECONDS - daily_challenges.seconds_left() <= DAILY_SUBMIT_GRACE_SECONDS)
+    if submission.day != today and not just_closed:
+        raise HTTPException(status_code=400, detail="That day's challenge is closed")
+    challenge = daily_challenges.get(submission.day)
+    result = challenge.score(submission.answers)
+    now = datetime.now(timezone.utc)
+    entry = {
+        "user_id": current_user.id,
+        "username": current_user.username,
+        "score": result.score,
+        "accuracy": result.accuracy,
+        "time_taken": submission.time_taken,
+        # Milliseconds, as MongoDB keeps them, so every worker's board breaks ties alike
+        "submitted_at": now.replace(microsecond=now.microsecond // 1000 * 1000),
+    }
+    stored = {key: value for key, value in entry.items() if key != 'username'}
+    if not await storage.record_daily_result(dict(stored, day=challenge.day)):
+        raise HTTPException(status_code=409, detail="You have already played this day's challenge")
+    # Every worker's board takes it from the bus (this one straight away); results
+    # below a full board change nothing, so they are not sent
+    if daily_leaderboard.admits(challenge.day, entry):
+        await cache_bus.publish(DailyLeaderboard.CHANNEL, DailyLeaderboard.encode(challenge.day, entry))
+    return {
+        "day": challenge.day,
+        "score": result.score,
+        "max_score": DAILY_ROUND_POINTS * len(challenge.rounds),
+        "accuracy": result.accuracy,
+        "rounds": result.rounds,
     }
 
+
+@api_router.get("/daily/leaderboard")
+async def get_daily_leaderboard(day: Optional[date] = None):
+    today = daily_challenges.current().day
+    day = day or today
+    if not today - timedelta(days=daily_leaderboard.days) < day <= today:
+        raise HTTPException(status_code=400,
+                            detail=f"day must be within the last {daily_leaderboard.days} days (UTC)")
+    return Response(await daily_leaderboard.body(day), media_type="application/json")
+
+
+@api_router.get("/daily/result")
+async def get_own_daily_result(day: Optional[date] = None, current_user: UserRecord = Depends(get_current_user)):
+    result = await storage.get_daily_result(day or daily_challenges.current().day, current_user.id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No daily challenge result for that day")
+    return FastJSONResponse(result)
+
+# Calendar windows in UTC, each starting at midnight
+LEADERBOARD_WINDOWS = ('day', 'week', 'month')
+
+
+def leaderboard_window_start(window: str, now: datetime) -> datetime:
+    start = now.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == 'week':
+        return start - timedelta(days=start.weekday())
+    if window == 'month':
+        return start.replace(day=1)
+    return start
+
+
 @api_router.get("/leaderboard")
-async def get_leaderboard():
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        async with db.execute('SELECT * FROM users ORDER BY total_score DESC LIMIT 10') as cursor:
-            rows = await cursor.fetchall()
-            human_leaders = [
-                User(
-                    id=row[0], username=row[1], email=row[2],
-                    created_at=datetime.fromisoformat(row[4]),
-                    total_games_played=row[5], total_score=row[6]
-                ) for row in rows if row[0] != 'guest'
-            ]
-    
+async def get_leaderboard(window: Optional[str] = None):
+    if window is not None and window not in LEADERBOARD_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of: {', '.join(LEADERBOARD_WINDOWS)}")
+    since = None if window is None else leaderboard_window_start(window, datetime.now(timezone.utc))
+    # Cached as rendered JSON: a hit is a dict lookup and a bytes response. Keyed by the
+    # window's start too, so a new day or week never serves the previous one
+    key = None if window is None else (window, since)
+    cached = cache.get('leaderboard', key)
+    if cached is not None:
+        return Response(cached, media_type="application/json")
+
+    if since is not None:
+        # Summed from the window's scores; on the partitioned layout this reads only its months
+        body = orjson.dumps({
+            "window": window,
+            "since": since,
+            "human_leaders": await storage.window_top_users(since, limit=10),
+        }, option=ORJSON_OPTIONS)
+        cache.set('leaderboard', key, body)
+        return Response(body, media_type="application/json")
+
+    human_leaders = await storage.top_users(10)
+
     # Simulated AI baselines for leaderboard
     ai_baselines = [
         {"name": "GPT-5", "total_score": 8750, "games_played": 100, "is_ai": True},
@@ -555,41 +1108,101 @@ async def get_leaderboard():
         {"name": "Gemini 2.5 Pro", "total_score": 8340, "games_played": 100, "is_ai": True}
     ]
     
-    return {
+    leaderboard = {
         "human_leaders": human_leaders,
         "ai_baselines": ai_baselines
     }
+    body = orjson.dumps(leaderboard, option=ORJSON_OPTIONS)
+    cache.set('leaderboard', None, body)
+    return Response(body, media_type="application/json")
 
 @api_router.get("/stats/user")
-async def get_user_stats(current_user: User = Depends(get_current_user)):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        async with db.execute('SELECT * FROM game_scores WHERE user_id = ?', (current_user.id,)) as cursor:
-            rows = await cursor.fetchall()
-            
-            # Calculate stats by game type
-            stats = {}
-            for game_type in ['ai_image', 'text_ai', 'memory_challenge']:
-                type_scores = [row for row in rows if row[2] == game_type]  # game_type is index 2
-                if type_scores:
-                    avg_accuracy = sum(row[4] for row in type_scores) / len(type_scores)  # accuracy is index 4
-                    avg_time = sum(row[5] for row in type_scores) / len(type_scores)  # time_taken is index 5
-                    best_score = max(row[3] for row in type_scores)  # score is index 3
-                    games_played = len(type_scores)
-                else:
-                    avg_accuracy = avg_time = best_score = games_played = 0
-                    
-                stats[game_type] = {
-                    "games_played": games_played,
-                    "avg_accuracy": round(avg_accuracy, 1),
-                    "avg_time": round(avg_time, 1),
-                    "best_score": best_score
-                }
-            
-            return {"user_stats": stats, "total_games": len(rows)}
+async def get_user_stats(current_user: UserRecord = Depends(get_current_user)):
+    # Aggregated per game type by the database, not by scanning rows here
+    per_game = await storage.user_game_stats(current_user.id)
+
+    stats = {}
+    for game_type in GAME_TYPES:
+        game_stats = per_game.get(game_type) or empty_game_stats()
+        stats[game_type] = {
+            "games_played": game_stats["games_played"],
+            "avg_accuracy": round(game_stats["avg_accuracy"], 1),
+            "avg_time": round(game_stats["avg_time"], 1),
+            "best_score": game_stats["best_score"]
+        }
+
+    return {"user_stats": stats, "total_games": sum(g["games_played"] for g in per_game.values())}
+
+@api_router.get("/achievements")
+async def get_achievements(current_user: UserRecord = Depends(get_current_user)):
+    state = await achievement_tracker.get(current_user.id)
+    achievements = achievement_tracker.rules.progress(state)
+    return {"achievements": achievements,
+            "unlocked": sum(1 for achievement in achievements if achievement["unlocked_at"] is not None)}
+
+def get_analytics():
+    global analytics
+    if analytics is None:
+        from analytics import ScoreAnalytics
+        analytics = ScoreAnalytics(DATABASE_PATH, ANALYTICS_SNAPSHOT)
+    return analytics
+
+@api_router.get("/stats/global")
+async def get_global_stats(bucket: str = 'day', days: int = Query(30, ge=1, le=3650)):
+    from analytics import TREND_BUCKETS
+
+    if bucket not in TREND_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of: {', '.join(TREND_BUCKETS)}")
+    if DATABASE_PATH is None:
+        raise HTTPException(status_code=501, detail="Global stats require the SQLite storage backend")
+    
+    snapshot = get_analytics()
+    if time.monotonic() - snapshot.refreshed_at > ANALYTICS_REFRESH_SECONDS:
+        async with analytics_refresh_lock:
+            if time.monotonic() - snapshot.refreshed_at > ANALYTICS_REFRESH_SECONDS:
+                await asyncio.to_thread(snapshot.refresh)
+    return snapshot.summary(bucket, days)
+
+def encode_history_cursor(timestamp: datetime, score_id: str) -> str:
+    raw = json.dumps([timestamp.isoformat(), score_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_history_cursor(cursor: str):
+    try:
+        timestamp, score_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        # Score ids are uuids; the compact layout compares them as such
+        return as_utc(datetime.fromisoformat(timestamp)), str(uuid.UUID(score_id))
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@api_router.get("/stats/user/history")
+async def get_user_score_history(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    game_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: UserRecord = Depends(get_current_user)
+):
+    # Keyset pagination on (timestamp, id), newest first: every page is an
+    # index range scan, so deep pages cost the same as the first one.
+    records = await storage.score_history(
+        current_user.id, limit + 1, game_type=game_type,
+        since=as_utc(since) if since else None,
+        until=as_utc(until) if until else None,
+        before=decode_history_cursor(cursor) if cursor is not None else None
+    )
+    page = records[:limit]
+    scores = [GameScore(**record) for record in page]
+    next_cursor = encode_history_cursor(page[-1]['timestamp'], page[-1]['id']) if len(records) > limit else None
+    return {"scores": scores, "next_cursor": next_cursor}
 
 # New Game API Endpoints
 @api_router.get("/games/logical-reasoning/data")
-async def get_logical_reasoning_data(difficulty: int = 1, current_user: User = Depends(get_current_user)):
+async def get_logical_reasoning_data(difficulty: int = Query(1, ge=1, le=3),
+                                     current_user: UserRecord = Depends(get_current_user)):
+    # Not rated yet, so the client still picks the difficulty: the submit endpoint below does
+    # not grade answers, and a rating needs real outcomes. Give it a skill.LADDERS entry then.
     puzzle = generate_logical_puzzle(difficulty)
     ai_solution = solve_logical_puzzle_ai(puzzle)
     return {
@@ -602,7 +1215,7 @@ async def submit_logical_reasoning_answer(
     puzzle_id: str, 
     user_answer: str, 
     time_taken: int,
-    current_user: User = Depends(get_current_user)
+    current_user: UserRecord = Depends(get_current_user)
 ):
     # In a real implementation, you'd retrieve the puzzle by ID and validate
     # For now, we'll simulate the scoring
@@ -618,7 +1231,7 @@ async def submit_logical_reasoning_answer(
     }
 
 @api_router.get("/games/creative-writing/prompt")
-async def get_creative_writing_prompt(current_user: User = Depends(get_current_user)):
+async def get_creative_writing_prompt(current_user: UserRecord = Depends(get_current_user)):
     return get_creative_writing_prompts()
 
 @api_router.post("/games/creative-writing/submit")
@@ -626,7 +1239,7 @@ async def submit_creative_writing(
     prompt_id: str,
     user_writing: str,
     time_taken: int,
-    current_user: User = Depends(get_current_user)
+    current_user: UserRecord = Depends(get_current_user)
 ):
     # Generate AI writing for comparison
     # In production, extract the original prompt and generate AI response
@@ -647,7 +1260,7 @@ async def submit_creative_writing(
     }
 
 @api_router.get("/games/audio-recognition/data")
-async def get_audio_recognition_data(current_user: User = Depends(get_current_user)):
+async def get_audio_recognition_data(current_user: UserRecord = Depends(get_current_user)):
     return {"audio_clips": generate_audio_clips()}
 
 @api_router.post("/games/audio-recognition/submit")
@@ -655,7 +1268,7 @@ async def submit_audio_recognition_answer(
     audio_id: int,
     user_answer: str,  # "human" or "ai"
     time_taken: int,
-    current_user: User = Depends(get_current_user)
+    current_user: UserRecord = Depends(get_current_user)
 ):
     # In production, validate against the actual audio clip data
     audio_clips = generate_audio_clips()
@@ -676,7 +1289,7 @@ async def submit_audio_recognition_answer(
 @api_router.post("/content-authentication/analyze-image")
 async def analyze_uploaded_image(
     file: bytes,
-    current_user: User = Depends(get_current_user)
+    current_user: UserRecord = Depends(get_current_user)
 ):
     # Analyze the uploaded image for authenticity
     analysis_result = analyze_image_authenticity(file)
@@ -687,9 +1300,139 @@ async def analyze_uploaded_image(
         "model_version": "v2.1.0"
     }
 
+# Admin Endpoints
+@api_router.get("/admin/export/scores")
+async def export_game_scores(
+    format: str = 'ndjson',
+    since: Optional[datetime] = None,
+    include_users: bool = False,
+    admin: UserRecord = Depends(require_admin)
+):
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format, use one of: {', '.join(EXPORT_FORMATS)}")
+    if DATABASE_PATH is None:
+        raise HTTPException(status_code=501, detail="Export requires the SQLite storage backend")
+    
+    watermark, chunks = stream_export(DATABASE_PATH, format, as_utc(since).isoformat() if since else None,
+                                      include_users)
+    return StreamingResponse(chunks, media_type=EXPORT_FORMATS[format], headers={
+        "Content-Disposition": f'attachment; filename="game_scores.{format}"',
+        "X-Export-Watermark": watermark or "",
+    })
+
+@api_router.get("/admin/slow-requests")
+async def get_slow_requests(limit: int = Query(50, ge=1, le=1000), admin: UserRecord = Depends(require_admin)):
+    return {
+        "worker_pid": os.getpid(),
+        "threshold_ms": slow_requests.threshold * 1000,
+        "requests": slow_requests.recent(limit),
+    }
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def get_request_profile(profile_id: str, admin: UserRecord = Depends(require_admin)):
+    report = request_profiles.get(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found on this worker")
+    return Response(report, media_type="text/plain")
+
+@api_router.post("/admin/profile")
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=60),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    threads: str = Query('loop', pattern='^(loop|all)$'),
+    admin: UserRecord = Depends(require_admin)
+):
+    if sampling_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running on this worker")
+    async with sampling_lock:
+        # Called on the event loop thread, so this is the loop's thread id
+        thread_ids = {threading.get_ident()} if threads == 'loop' else None
+        sampler = StackSampler(interval_ms / 1000, thread_ids)
+        stacks = await asyncio.to_thread(sampler.run, seconds)
+    return Response(StackSampler.collapse(stacks), media_type="text/plain",
+                    headers={"X-Worker-Pid": str(os.getpid())})
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Per-request tracing (innermost, so its timings cover routing and the endpoint only)
+app.add_middleware(
+    ProfilingMiddleware,
+    slow_log=slow_requests,
+    profiles=request_profiles,
+    jwt_secret=JWT_SECRET,
+    jwt_algorithms=[JWT_ALGORITHM],
+    admin_usernames=ADMIN_USERNAMES,
+)
+
+# Idempotency-Key on score writes: a retried submission replays the first response
+# instead of inserting the score and adding to the user's totals again
+IDEMPOTENT_ROUTES = {
+    ('POST', '/api/games/score'),
+    ('POST', '/api/daily/submit'),
+    ('POST', '/api/games/logical-reasoning/submit'),
+    ('POST', '/api/games/creative-writing/submit'),
+    ('POST', '/api/games/audio-recognition/submit'),
+    ('POST', '/api/games/memory/rounds/{round_id}'),
+}
+IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 86400))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 10000))
+
+if os.environ.get('IDEMPOTENCY_BACKEND', 'sqlite') == 'memory':
+    idempotency_store = MemoryIdempotencyStore(ttl=IDEMPOTENCY_TTL, max_entries=IDEMPOTENCY_CACHE_SIZE)
+else:
+    idempotency_store = SQLiteIdempotencyStore(ROOT_DIR / os.environ.get('IDEMPOTENCY_DB', 'idempotency.db'),
+                                               ttl=IDEMPOTENCY_TTL, max_entries=IDEMPOTENCY_CACHE_SIZE)
+metrics.counter('idempotency_replays_total', "Requests answered with a stored response",
+                fn=lambda: idempotency_store.replays)
+metrics.counter('idempotency_conflicts_total', "Idempotency keys rejected as in progress or reused",
+                fn=lambda: idempotency_store.conflicts)
+
+app.add_middleware(
+    IdempotencyMiddleware,
+    store=idempotency_store,
+    routes=IDEMPOTENT_ROUTES,
+    jwt_secret=JWT_SECRET,
+    jwt_algorithms=[JWT_ALGORITHM],
+)
+
+# Rate limiting (checked before routing, so rejected requests never reach the DB).
+# RATE_LIMITS overrides these by name, e.g. "register=20/3600,login=30/60:10"
+RATE_LIMIT_ROUTES = {
+    ('POST', '/api/auth/login'): RatePolicy('login', rate=10 / 60, capacity=10),
+    ('POST', '/api/auth/register'): RatePolicy('register', rate=5 / 3600, capacity=5),
+    ('GET', '/api/auth/available'): RatePolicy('available', rate=1.0, capacity=30),
+    ('POST', '/api/games/score'): RatePolicy('score', rate=1.0, capacity=30, scope='user'),
+}
+_rate_limits = parse_policy_overrides(os.environ.get('RATE_LIMITS', ''),
+                                      [*RATE_LIMIT_ROUTES.values(), RatePolicy('api', rate=20.0, capacity=100)])
+RATE_LIMIT_POLICIES = {route: _rate_limits[policy.name] for route, policy in RATE_LIMIT_ROUTES.items()}
+RATE_LIMIT_DEFAULT = _rate_limits['api']
+# Proxies whose X-Forwarded-For is believed (addresses or CIDRs); uvicorn's
+# FORWARDED_ALLOW_IPS must not be '*', or clients choose their own address
+RATE_LIMIT_TRUSTED_PROXIES = parse_networks(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', ''))
+
+if os.environ.get('RATE_LIMIT_BACKEND', 'memory') == 'sqlite':
+    rate_limit_store = SQLiteBucketStore(ROOT_DIR / os.environ.get('RATE_LIMIT_DB', 'rate_limit.db'))
+else:
+    rate_limit_store = MemoryBucketStore()
+
+app.add_middleware(
+    RateLimitMiddleware,
+    policies=RATE_LIMIT_POLICIES,
+    store=rate_limit_store,
+    jwt_secret=JWT_SECRET,
+    jwt_algorithms=[JWT_ALGORITHM],
+    default_policy=RATE_LIMIT_DEFAULT,
+    enabled=os.environ.get('RATE_LIMIT_ENABLED', '1') != '0',
+    trusted_proxies=RATE_LIMIT_TRUSTED_PROXIES,
+)
+
+# Inside metrics, so requests refused while shutting down are counted as 503s
+app.add_middleware(DrainMiddleware, drain=request_drain)
+
+app.add_middleware(MetricsMiddleware, registry=metrics, enabled=METRICS_ENABLED)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -704,10 +1447,49 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+if os.environ.get('FORWARDED_ALLOW_IPS', '').strip() == '*':
+    logger.warning("FORWARDED_ALLOW_IPS=* lets clients set their own address with X-Forwarded-For, "
+                   "and so bypass the IP rate limits; set it to the proxy's addresses")
 
 @app.on_event("startup")
 async def startup_event():
-    await init_database()
+    await storage.start()
+    await cache_bus.start()
+    # After the bus, so accounts created while the filters load still reach them
+    await taken_names.start()
+    await matchmaker.start()
+    await daily_challenges.refresh()
+    await rate_limit_store.start()
+    await idempotency_store.start()
+    await memory_rounds.start()
+    await score_percentiles.start()
+    # Last: jobs may use everything above
+    await scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Turn new requests away and let the running ones finish while everything they use is still up
+    request_drain.begin()
+    if not await request_drain.wait(SHUTDOWN_DRAIN_SECONDS):
+        logger.warning("Shutting down with %d requests still running after %.0fs",
+                       request_drain.in_flight, SHUTDOWN_DRAIN_SECONDS)
+    if retention is not None:
+        retention.stop()
+    await taken_names.stop()
+    await matchmaker.stop()
+    matches = list(live_matches.values())
+    for task in matches:
+        task.cancel()
+    await asyncio.gather(*matches, return_exceptions=True)
+    # Running jobs finish, write-behind jobs flush once more, the leader lease is handed back
+    await scheduler.stop(SHUTDOWN_DRAIN_SECONDS)
+    await cache_bus.stop()
+    await rate_limit_store.stop()
+    await idempotency_store.stop()
+    await memory_rounds.stop()
+    await score_percentiles.stop()
+    await storage.stop()
+    password_executor.shutdown()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,168 @@
+"""Adaptive difficulty from a per-user, per-game skill rating.
+
+Every round is treated as a game between the player and the difficulty
+level they were given. Levels sit on a fixed rating ladder; players carry a
+Glicko-style rating and rating deviation (the model's uncertainty, which
+shrinks as they play and grows back while they are away). After each round
+the player's rating moves towards the result (a cleared round counts as a
+win, anything else as a loss), and the next round gets the level the player
+is expected to clear ``target`` of the time.
+
+Ratings are cached per process (LRU) in front of the storage layer. The
+updated rating is written in the same transaction as the round's score, and
+the cache is updated once that write has succeeded. A save over a rating
+another worker has moved on (its ``games`` count is not the one this rating
+was played from) raises ``storage.StaleRatingError``; the caller reloads and
+plays the round again. Saved ratings are announced on the cache bus, so
+other workers drop their copy instead of serving it until it is evicted.
+
+Only the memory challenge has a ladder. Logical reasoning is not rated yet:
+its answers are not graded against the puzzle, so there is no outcome to
+learn from, and the client still picks its difficulty.
+"""
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+
+from memory_rounds import MAX_DIFFICULTY
+
+DEFAULT_RATING = 1500.0
+MAX_DEVIATION = 350.0
+MIN_DEVIATION = 50.0
+# Deviation grows back from MIN to MAX over a year without a round
+DEVIATION_GROWTH = (MAX_DEVIATION ** 2 - MIN_DEVIATION ** 2) / (365 * 86400)  # per second, squared
+_Q = math.log(10) / 400
+
+
+def expected_score(rating: float, opponent: float) -> float:
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+
+class SkillRating(NamedTuple):
+    rating: float = DEFAULT_RATING
+    deviation: float = MAX_DEVIATION
+    games: int = 0
+    updated_at: float = 0.0  # epoch seconds of the last round
+
+    def at(self, now: float) -> 'SkillRating':
+        """This rating with its deviation grown for the time since ``updated_at``."""
+        if not self.games:
+            return self
+        deviation = math.sqrt(self.deviation ** 2 + DEVIATION_GROWTH * max(0.0, now - self.updated_at))
+        return self._replace(deviation=min(MAX_DEVIATION, deviation))
+
+    def play(self, opponent: float, outcome: float, now: float) -> 'SkillRating':
+        """Glicko update for one game against a fixed ``opponent`` rating; ``outcome`` in [0, 1]."""
+        current = self.at(now)
+        expected = expected_score(current.rating, opponent)
+        # 1/d^2: the information one game carries (opponent deviation is 0)
+        information = _Q ** 2 * expected * (1 - expected)
+        precision = 1 / current.deviation ** 2 + information
+        rating = current.rating + _Q / precision * (outcome - expected)
+        deviation = max(MIN_DEVIATION, math.sqrt(1 / precision))
+        return SkillRating(rating, deviation, current.games + 1, now)
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> 'SkillRating':
+        return cls(row['rating'], row['deviation'], row['games'], row['updated_at'].timestamp())
+
+    def to_row(self, user_id: str, game_type: str) -> Dict[str, Any]:
+        return {'user_id': user_id, 'game_type': game_type, 'rating': self.rating, 'deviation': self.deviation,
+                'games': self.games, 'updated_at': datetime.fromtimestamp(self.updated_at, timezone.utc)}
+
+
+class DifficultyLadder(NamedTuple):
+    """Levels 1..``levels``, level 1 rated ``base`` and each next one ``step`` higher."""
+    levels: int
+    base: float
+    step: float
+
+    def rating(self, level: int) -> float:
+        return self.base + (level - 1) * self.step
+
+    def level_for(self, rating: float, target: float) -> int:
+        """Level whose expected score for ``rating`` is closest to ``target``."""
+        opponent = rating - 400 * math.log10(target / (1 - target))
+        return min(self.levels, max(1, round((opponent - self.base) / self.step) + 1))
+
+
+# A new player (1500) starts at level 1 of the memory challenge; each level
+# (two more items to recall) is 100 rating points harder
+LADDERS = {
+    'memory_challenge': DifficultyLadder(MAX_DIFFICULTY, base=1400, step=100),
+}
+
+
+class SkillModel:
+    """Ratings for the ``max_entries`` most recently seen (user, game) pairs.
+
+    ``load`` fetches a user's saved ratings by game_type (the repository's
+    ``get_skill_ratings``) on a cache miss. The shared guest account is not
+    rated: it always plays at the default rating.
+    """
+
+    CHANNEL = 'skill'  # cache bus channel; the key is "<game_type>/<user_id>"
+
+    def __init__(self, ladders: Dict[str, DifficultyLadder],
+                 load: Callable[[str], Awaitable[Dict[str, Dict[str, Any]]]],
+                 target: float = 0.7, max_entries: int = 100000):
+        self.ladders = ladders
+        self.load = load
+        self.target = target
+        self.max_entries = max_entries
+        self._ratings: 'OrderedDict[tuple, SkillRating]' = OrderedDict()  # by (user_id, game_type)
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0
+
+    async def get(self, user_id: str, game_type: str) -> SkillRating:
+        if user_id == 'guest':
+            return SkillRating()
+        key = (user_id, game_type)
+        rating = self._ratings.get(key)
+        if rating is not None:
+            self.hits += 1
+            self._ratings.move_to_end(key)
+            return rating
+        self.misses += 1
+        saved = await self.load(user_id)
+        for saved_game, row in saved.items():
+            self.remember(user_id, saved_game, SkillRating.from_row(row))
+        if key not in self._ratings:
+            self.remember(user_id, game_type, SkillRating())  # not rated yet
+        return self._ratings[key]
+
+    def next_level(self, game_type: str, rating: SkillRating) -> int:
+        return self.ladders[game_type].level_for(rating.rating, self.target)
+
+    def play(self, game_type: str, rating: SkillRating, level: int, outcome: float,
+             now: Optional[float] = None) -> SkillRating:
+        """The rating after a round at ``level``; call ``remember`` once it is saved."""
+        return rating.play(self.ladders[game_type].rating(level), outcome, time.time() if now is None else now)
+
+    def remember(self, user_id: str, game_type: str, rating: SkillRating):
+        key = (user_id, game_type)
+        self._ratings[key] = rating
+        self._ratings.move_to_end(key)
+        while len(self._ratings) > self.max_entries:
+            self._ratings.popitem(last=False)
+
+    def forget(self, user_id: str, game_type: str):
+        """Drop a rating whose save was refused as stale."""
+        self.conflicts += 1
+        self._ratings.pop((user_id, game_type), None)
+
+    @staticmethod
+    def encode(user_id: str, game_type: str) -> str:
+        return f"{game_type}/{user_id}"
+
+    def on_event(self, channel: str, key: Optional[str]):
+        """Cache bus subscriber: another worker saved the rating in ``key``."""
+        if channel == self.CHANNEL and key is not None:
+            game_type, _, user_id = key.partition('/')
+            self._ratings.pop((user_id, game_type), None)
+
+    def __len__(self):
+        return len(self._ratings)
@@ -0,0 +1,1725 @@
+"""Storage layer shared by every route.
+
+``StorageRepository`` is the only thing route handlers talk to for users,
+scores, leaderboards and stats. ``SQLiteRepository`` (aiosqlite) and
+``MongoRepository`` (Motor) implement it, each in the way that suits its
+engine: SQL aggregates and covering indexes on one side, projections,
+aggregation pipelines and bulk writes on the other. ``create_repository``
+picks one from the STORAGE_BACKEND setting.
+
+SQLite files come in three layouts. The standard one keys rows by uuid
+strings and stores ISO-8601 timestamps and game_type names on every score.
+``CompactSQLiteRepository`` (SQLITE_SCHEMA=compact) stores integer keys,
+epoch microseconds and game_type numbers instead, with scores clustered by
+user. ``PartitionedSQLiteRepository`` (SQLITE_SCHEMA=partitioned) keeps the
+standard columns but splits game_scores into one table per month. Tools
+that read the file directly (exports, analytics, maintenance scripts) call
+``attach_standard_views`` to see the standard tables on any layout.
+
+The SQLite repositories keep up to SQLITE_POOL_SIZE connections open per
+worker and lend each to one operation at a time, so a query costs a round
+trip to the connection's thread rather than a new thread and a file open.
+An operation that leaves a transaction open, by raising before its commit,
+is rolled back before the connection is lent again.
+
+``MongoRepository.record_scores`` writes progress, scores, user totals and
+ratings in one transaction when the server supports them (a replica set or
+sharded cluster). A standalone server does not; there the writes run one
+after another in that order, and a failure part-way leaves the earlier
+ones in place (see ``record_scores``).
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import aiosqlite
+import orjson
+
+logger = logging.getLogger(__name__)
+
+GAME_TYPES = ['ai_image', 'text_ai', 'memory_challenge']
+
+# Cursor position in a user's history: (timestamp, score id), newest first
+HistoryKey = Tuple[datetime, str]
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+EPOCH_DAY = EPOCH.toordinal()
+MICROSECOND = timedelta(microseconds=1)
+
+# Month partitions of game_scores: game_scores_2026_10 holds October 2026 (UTC)
+PARTITION_GLOB = 'game_scores_[0-9][0-9][0-9][0-9]_[0-9][0-9]'
+PARTITIONS_QUERY = (f"SELECT name FROM main.sqlite_master WHERE type = 'table' AND name GLOB '{PARTITION_GLOB}' "
+                    "ORDER BY name")
+# The first score table found tells the layouts apart
+LAYOUT_QUERY = ("SELECT name FROM main.sqlite_master WHERE type = 'table' "
+                f"AND (name IN ('game_scores', 'scores') OR name GLOB '{PARTITION_GLOB}') LIMIT 1")
+
+
+class DuplicateUserError(Exception):
+    """Username or email is already taken."""
+
+
+class StaleProgressError(Exception):
+    """Achievement progress was saved by someone else since it was read; nothing was written."""
+
+
+class StaleRatingError(Exception):
+    """A skill rating was saved by someone else since it was read; nothing was written."""
+
+
+@dataclass(slots=True)
+class UserRecord:
+    """Public profile fields of a user, as returned by get_user and top_users.
+
+    Built straight from a row or document without validation; the API's
+    orjson response class serializes it as is.
+    """
+    id: str
+    username: str
+    email: str
+    created_at: datetime
+    total_games_played: int = 0
+    total_score: int = 0
+
+    @classmethod
+    def from_row(cls, row) -> 'UserRecord':
+        """From a named SQLite row or a Mongo document."""
+        created_at = row['created_at']
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at)
+        elif isinstance(created_at, int):
+            created_at = from_micros(created_at)
+        elif created_at.tzinfo is None:
+            # Mongo hands back naive datetimes that are UTC
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        return cls(row['id'], row['username'], row['email'], created_at,
+                   row['total_games_played'], row['total_score'])
+
+
+def empty_game_stats() -> Dict[str, Any]:
+    return {"games_played": 0, "avg_accuracy": 0, "avg_time": 0, "best_score": 0}
+
+
+class StorageRepository(ABC):
+    """Data access used by the API, independent of the database engine."""
+
+    name = 'abstract'
+
+    async def start(self):
+        """Create schema/indexes and the guest user."""
+
+    async def stop(self):
+        pass
+
+    # Users
+    @abstractmethod
+    async def get_user(self, user_id: str) -> Optional[UserRecord]:
+        """Public profile fields (no password) or None."""
+
+    @abstractmethod
+    async def get_user_credentials(self, username: str) -> Optional[Tuple[UserRecord, str]]:
+        """Profile fields and the password hash, looked up by username."""
+
+    @abstractmethod
+    async def user_exists(self, username: Optional[str], email: Optional[str]) -> bool:
+        """Whether an account has this username or this email; None checks only the other."""
+
+    @abstractmethod
+    async def create_user(self, user: Dict[str, Any], password_hash: str):
+        """Insert the account, or raise DuplicateUserError if its id, username or email is taken."""
+
+    @abstractmethod
+    async def count_users(self) -> int:
+        pass
+
+    @abstractmethod
+    def user_names(self, batch_size: int = 50000) -> AsyncIterator[List[Tuple[str, str]]]:
+        """Every account's (username, email), in batches of up to ``batch_size``."""
+
+    # Scores
+    @abstractmethod
+    async def record_scores(self, scores: Sequence[Dict[str, Any]], ratings: Sequence[Dict[str, Any]] = (),
+                            progress: Sequence[Dict[str, Any]] = ()):
+        """Insert scores, add the unflagged ones to their users' totals and save ``ratings`` and ``progress``.
+
+        A rating is ``user_id``, ``game_type``, ``rating``, ``deviation``,
+        ``games`` and ``updated_at``, and only replaces the stored one at
+        ``games - 1`` (or none, for games 1); otherwise StaleRatingError is
+        raised and nothing is written. Progress is ``user_id``, ``version``,
+        ``state`` (JSON-serializable) and ``updated_at``, and likewise only
+        replaces the stored one at ``version - 1``; otherwise
+        StaleProgressError is raised.
+        """
+
+    async def record_score(self, score: Dict[str, Any], ratings: Sequence[Dict[str, Any]] = (),
+                           progress: Sequence[Dict[str, Any]] = ()):
+        await self.record_scores([score], ratings, progress)
+
+    @abstractmethod
+    async def get_skill_ratings(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """The user's saved ratings by game_type."""
+
+    @abstractmethod
+    async def get_achievement_progress(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """The user's saved ``version``, ``state`` and ``updated_at``, or None."""
+
+    @abstractmethod
+    async def score_history(self, user_id: str, limit: int, game_type: Optional[str] = None,
+                            since: Optional[datetime] = None, until: Optional[datetime] = None,
+                            before: Optional[HistoryKey] = None) -> List[Dict[str, Any]]:
+        """Up to ``limit`` scores ordered by (timestamp, id) descending, strictly before ``before``."""
+
+    # Leaderboard and stats
+    @abstractmethod
+    async def top_users(self, limit: int = 10) -> List[UserRecord]:
+        """Highest total_score users, excluding the guest account."""
+
+    @abstractmethod
+    async def window_top_users(self, since: datetime, until: Optional[datetime] = None,
+                               limit: int = 10) -> List[Dict[str, Any]]:
+        """Highest totals of unflagged scores with since <= timestamp < until, excluding the guest account.
+
+        Entries are ``id``, ``username``, and the window's ``total_score``
+        and ``games_played``; ties go to the lower user id.
+        """
+
+    @abstractmethod
+    async def user_game_stats(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Per game_type games_played / avg_accuracy / avg_time / best_score."""
+
+    # Daily challenge
+    @abstractmethod
+    async def record_daily_result(self, result: Dict[str, Any]) -> bool:
+        """Save a daily challenge result; False, and nothing written, if the player already has one that day.
+
+        A result is ``day`` (a date), ``user_id``, ``score``, ``accuracy``,
+        ``time_taken`` and ``submitted_at``.
+        """
+
+    @abstractmethod
+    async def daily_top(self, day: date, limit: int = 100) -> List[Dict[str, Any]]:
+        """The day's best results with their players' ``username``, in ``daily_rank_key`` order.
+
+        Entries are ``user_id``, ``username``, ``score``, ``accuracy``,
+        ``time_taken`` and ``submitted_at``.
+        """
+
+    @abstractmethod
+    async def get_daily_result(self, day: date, user_id: str) -> Optional[Dict[str, Any]]:
+        """The player's result for ``day``, as in ``daily_top`` plus its ``rank`` (1 is the best), or None."""
+
+
+def daily_rank_key(result: Dict[str, Any]) -> Tuple[int, int, datetime, str]:
+    """Daily challenge order: higher score, then less time, then the earlier submission, then the lower user id."""
+    return -result['score'], result['time_taken'], result['submitted_at'], result['user_id']
+
+
+def _utc_iso(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def to_micros(value: datetime) -> int:
+    """Microseconds since the epoch, exactly; naive datetimes are UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // MICROSECOND
+
+
+def from_micros(micros: int) -> datetime:
+    return EPOCH + micros * MICROSECOND
+
+
+def month_start(value: datetime) -> datetime:
+    """Midnight UTC on the first of ``value``'s month; naive datetimes are UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+class ScorePartition(NamedTuple):
+    """One month of the partitioned layout: ``table`` holds scores with start <= timestamp < end."""
+    table: str
+    start: datetime
+    end: datetime
+
+    @classmethod
+    def for_month(cls, value: datetime) -> 'ScorePartition':
+        start = month_start(value)
+        return cls(f"game_scores_{start:%Y_%m}", start, month_start(start + timedelta(days=32)))
+
+    @classmethod
+    def from_table(cls, table: str) -> 'ScorePartition':
+        return cls.for_month(datetime(int(table[-7:-3]), int(table[-2:]), 1, tzinfo=timezone.utc))
+
+    def overlaps(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> bool:
+        return (since is None or self.end > since) and (until is None or self.start < until)
+
+    def within(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> bool:
+        return (since is None or self.start >= since) and (until is None or self.end <= until)
+
+
+def score_partitions(conn: sqlite3.Connection) -> List[ScorePartition]:
+    """The file's month partitions, oldest first (none unless it has the partitioned layout)."""
+    return [ScorePartition.from_table(name) for name, in conn.execute(PARTITIONS_QUERY)]
+
+
+def _layout_of(row) -> Optional[str]:
+    """Layout named by LAYOUT_QUERY's row; None for a file without score tables yet."""
+    if row is None:
+        return None
+    return {'game_scores': 'standard', 'scores': 'compact'}.get(row[0], 'partitioned')
+
+
+def sqlite_layout(conn: sqlite3.Connection) -> str:
+    """'standard', 'compact' or 'partitioned', from the file's score tables."""
+    return _layout_of(conn.execute(LAYOUT_QUERY).fetchone()) or 'standard'
+
+
+def attach_standard_views(conn: sqlite3.Connection) -> str:
+    """Make ``users`` and ``game_scores`` readable on ``conn`` whatever the layout; returns the layout.
+
+    On the compact layout they are TEMP views over the compact tables, so
+    only the connections that use them pay for parsing them. On the
+    partitioned layout game_scores is a TEMP view over the partitions that
+    exist now: call this again after dropping one.
+    """
+    layout = sqlite_layout(conn)
+    if layout == 'compact':
+        for statement in CompactSQLiteRepository.VIEWS:
+            conn.execute(statement)
+    elif layout == 'partitioned':
+        conn.execute('DROP VIEW IF EXISTS temp.game_scores')
+        for statement in PartitionedSQLiteRepository.views(score_partitions(conn)):
+            conn.execute(statement)
+    return layout
+
+
+def score_time_key(conn: sqlite3.Connection) -> Tuple[str, Callable[[str], Any]]:
+    """Column to filter and sort game_scores by time, and the conversion of an ISO timestamp to it.
+
+    ``timestamp`` itself on the standard layout. On the compact one it is
+    computed text, so ranges and ordering use the indexed ``ts`` column
+    (epoch microseconds) instead.
+    """
+    if sqlite_layout(conn) == 'compact':
+        return 'ts', lambda value: to_micros(datetime.fromisoformat(value))
+    return 'timestamp', lambda value: value
+
+
+def _user_totals(scores: Sequence[Dict[str, Any]]) -> Dict[str, List[int]]:
+    """[games, points] per user over the unflagged scores."""
+    totals: Dict[str, List[int]] = {}
+    for score in scores:
+        if score.get('flag'):
+            continue
+        games_score = totals.setdefault(score['user_id'], [0, 0])
+        games_score[0] += 1
+        games_score[1] += score['score']
+    return totals
+
+
+class _NamedRowConnection(sqlite3.Connection):
+    """sqlite3 connection whose rows are ``sqlite3.Row`` (indexable by column name).
+
+    Passed as ``factory`` so the row factory is set as the connection is
+    opened, without another round trip to aiosqlite's thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.row_factory = sqlite3.Row
+
+
+class _ConnectionPool:
+    """Up to ``size`` connections from ``open_connection``, opened on demand and lent one caller at a time."""
+
+    def __init__(self, open_connection: Callable[[], Any], size: int):
+        self._open = open_connection
+        self.size = size
+        self.opened = 0
+        self._idle: 'asyncio.LifoQueue[aiosqlite.Connection]' = asyncio.LifoQueue()
+
+    @asynccontextmanager
+    async def connection(self):
+        if self._idle.empty() and self.opened < self.size:
+            self.opened += 1
+            try:
+                db = await self._open()
+            except BaseException:
+                self.opened -= 1
+                raise
+        else:
+            db = await self._idle.get()
+        try:
+            yield db
+        finally:
+            await self._release(db)
+
+    async def _release(self, db):
+        try:
+            if db.in_transaction:
+                await db.rollback()
+        except Exception:
+            # Unusable: close it, and the next caller opens a new one
+            self.opened -= 1
+            try:
+                await db.close()
+            except Exception:
+                pass
+            return
+        self._idle.put_nowait(db)
+
+    async def close(self):
+        while not self._idle.empty():
+            db = self._idle.get_nowait()
+            self.opened -= 1
+            await db.close()
+
+
+class SQLiteRepository(StorageRepository):
+    name = 'sqlite'
+    layout = 'standard'
+
+    USERS_TABLE = 'users'
+    USER_COLUMNS = 'id, username, email, created_at, total_games_played, total_score'
+    SCORE_COLUMNS = ('id, user_id, game_type, score, accuracy, time_taken, '
+                     'ai_baseline_score, ai_baseline_accuracy, timestamp, flag')
+    GAME_STATS_COLUMNS = ('games_played', 'avg_accuracy', 'avg_time', 'best_score')
+    RATING_COLUMNS = 'user_id, game_type, rating, deviation, games, updated_at'
+    # Bump when start() changes the schema; PRAGMA user_version records what a file has
+    SCHEMA_VERSION = 6
+
+    # game_scores, or one month of it on the partitioned layout
+    SCORE_TABLE = '''
+        CREATE TABLE IF NOT EXISTS {table} (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            game_type TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            accuracy REAL NOT NULL,
+            time_taken INTEGER NOT NULL,
+            ai_baseline_score INTEGER NOT NULL,
+            ai_baseline_accuracy REAL NOT NULL,
+            timestamp TEXT NOT NULL,
+            flag TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    '''
+    SCORE_INDEXES = (
+        # Keyset pagination of a user's history
+        'CREATE INDEX IF NOT EXISTS idx_{table}_user_ts ON {table} (user_id, timestamp, id)',
+        'CREATE INDEX IF NOT EXISTS idx_{table}_user_type_ts ON {table} (user_id, game_type, timestamp, id)',
+        # Exports, analytics and windowed leaderboards scan in timestamp order
+        'CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table} (timestamp)',
+    )
+
+    def __init__(self, path, pool_size: int = 4):
+        self.path = path
+        self.pool_size = pool_size
+        self._pool: Optional[_ConnectionPool] = None
+
+    def connect(self):
+        """A connection for one operation: from the pool once started, else a new one closed after it."""
+        if self._pool is None:
+            return aiosqlite.connect(self.path, factory=_NamedRowConnection)
+        return self._pool.connection()
+
+    async def start(self):
+        await self._migrate()
+        self._pool = _ConnectionPool(lambda: aiosqlite.connect(self.path, factory=_NamedRowConnection),
+                                     self.pool_size)
+
+    async def stop(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await pool.close()
+
+    async def _check_layout(self, db):
+        async with db.execute(LAYOUT_QUERY) as cursor:
+            layout = _layout_of(await cursor.fetchone())
+        if layout not in (None, self.layout):
+            hint = " (or migrate it with compact.py or partitions.py)" if layout == 'standard' else ""
+            raise RuntimeError(f"{self.path} has the {layout} layout; set SQLITE_SCHEMA={layout}{hint}")
+
+    async def _migrate(self):
+        async with self.connect() as db:
+            await self._check_layout(db)
+            # Every worker runs this at boot; a file already at SCHEMA_VERSION needs no DDL
+            async with db.execute('PRAGMA user_version') as cursor:
+                if (await cursor.fetchone())[0] >= self.SCHEMA_VERSION:
+                    return
+            # Only takes effect on a new file (before its first table): lets retention
+            # return freed pages with PRAGMA incremental_vacuum instead of a full VACUUM
+            await db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            # WAL lets readers run alongside the single writer; it is persistent
+            await db.execute('PRAGMA journal_mode=WAL')
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id TEXT PRIMARY KEY,
+                    username TEXT UNIQUE NOT NULL,
+                    email TEXT UNIQUE NOT NULL,
+                    password TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    total_games_played INTEGER DEFAULT 0,
+                    total_score INTEGER DEFAULT 0
+                )
+            ''')
+            await self._create_score_tables(db)
+            # v3: adaptive difficulty ratings, one row per user and game
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS skill_ratings (
+                    user_id TEXT NOT NULL,
+                    game_type TEXT NOT NULL,
+                    rating REAL NOT NULL,
+                    deviation REAL NOT NULL,
+                    games INTEGER NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (user_id, game_type)
+                ) WITHOUT ROWID
+            ''')
+            # v4: per user, game and UTC day totals of the scores retention has archived
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS daily_score_rollups (
+                    user_id TEXT NOT NULL,
+                    game_type TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    games INTEGER NOT NULL,
+                    flagged INTEGER NOT NULL,
+                    score_sum INTEGER NOT NULL,
+                    accuracy_sum REAL NOT NULL,
+                    time_sum INTEGER NOT NULL,
+                    best_score INTEGER NOT NULL,
+                    PRIMARY KEY (user_id, game_type, day)
+                ) WITHOUT ROWID
+            ''')
+            # v5: achievement counters, one versioned document per user
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS achievement_progress (
+                    user_id TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    state BLOB NOT NULL,
+                    updated_at TEXT NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            # v6: daily challenge results, one per user and UTC day
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS daily_results (
+                    day TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    score INTEGER NOT NULL,
+                    accuracy REAL NOT NULL,
+                    time_taken INTEGER NOT NULL,
+                    submitted_at TEXT NOT NULL,
+                    PRIMARY KEY (day, user_id)
+                ) WITHOUT ROWID
+            ''')
+            # A day's leaderboard and ranks read this index in daily_rank_key order
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_daily_results_rank
+                ON daily_results (day, score DESC, time_taken, submitted_at, user_id)
+            ''')
+            # Leaderboard reads the top of this index instead of sorting users
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_users_total_score
+                ON users (total_score DESC)
+            ''')
+            await db.execute('''
+                INSERT OR IGNORE INTO users (id, username, email, password, created_at)
+                VALUES ('guest', 'Guest', 'guest@example.com', '', ?)
+            ''', (datetime.now(timezone.utc).isoformat(),))
+            await db.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+            await db.commit()
+
+    async def _create_score_tables(self, db):
+        await db.execute(self.SCORE_TABLE.format(table='game_scores'))
+        # v2: anti-cheat flag (NULL = clean); flagged scores are not in users' totals
+        async with db.execute('PRAGMA table_info(game_scores)') as cursor:
+            if 'flag' not in [row['name'] for row in await cursor.fetchall()]:
+                await db.execute('ALTER TABLE game_scores ADD COLUMN flag TEXT')
+        for statement in self.SCORE_INDEXES:
+            await db.execute(statement.format(table='game_scores'))
+
+    @staticmethod
+    def _union(select: str, tables: Iterable[str]) -> str:
+        """``select`` (with a ``{table}`` placeholder) over each table, combined with UNION ALL."""
+        return ' UNION ALL '.join(select.format(table=table) for table in tables)
+
+    async def _fetch_scores(self, build: Callable[[List[str]], str], params: Dict[str, Any],
+                            since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[sqlite3.Row]:
+        """Rows of ``build(tables)``, a query over the score tables holding scores in [since, until)."""
+        async with self.connect() as db:
+            async with db.execute(build(['game_scores']), params) as cursor:
+                return await cursor.fetchall()
+
+    def _within(self, table: str, since: Optional[datetime], until: Optional[datetime]) -> bool:
+        """Whether every score ``table`` can hold has since <= timestamp < until."""
+        return False
+
+    @staticmethod
+    def _score(row) -> Dict[str, Any]:
+        score = dict(zip(row.keys(), row))
+        score['timestamp'] = datetime.fromisoformat(score['timestamp'])
+        return score
+
+    async def get_user(self, user_id):
+        async with self.connect() as db:
+            async with db.execute(f'SELECT {self.USER_COLUMNS} FROM users WHERE id = ?',
+                                  (user_id,)) as cursor:
+                row = await cursor.fetchone()
+        return UserRecord.from_row(row) if row else None
+
+    async def get_user_credentials(self, username):
+        async with self.connect() as db:
+            async with db.execute(f'SELECT {self.USER_COLUMNS}, password FROM users WHERE username = ?',
+                                  (username,)) as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            return None
+        return UserRecord.from_row(row), row['password']
+
+    async def user_exists(self, username, email):
+        # One probe of each unique index rather than an OR over both columns
+        async with self.connect() as db:
+            async with db.execute('''
+                SELECT EXISTS (SELECT 1 FROM users WHERE username = ?)
+                    OR EXISTS (SELECT 1 FROM users WHERE email = ?)
+            ''', (username, email)) as cursor:
+                return bool((await cursor.fetchone())[0])
+
+    async def create_user(self, user, password_hash):
+        # The unique indexes decide in the insert itself; no check-then-insert race
+        async with self.connect() as db:
+            cursor = await db.execute('''
+                INSERT INTO users (id, username, email, password, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT DO NOTHING
+            ''', (user['id'], user['username'], user['email'], password_hash,
+                  _utc_iso(user['created_at'])))
+            if cursor.rowcount == 0:
+                raise DuplicateUserError(user['username'])
+            await db.commit()
+
+    async def count_users(self):
+        async with self.connect() as db:
+            async with db.execute(f'SELECT COUNT(*) FROM {self.USERS_TABLE}') as cursor:
+                return (await cursor.fetchone())[0]
+
+    async def user_names(self, batch_size=50000):
+        # Plain tuples: sqlite3.Row costs more than the read itself here
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute(f'SELECT username, email FROM {self.USERS_TABLE}') as cursor:
+                while rows := await cursor.fetchmany(batch_size):
+                    yield rows
+
+    async def record_scores(self, scores, ratings=(), progress=()):
+        if not scores:
+            return
+        async with self.connect() as db:
+            await db.executemany(f'''
+                INSERT INTO game_scores ({self.SCORE_COLUMNS})
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [self._score_values(s) for s in scores])
+            # Raising before the commit leaves nothing written
+            await self._record_totals(db, scores, ratings, progress)
+            await db.commit()
+
+    @staticmethod
+    def _score_values(s: Dict[str, Any]) -> tuple:
+        return (s['id'], s['user_id'], s['game_type'], s['score'], s['accuracy'], s['time_taken'],
+                s['ai_baseline_score'], s['ai_baseline_accuracy'], _utc_iso(s['timestamp']), s.get('flag'))
+
+    async def _record_totals(self, db, scores, ratings, progress=()):
+        """The users' totals, ratings and progress half of ``record_scores``, in the caller's transaction."""
+        await db.executemany('''
+            UPDATE users SET total_games_played = total_games_played + ?,
+                           total_score = total_score + ?
+            WHERE id = ?
+        ''', [(games, points, user_id) for user_id, (games, points) in _user_totals(scores).items()])
+        if ratings:
+            # Compare-and-set on games, like the progress below
+            cursor = await db.executemany(f'''
+                INSERT INTO skill_ratings ({self.RATING_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, game_type) DO UPDATE
+                SET rating = excluded.rating, deviation = excluded.deviation, games = excluded.games,
+                    updated_at = excluded.updated_at
+                WHERE skill_ratings.games = excluded.games - 1
+            ''', [(r['user_id'], r['game_type'], r['rating'], r['deviation'], r['games'],
+                   _utc_iso(r['updated_at'])) for r in ratings])
+            if cursor.rowcount != len(ratings):
+                raise StaleRatingError(', '.join(r['user_id'] for r in ratings))
+        if progress:
+            # Compare-and-set on version: a row another worker moved on is left alone
+            cursor = await db.executemany('''
+                INSERT INTO achievement_progress (user_id, version, state, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE
+                SET version = excluded.version, state = excluded.state, updated_at = excluded.updated_at
+                WHERE achievement_progress.version = excluded.version - 1
+            ''', [(p['user_id'], p['version'], orjson.dumps(p['state']), _utc_iso(p['updated_at']))
+                  for p in progress])
+            if cursor.rowcount != len(progress):
+                raise StaleProgressError(', '.join(p['user_id'] for p in progress))
+
+    async def get_skill_ratings(self, user_id):
+        async with self.connect() as db:
+            async with db.execute(f'SELECT {self.RATING_COLUMNS} FROM skill_ratings WHERE user_id = ?',
+                                  (user_id,)) as cursor:
+                rows = await cursor.fetchall()
+        return {row['game_type']: {'rating': row['rating'], 'deviation': row['deviation'], 'games': row['games'],
+                                   'updated_at': datetime.fromisoformat(row['updated_at'])}
+                for row in rows}
+
+    async def get_achievement_progress(self, user_id):
+        async with self.connect() as db:
+            async with db.execute('SELECT version, state, updated_at FROM achievement_progress WHERE user_id = ?',
+                                  (user_id,)) as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            return None
+        return {'version': row['version'], 'state': orjson.loads(row['state']),
+                'updated_at': datetime.fromisoformat(row['updated_at'])}
+
+    async def score_history(self, user_id, limit, game_type=None, since=None, until=None, before=None):
+        # Every page is a range scan of a composite index, however deep
+        clauses = ['user_id = :user_id']
+        params: Dict[str, Any] = {'user_id': user_id, 'limit': limit}
+        if game_type:
+            clauses.append('game_type = :game_type')
+            params['game_type'] = game_type
+        if since:
+            clauses.append('timestamp >= :since')
+            params['since'] = _utc_iso(since)
+        if until:
+            clauses.append('timestamp < :until')
+            params['until'] = _utc_iso(until)
+        if before:
+            clauses.append('(timestamp, id) < (:before_ts, :before_id)')
+            params.update(before_ts=_utc_iso(before[0]), before_id=before[1])
+            until = min(until, before[0] + MICROSECOND) if until else before[0] + MICROSECOND
+        select = f"SELECT {self.SCORE_COLUMNS} FROM {{table}} WHERE {' AND '.join(clauses)}"
+        rows = await self._fetch_scores(
+            lambda tables: f'{self._union(select, tables)} ORDER BY timestamp DESC, id DESC LIMIT :limit',
+            params, since, until)
+        return [self._score(row) for row in rows]
+
+    async def top_users(self, limit=10):
+        async with self.connect() as db:
+            async with db.execute(f'''
+                SELECT {self.USER_COLUMNS} FROM users
+                WHERE id != 'guest'
+                ORDER BY total_score DESC
+                LIMIT ?
+            ''', (limit,)) as cursor:
+                rows = await cursor.fetchall()
+        return [UserRecord.from_row(row) for row in rows]
+
+    async def window_top_users(self, since, until=None, limit=10):
+        window = ['timestamp >= :since']
+        params: Dict[str, Any] = {'since': _utc_iso(since), 'limit': limit}
+        if until:
+            window.append('timestamp < :until')
+            params['until'] = _utc_iso(until)
+
+        def select(table):
+            # A table wholly inside the window is read straight through, not row by row via its index
+            clauses = [] if self._within(table, since, until) else list(window)
+            clauses += ['flag IS NULL', "user_id != 'guest'"]
+            return f"SELECT user_id, score FROM {table} WHERE {' AND '.join(clauses)}"
+
+        rows = await self._fetch_scores(lambda tables: f'''
+            SELECT w.user_id AS id, u.username, w.total_score, w.games_played
+            FROM (
+                SELECT user_id, SUM(score) AS total_score, COUNT(*) AS games_played
+                FROM ({' UNION ALL '.join(select(table) for table in tables)})
+                GROUP BY user_id
+                ORDER BY total_score DESC, user_id
+                LIMIT :limit
+            ) w
+            JOIN users u ON u.id = w.user_id
+            ORDER BY w.total_score DESC, w.user_id
+        ''', params, since, until)
+        return [dict(zip(row.keys(), row)) for row in rows]
+
+    async def user_game_stats(self, user_id):
+        # Raw scores plus the daily rollups of archived ones
+        select = '''
+            SELECT game_type, COUNT(*) AS games, SUM(accuracy) AS accuracy_sum,
+                   SUM(time_taken) AS time_sum, MAX(score) AS best_score
+            FROM {table}
+            WHERE user_id = :user_id
+            GROUP BY game_type
+        '''
+        rows = await self._fetch_scores(lambda tables: f'''
+            SELECT game_type, SUM(games) AS games_played, SUM(accuracy_sum) / SUM(games) AS avg_accuracy,
+                   CAST(SUM(time_sum) AS REAL) / SUM(games) AS avg_time, MAX(best_score) AS best_score
+            FROM (
+                {self._union(select, tables)}
+                UNION ALL
+                SELECT game_type, SUM(games), SUM(accuracy_sum), SUM(time_sum), MAX(best_score)
+                FROM daily_score_rollups
+                WHERE user_id = :user_id
+                GROUP BY game_type
+            )
+            GROUP BY game_type
+        ''', {'user_id': user_id})
+        return {row['game_type']: {key: row[key] for key in self.GAME_STATS_COLUMNS} for row in rows}
+
+    async def record_daily_result(self, result):
+        async with self.connect() as db:
+            cursor = await db.execute('''
+                INSERT OR IGNORE INTO daily_results (day, user_id, score, accuracy, time_taken, submitted_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (result['day'].isoformat(), result['user_id'], result['score'], result['accuracy'],
+                  result['time_taken'], _utc_iso(result['submitted_at'])))
+            await db.commit()
+        return cursor.rowcount == 1
+
+    async def daily_top(self, day, limit=100):
+        async with self.connect() as db:
+            async with db.execute('''
+                SELECT d.user_id, u.username, d.score, d.accuracy, d.time_taken, d.submitted_at
+                FROM daily_results d
+                JOIN users u ON u.id = d.user_id
+                WHERE d.day = ?
+                ORDER BY d.score DESC, d.time_taken, d.submitted_at, d.user_id
+                LIMIT ?
+            ''', (day.isoformat(), limit)) as cursor:
+                rows = await cursor.fetchall()
+        return [dict(zip(row.keys(), row), submitted_at=datetime.fromisoformat(row['submitted_at'])) for row in rows]
+
+    async def get_daily_result(self, day, user_id):
+        async with self.connect() as db:
+            async with db.execute('''
+                SELECT d.user_id, u.username, d.score, d.accuracy, d.time_taken, d.submitted_at,
+                       1 + (SELECT COUNT(*) FROM daily_results a
+                            WHERE a.day = d.day AND (a.score > d.score OR (a.score = d.score
+                                AND (a.time_taken, a.submitted_at, a.user_id)
+                                    < (d.time_taken, d.submitted_at, d.user_id)))) AS rank
+                FROM daily_results d
+                JOIN users u ON u.id = d.user_id
+                WHERE d.day = ? AND d.user_id = ?
+            ''', (day.isoformat(), user_id)) as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip(row.keys(), row), submitted_at=datetime.fromisoformat(row['submitted_at']))
+
+
+class CompactSQLiteRepository(SQLiteRepository):
+    """SQLite with integer keys and timestamps, and scores clustered by user.
+
+    Users and scores get integer surrogate keys; their uuids are kept only
+    to answer the API (``accounts.id``, ``scores.uuid`` as 16 bytes).
+    Timestamps are epoch microseconds, game types numbers from
+    ``game_types``. ``scores`` is a WITHOUT ROWID table ordered by (user,
+    time), so a user's history and stats read adjacent pages, and the key
+    index stands in for the rowid (analytics refreshes by it).
+
+    ``VIEWS`` recreate the standard ``users`` and ``game_scores`` columns,
+    with ``game_scores.rowid`` the score's key, for exports, analytics and
+    the maintenance scripts (see ``attach_standard_views``). Flag and total
+    updates and deletes through them go to the tables.
+
+    History pages break timestamp ties by uuid, which orders like the id
+    strings of the other layouts, so cursors handed out before a migration
+    still resume at the same row. Score ids must be uuids.
+    """
+
+    layout = 'compact'
+    SCHEMA_VERSION = 3
+    USERS_TABLE = 'accounts'
+
+    TABLES = (
+        '''
+        CREATE TABLE IF NOT EXISTS game_types (
+            key INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS accounts (
+            key INTEGER PRIMARY KEY,
+            id TEXT UNIQUE NOT NULL,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            total_games_played INTEGER NOT NULL DEFAULT 0,
+            total_score INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS scores (
+            user_key INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            key INTEGER NOT NULL,
+            game INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            accuracy REAL NOT NULL,
+            time_taken INTEGER NOT NULL,
+            ai_baseline_score INTEGER NOT NULL,
+            ai_baseline_accuracy REAL NOT NULL,
+            flag TEXT,
+            uuid BLOB NOT NULL,
+            PRIMARY KEY (user_key, ts, key)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS skill_ratings (
+            user_key INTEGER NOT NULL,
+            game INTEGER NOT NULL,
+            rating REAL NOT NULL,
+            deviation REAL NOT NULL,
+            games INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (user_key, game)
+        ) WITHOUT ROWID
+        ''',
+        # day: days since 1970-01-01 (UTC)
+        '''
+        CREATE TABLE IF NOT EXISTS daily_score_rollups (
+            user_key INTEGER NOT NULL,
+            game INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            games INTEGER NOT NULL,
+            flagged INTEGER NOT NULL,
+            score_sum INTEGER NOT NULL,
+            accuracy_sum REAL NOT NULL,
+            time_sum INTEGER NOT NULL,
+            best_score INTEGER NOT NULL,
+            PRIMARY KEY (user_key, game, day)
+        ) WITHOUT ROWID
+        ''',
+        # v2
+        '''
+        CREATE TABLE IF NOT EXISTS achievement_progress (
+            user_key INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            state BLOB NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+        ''',
+        # v3; day as in daily_score_rollups
+        '''
+        CREATE TABLE IF NOT EXISTS daily_results (
+            day INTEGER NOT NULL,
+            user_key INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            accuracy REAL NOT NULL,
+            time_taken INTEGER NOT NULL,
+            submitted_at INTEGER NOT NULL,
+            PRIMARY KEY (day, user_key)
+        ) WITHOUT ROWID
+        ''',
+    )
+    # Scalar subqueries rather than joins keep the views single-table, so
+    # MAX(rowid) and rowid/ts ranges go straight to the scores indexes
+    VIEWS = (
+        '''
+        CREATE TEMP VIEW IF NOT EXISTS users AS
+        SELECT id, username, email, password,
+               strftime('%Y-%m-%dT%H:%M:%S', created_at / 1000000, 'unixepoch')
+                   || printf('.%06d+00:00', created_at % 1000000) AS created_at,
+               total_games_played, total_score
+        FROM accounts
+        ''',
+        '''
+        CREATE TEMP VIEW IF NOT EXISTS game_scores AS
+        SELECT s.key AS rowid,
+               lower(substr(hex(s.uuid), 1, 8) || '-' || substr(hex(s.uuid), 9, 4) || '-'
+                     || substr(hex(s.uuid), 13, 4) || '-' || substr(hex(s.uuid), 17, 4) || '-'
+                     || substr(hex(s.uuid), 21)) AS id,
+               (SELECT id FROM accounts WHERE key = s.user_key) AS user_id,
+               (SELECT name FROM game_types WHERE key = s.game) AS game_type,
+               s.score, s.accuracy, s.time_taken, s.ai_baseline_score, s.ai_baseline_accuracy,
+               strftime('%Y-%m-%dT%H:%M:%S', s.ts / 1000000, 'unixepoch')
+                   || printf('.%06d+00:00', s.ts % 1000000) AS timestamp,
+               s.flag, s.ts
+        FROM scores s
+        ''',
+        '''
+        CREATE TEMP TRIGGER IF NOT EXISTS game_scores_update INSTEAD OF UPDATE OF flag ON game_scores
+        BEGIN
+            UPDATE scores SET flag = NEW.flag WHERE key = OLD.rowid;
+        END
+        ''',
+        '''
+        CREATE TEMP TRIGGER IF NOT EXISTS game_scores_delete INSTEAD OF DELETE ON game_scores
+        BEGIN
+            DELETE FROM scores WHERE key = OLD.rowid;
+        END
+        ''',
+        '''
+        CREATE TEMP TRIGGER IF NOT EXISTS users_update INSTEAD OF UPDATE OF total_games_played, total_score ON users
+        BEGIN
+            UPDATE accounts SET total_games_played = NEW.total_games_played, total_score = NEW.total_score
+            WHERE id = OLD.id;
+        END
+        ''',
+    )
+    INDEXES = (
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_scores_key ON scores (key)',
+        # History filtered by game; the clustered key serves the unfiltered one
+        'CREATE INDEX IF NOT EXISTS idx_scores_user_game_ts ON scores (user_key, game, ts)',
+        'CREATE INDEX IF NOT EXISTS idx_scores_ts ON scores (ts)',
+        'CREATE INDEX IF NOT EXISTS idx_accounts_total_score ON accounts (total_score DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_daily_results_rank ON daily_results (day, score DESC, time_taken, submitted_at)',
+    )
+    SCORE_COLUMNS = ('uuid, user_key, game, score, accuracy, time_taken, '
+                     'ai_baseline_score, ai_baseline_accuracy, ts, flag')
+
+    def __init__(self, path, pool_size: int = 4):
+        super().__init__(path, pool_size)
+        self._game_keys: Dict[str, int] = {}
+        self._game_names: Dict[int, str] = {}
+
+    async def _migrate(self):
+        async with self.connect() as db:
+            await self._check_layout(db)
+            async with db.execute('PRAGMA user_version') as cursor:
+                current = (await cursor.fetchone())[0] >= self.SCHEMA_VERSION
+            if not current:
+                await db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                await db.execute('PRAGMA journal_mode=WAL')
+                for statement in self.TABLES + self.INDEXES:
+                    await db.execute(statement)
+                await db.executemany('INSERT OR IGNORE INTO game_types (name) VALUES (?)',
+                                     [(game_type,) for game_type in GAME_TYPES])
+                await db.execute('''
+                    INSERT OR IGNORE INTO accounts (id, username, email, password, created_at)
+                    VALUES ('guest', 'Guest', 'guest@example.com', '', ?)
+                ''', (to_micros(datetime.now(timezone.utc)),))
+                await db.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+                await db.commit()
+            await self._load_game_types(db)
+
+    async def _load_game_types(self, db):
+        async with db.execute('SELECT key, name FROM game_types') as cursor:
+            for key, name in await cursor.fetchall():
+                self._game_keys[name] = key
+                self._game_names[key] = name
+
+    async def _game_key(self, db, game_type: str) -> int:
+        key = self._game_keys.get(game_type)
+        if key is None:
+            # New game type (or added by another worker since start)
+            await db.execute('INSERT OR IGNORE INTO game_types (name) VALUES (?)', (game_type,))
+            await self._load_game_types(db)
+            key = self._game_keys[game_type]
+        return key
+
+    async def _know_games(self, db, keys):
+        """Reload game_types if another worker has added one of ``keys``."""
+        if not self._game_names.keys() >= set(keys):
+            await self._load_game_types(db)
+
+    @staticmethod
+    async def _user_key(db, user_id: str) -> Optional[int]:
+        async with db.execute('SELECT key FROM accounts WHERE id = ?', (user_id,)) as cursor:
+            row = await cursor.fetchone()
+        return row[0] if row else None
+
+    def _score(self, row, user_id: str) -> Dict[str, Any]:
+        return {'id': str(uuid.UUID(bytes=row['uuid'])), 'user_id': user_id,
+                'game_type': self._game_names[row['game']], 'score': row['score'], 'accuracy': row['accuracy'],
+                'time_taken': row['time_taken'], 'ai_baseline_score': row['ai_baseline_score'],
+                'ai_baseline_accuracy': row['ai_baseline_accuracy'], 'timestamp': from_micros(row['ts']),
+                'flag': row['flag']}
+
+    async def get_user(self, user_id):
+        async with self.connect() as db:
+            async with db.execute(f'SELECT {self.USER_COLUMNS} FROM accounts WHERE id = ?',
+                                  (user_id,)) as cursor:
+                row = await cursor.fetchone()
+        return UserRecord.from_row(row) if row else None
+
+    async def get_user_credentials(self, username):
+        async with self.connect() as db:
+            async with db.execute(f'SELECT {self.USER_COLUMNS}, password FROM accounts WHERE username = ?',
+                                  (username,)) as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            return None
+        return UserRecord.from_row(row), row['password']
+
+    async def user_exists(self, username, email):
+        async with self.connect() as db:
+            async with db.execute('''
+                SELECT EXISTS (SELECT 1 FROM accounts WHERE username = ?)
+                    OR EXISTS (SELECT 1 FROM accounts WHERE email = ?)
+            ''', (username, email)) as cursor:
+                return bool((await cursor.fetchone())[0])
+
+    async def create_user(self, user, password_hash):
+        async with self.connect() as db:
+            cursor = await db.execute('''
+                INSERT INTO accounts (id, username, email, password, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT DO NOTHING
+            ''', (user['id'], user['username'], user['email'], password_hash, to_micros(user['created_at'])))
+            if cursor.rowcount == 0:
+                raise DuplicateUserError(user['username'])
+            await db.commit()
+
+    async def record_scores(self, scores, ratings=(), progress=()):
+        if not scores:
+            return
+        totals = _user_totals(scores)
+        async with self.connect() as db:
+            # Keys come from MAX(key): take the write lock before reading it
+            await db.execute('BEGIN IMMEDIATE')
+            try:
+                user_keys = {}
+                for user_id in {s['user_id'] for s in scores} | {r['user_id'] for r in (*ratings, *progress)}:
+                    user_keys[user_id] = await self._user_key(db, user_id)
+                    if user_keys[user_id] is None:
+                        raise ValueError(f"Unknown user: {user_id}")
+                game_keys = {game_type: await self._game_key(db, game_type)
+                             for game_type in {s['game_type'] for s in scores} | {r['game_type'] for r in ratings}}
+                async with db.execute('SELECT COALESCE(MAX(key), 0) FROM scores') as cursor:
+                    last_key = (await cursor.fetchone())[0]
+                await db.executemany(f'''
+                    INSERT INTO scores (key, {self.SCORE_COLUMNS})
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(last_key + i, uuid.UUID(s['id']).bytes, user_keys[s['user_id']], game_keys[s['game_type']],
+                       s['score'], s['accuracy'], s['time_taken'], s['ai_baseline_score'],
+                       s['ai_baseline_accuracy'], to_micros(s['timestamp']), s.get('flag'))
+                      for i, s in enumerate(scores, 1)])
+                await db.executemany('''
+                    UPDATE accounts SET total_games_played = total_games_played + ?,
+                                        total_score = total_score + ?
+                    WHERE key = ?
+                ''', [(games, points, user_keys[user_id]) for user_id, (games, points) in totals.items()])
+                if ratings:
+                    cursor = await db.executemany('''
+                        INSERT INTO skill_ratings (user_key, game, rating, deviation, games, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (user_key, game) DO UPDATE
+                        SET rating = excluded.rating, deviation = excluded.deviation, games = excluded.games,
+                            updated_at = excluded.updated_at
+                        WHERE skill_ratings.games = excluded.games - 1
+                    ''', [(user_keys[r['user_id']], game_keys[r['game_type']], r['rating'], r['deviation'],
+                           r['games'], to_micros(r['updated_at'])) for r in ratings])
+                    if cursor.rowcount != len(ratings):
+                        raise StaleRatingError(', '.join(r['user_id'] for r in ratings))
+                if progress:
+                    cursor = await db.executemany('''
+                        INSERT INTO achievement_progress (user_key, version, state, updated_at) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (user_key) DO UPDATE
+                        SET version = excluded.version, state = excluded.state, updated_at = excluded.updated_at
+                        WHERE achievement_progress.version = excluded.version - 1
+                    ''', [(user_keys[p['user_id']], p['version'], orjson.dumps(p['state']),
+                           to_micros(p['updated_at'])) for p in progress])
+                    if cursor.rowcount != len(progress):
+                        raise StaleProgressError(', '.join(p['user_id'] for p in progress))
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+
+    async def get_skill_ratings(self, user_id):
+        async with self.connect() as db:
+            async with db.execute('''
+                SELECT game, rating, deviation, games, updated_at FROM skill_ratings
+                WHERE user_key = (SELECT key FROM accounts WHERE id = ?)
+            ''', (user_id,)) as cursor:
+                rows = await cursor.fetchall()
+            await self._know_games(db, [row['game'] for row in rows])
+        return {self._game_names[row['game']]: {'rating': row['rating'], 'deviation': row['deviation'],
+                                                'games': row['games'], 'updated_at': from_micros(row['updated_at'])}
+                for row in rows}
+
+    async def get_achievement_progress(self, user_id):
+        async with self.connect() as db:
+            async with db.execute('''
+                SELECT version, state, updated_at FROM achievement_progress
+                WHERE user_key = (SELECT key FROM accounts WHERE id = ?)
+            ''', (user_id,)) as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            return None
+        return {'version': row['version'], 'state': orjson.loads(row['state']),
+                'updated_at': from_micros(row['updated_at'])}
+
+    async def score_history(self, user_id, limit, game_type=None, since=None, until=None, before=None):
+        async with self.connect() as db:
+            user_key = await self._user_key(db, user_id)
+            if game_type and game_type not in self._game_keys:
+                await self._load_game_types(db)
+            if user_key is None or (game_type and game_type not in self._game_keys):
+                return []
+            clauses = ['user_key = ?']
+            params: List[Any] = [user_key]
+            if game_type:
+                clauses.append('game = ?')
+                params.append(self._game_keys[game_type])
+            if since:
+                clauses.append('ts >= ?')
+                params.append(to_micros(since))
+            if until:
+                clauses.append('ts < ?')
+                params.append(to_micros(until))
+            if before:
+                # Ties on ts go by uuid, whose bytes sort like the id strings of the other layouts
+                ts = to_micros(before[0])
+                clauses.append('ts <= ? AND (ts < ? OR uuid < ?)')
+                params.extend((ts, ts, uuid.UUID(before[1]).bytes))
+            params.append(limit)
+            # Only rows sharing a ts are sorted (by uuid); the rest comes in index order
+            async with db.execute(f'''
+                SELECT {self.SCORE_COLUMNS} FROM scores
+                WHERE {' AND '.join(clauses)}
+                ORDER BY ts DESC, uuid DESC
+                LIMIT ?
+            ''', params) as cursor:
+                rows = await cursor.fetchall()
+            await self._know_games(db, [row['game'] for row in rows])
+        return [self._score(row, user_id) for row in rows]
+
+    async def top_users(self, limit=10):
+        async with self.connect() as db:
+            async with db.execute(f'''
+                SELECT {self.USER_COLUMNS} FROM accounts
+                WHERE id != 'guest'
+                ORDER BY total_score DESC
+                LIMIT ?
+            ''', (limit,)) as cursor:
+                rows = await cursor.fetchall()
+        return [UserRecord.from_row(row) for row in rows]
+
+    async def window_top_users(self, since, until=None, limit=10):
+        clauses = ['ts >= :since', 'flag IS NULL']
+        params: Dict[str, Any] = {'since': to_micros(since), 'limit': limit}
+        if until:
+            clauses.append('ts < :until')
+            params['until'] = to_micros(until)
+        async with self.connect() as db:
+            async with db.execute(f'''
+                SELECT a.id, a.username, w.total_score, w.games_played
+                FROM (
+                    SELECT user_key, SUM(score) AS total_score, COUNT(*) AS games_played
+                    FROM scores
+                    WHERE {' AND '.join(clauses)}
+                    GROUP BY user_key
+                ) w
+                JOIN accounts a ON a.key = w.user_key
+                WHERE a.id != 'guest'
+                ORDER BY w.total_score DESC, a.id
+                LIMIT :limit
+            ''', params) as cursor:
+                rows = await cursor.fetchall()
+        return [dict(zip(row.keys(), row)) for row in rows]
+
+    async def user_game_stats(self, user_id):
+        async with self.connect() as db:
+            async with db.execute('''
+                SELECT game, SUM(games) AS games_played, SUM(accuracy_sum) / SUM(games) AS avg_accuracy,
+                       CAST(SUM(time_sum) AS REAL) / SUM(games) AS avg_time, MAX(best_score) AS best_score
+                FROM (
+                    SELECT game, COUNT(*) AS games, SUM(accuracy) AS accuracy_sum,
+                           SUM(time_taken) AS time_sum, MAX(score) AS best_score
+                    FROM scores
+                    WHERE user_key = (SELECT key FROM accounts WHERE id = :user_id)
+                    GROUP BY game
+                    UNION ALL
+                    SELECT game, SUM(games), SUM(accuracy_sum), SUM(time_sum), MAX(best_score)
+                    FROM daily_score_rollups
+                    WHERE user_key = (SELECT key FROM accounts WHERE id = :user_id)
+                    GROUP BY game
+                )
+                GROUP BY game
+            ''', {'user_id': user_id}) as cursor:
+                rows = await cursor.fetchall()
+            await self._know_games(db, [row['game'] for row in rows])
+        return {self._game_names[row['game']]: {key: row[key] for key in self.GAME_STATS_COLUMNS} for row in rows}
+
+    async def record_daily_result(self, result):
+        async with self.connect() as db:
+            user_key = await self._user_key(db, result['user_id'])
+            if user_key is None:
+                # OR IGNORE would also swallow the NULL key, reporting a first result as a repeat
+                raise ValueError(f"Unknown user: {result['user_id']}")
+            cursor = await db.execute('''
+                INSERT OR IGNORE INTO daily_results (day, user_key, score, accuracy, time_taken, submitted_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (result['day'].toordinal() - EPOCH_DAY, user_key, result['score'], result['accuracy'],
+                  result['time_taken'], to_micros(result['submitted_at'])))
+            await db.commit()
+        return cursor.rowcount == 1
+
+    async def daily_top(self, day, limit=100):
+        # Ties on time and submission go to the lower user id, as on the other layouts
+        async with self.connect() as db:
+            async with db.execute('''
+                SELECT a.id AS user_id, a.username, d.score, d.accuracy, d.time_taken, d.submitted_at
+                FROM daily_results d
+                JOIN accounts a ON a.key = d.user_key
+                WHERE d.day = ?
+                ORDER BY d.score DESC, d.time_taken, d.submitted_at, a.id
+                LIMIT ?
+            ''', (day.toordinal() - EPOCH_DAY, limit)) as cursor:
+                rows = await cursor.fetchall()
+        return [dict(zip(row.keys(), row), submitted_at=from_micros(row['submitted_at'])) for row in rows]
+
+    async def get_daily_result(self, day, user_id):
+        async with self.connect() as db:
+            async with db.execute('''
+                SELECT a.id AS user_id, a.username, d.score, d.accuracy, d.time_taken, d.submitted_at,
+                       1 + (SELECT COUNT(*) FROM daily_results o
+                            WHERE o.day = d.day AND (o.score > d.score OR (o.score = d.score
+                                AND (o.time_taken, o.submitted_at, (SELECT id FROM accounts WHERE key = o.user_key))
+                                    < (d.time_taken, d.submitted_at, a.id)))) AS rank
+                FROM daily_results d
+                JOIN accounts a ON a.key = d.user_key
+                WHERE d.day = ? AND a.id = ?
+            ''', (day.toordinal() - EPOCH_DAY, user_id)) as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip(row.keys(), row), submitted_at=from_micros(row['submitted_at']))
+
+
+class PartitionedSQLiteRepository(SQLiteRepository):
+    """The standard layout with game_scores split into one table per UTC month.
+
+    ``game_scores_2026_10`` holds October 2026, with game_scores' columns
+    and indexes. Reads go to the partitions that overlap their time range,
+    combined with UNION ALL; ordered reads merge the partitions lazily, so
+    a history page or a day's leaderboard touches one or two months however
+    many there are. Retention archives a whole month by dropping its table
+    instead of deleting its rows one by one.
+
+    Rowids are unique across partitions (new scores get the largest one
+    plus one), so ``attach_standard_views`` can show tools a single
+    game_scores view. So are ids: ``id`` is each partition's primary key,
+    and writes check the other partitions for the new ids. Each worker caches the partition list for
+    ``PARTITION_TTL`` seconds and reloads it when a query finds a partition
+    dropped; next month's partition is created ahead (at start and by the
+    first write of every month), so the other workers have loaded it before
+    scores land in it.
+    """
+
+    layout = 'partitioned'
+    PARTITION_TTL = 30.0
+
+    def __init__(self, path, pool_size: int = 4):
+        super().__init__(path, pool_size)
+        self._partitions: List[ScorePartition] = []
+        self._partitions_loaded = float('-inf')
+
+    @classmethod
+    def views(cls, partitions: Sequence[ScorePartition]) -> List[str]:
+        """TEMP game_scores over ``partitions``, with flag updates and deletes routed by rowid."""
+        return [
+            'CREATE TEMP VIEW game_scores AS ' + cls._union(
+                f'SELECT rowid AS rowid, {cls.SCORE_COLUMNS} FROM {{table}}', [p.table for p in partitions]),
+            'CREATE TEMP TRIGGER game_scores_update INSTEAD OF UPDATE OF flag ON game_scores BEGIN '
+            + ''.join(f'UPDATE {p.table} SET flag = NEW.flag WHERE rowid = OLD.rowid; ' for p in partitions)
+            + 'END',
+            'CREATE TEMP TRIGGER game_scores_delete INSTEAD OF DELETE ON game_scores BEGIN '
+            + ''.join(f'DELETE FROM {p.table} WHERE rowid = OLD.rowid; ' for p in partitions)
+            + 'END',
+        ]
+
+    @staticmethod
+    def _months_ahead() -> List[ScorePartition]:
+        """This month's partition and the next one."""
+        this_month = ScorePartition.for_month(datetime.now(timezone.utc))
+        return [this_month, ScorePartition.for_month(this_month.end)]
+
+    async def _migrate(self):
+        await super()._migrate()
+        async with self.connect() as db:
+            await self._load_partitions(db)
+            if not set(self._months_ahead()) <= set(self._partitions):
+                await db.execute('BEGIN IMMEDIATE')
+                await self._load_partitions(db)
+                await self._create_partitions(db, self._months_ahead())
+                await db.commit()
+
+    async def _create_score_tables(self, db):
+        await self._load_partitions(db)
+        await self._create_partitions(db, self._months_ahead())
+
+    async def _load_partitions(self, db):
+        async with db.execute(PARTITIONS_QUERY) as cursor:
+            self._partitions = [ScorePartition.from_table(row[0]) for row in await cursor.fetchall()]
+        self._partitions_loaded = time.monotonic()
+
+    async def _create_partitions(self, db, partitions: Iterable[ScorePartition]):
+        """Create the missing ones of ``partitions``, in the caller's transaction."""
+        for partition in set(partitions) - set(self._partitions):
+            await db.execute(self.SCORE_TABLE.format(table=partition.table))
+            for statement in self.SCORE_INDEXES:
+                await db.execute(statement.format(table=partition.table))
+            self._partitions.append(partition)
+        self._partitions.sort()
+
+    async def _fetch_scores(self, build, params, since=None, until=None):
+        async with self.connect() as db:
+            reloaded = time.monotonic() - self._partitions_loaded >= self.PARTITION_TTL
+            if reloaded:
+                await self._load_partitions(db)
+            while True:
+                tables = [p.table for p in self._partitions if p.overlaps(since, until)]
+                if not tables:
+                    return []
+                try:
+                    async with db.execute(build(tables), params) as cursor:
+                        return await cursor.fetchall()
+                except sqlite3.OperationalError as exc:
+                    # A partition archived since the list was loaded
+                    if reloaded or 'no such table' not in str(exc):
+                        raise
+                await self._load_partitions(db)
+                reloaded = True
+
+    def _within(self, table, since, until):
+        return ScorePartition.from_table(table).within(since, until)
+
+    async def _check_new_ids(self, db, ids: List[str], tables: List[str]):
+        """Raise IntegrityError if an id is taken in any partition, as game_scores' primary key would.
+
+        Each partition's primary key only covers its own month, so this
+        probes every partition's id index, in the caller's write transaction.
+        """
+        if len(set(ids)) < len(ids):
+            raise sqlite3.IntegrityError("UNIQUE constraint failed: game_scores.id")
+        select = 'SELECT id FROM {table} WHERE id IN (SELECT value FROM json_each(:ids))'
+        async with db.execute(f'{self._union(select, tables)} LIMIT 1',
+                              {'ids': orjson.dumps(ids).decode()}) as cursor:
+            taken = await cursor.fetchone()
+        if taken is not None:
+            raise sqlite3.IntegrityError(f"UNIQUE constraint failed: game_scores.id ({taken[0]})")
+
+    async def record_scores(self, scores, ratings=(), progress=()):
+        if not scores:
+            return
+        partitions = [ScorePartition.for_month(s['timestamp']) for s in scores]
+        async with self.connect() as db:
+            # Rowids continue from the largest in any partition: take the write
+            # lock, then read the partition list another worker may have grown
+            await db.execute('BEGIN IMMEDIATE')
+            try:
+                await self._load_partitions(db)
+                await self._create_partitions(db, partitions + self._months_ahead())
+                select = 'SELECT MAX(rowid) AS last FROM {table}'
+                tables = [p.table for p in self._partitions]
+                async with db.execute(f'SELECT MAX(last) FROM ({self._union(select, tables)})') as cursor:
+                    last_key = (await cursor.fetchone())[0] or 0
+                await self._check_new_ids(db, [s['id'] for s in scores], tables)
+                by_table: Dict[str, List[tuple]] = {}
+                for key, (partition, score) in enumerate(zip(partitions, scores), last_key + 1):
+                    by_table.setdefault(partition.table, []).append((key, *self._score_values(score)))
+                for table, rows in by_table.items():
+                    await db.executemany(f'''
+                        INSERT INTO {table} (rowid, {self.SCORE_COLUMNS})
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', rows)
+                await self._record_totals(db, scores, ratings, progress)
+                await db.commit()
+            except BaseException:
+                await db.rollback()
+                raise
+
+
+class MongoRepository(StorageRepository):
+    name = 'mongo'
+
+    USER_PROJECTION = {'_id': 0, 'id': 1, 'username': 1, 'email': 1, 'created_at': 1,
+                       'total_games_played': 1, 'total_score': 1}
+    SCORE_PROJECTION = {'_id': 0}
+    RATING_PROJECTION = {'_id': 0, 'game_type': 1, 'rating': 1, 'deviation': 1, 'games': 1, 'updated_at': 1}
+    DAILY_PROJECTION = {'_id': 0, 'day': 0}
+
+    def __init__(self, url: str, db_name: str, client=None):
+        if client is None:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            client = AsyncIOMotorClient(url)
+        self.client = client
+        self.db = client[db_name]
+        self.transactions = False
+
+    async def start(self):
+        self.transactions = await self._supports_transactions()
+        if not self.transactions:
+            logger.warning("MongoDB server has no transactions (not a replica set); "
+                           "score writes are not atomic")
+        users, scores = self.db.users, self.db.game_scores
+        await users.create_index('id', unique=True)
+        await users.create_index('username', unique=True)
+        await users.create_index('email', unique=True)
+        await users.create_index([('total_score', -1)])
+        await scores.create_index('id', unique=True)
+        await scores.create_index([('user_id', 1), ('timestamp', -1), ('id', -1)])
+        await scores.create_index([('user_id', 1), ('game_type', 1), ('timestamp', -1), ('id', -1)])
+        # Windowed leaderboards
+        await scores.create_index([('timestamp', -1)])
+        await self.db.skill_ratings.create_index([('user_id', 1), ('game_type', 1)], unique=True)
+        await self.db.achievement_progress.create_index('user_id', unique=True)
+        await self.db.daily_results.create_index([('day', 1), ('user_id', 1)], unique=True)
+        await self.db.daily_results.create_index([('day', 1), ('score', -1), ('time_taken', 1), ('submitted_at', 1),
+                                                  ('user_id', 1)])
+        await users.update_one(
+            {'id': 'guest'},
+            {'$setOnInsert': {
+                'id': 'guest', 'username': 'Guest', 'email': 'guest@example.com', 'password': '',
+                'created_at': datetime.now(timezone.utc), 'total_games_played': 0, 'total_score': 0,
+            }},
+            upsert=True
+        )
+
+    async def stop(self):
+        self.client.close()
+
+    async def get_user(self, user_id):
+        document = await self.db.users.find_one({'id': user_id}, self.USER_PROJECTION)
+        return UserRecord.from_row(document) if document else None
+
+    async def get_user_credentials(self, username):
+        projection = dict(self.USER_PROJECTION, password=1)
+        document = await self.db.users.find_one({'username': username}, projection)
+        if document is None:
+            return None
+        return UserRecord.from_row(document), document['password']
+
+    async def user_exists(self, username, email):
+        # Two point lookups on unique indexes instead of one $or scan
+        for field, value in (('username', username), ('email', email)):
+            if value is not None and await self.db.users.find_one({field: value}, {'_id': 1}):
+                return True
+        return False
+
+    async def create_user(self, user, password_hash):
+        from pymongo.errors import DuplicateKeyError
+        document = dict(user, password=password_hash)
+        try:
+            await self.db.users.insert_one(document)
+        except DuplicateKeyError:
+            raise DuplicateUserError(user['username'])
+
+    async def count_users(self):
+        return await self.db.users.count_documents({})
+
+    async def user_names(self, batch_size=50000):
+        batch = []
+        async for user in self.db.users.find({}, {'_id': 0, 'username': 1, 'email': 1}).batch_size(batch_size):
+            batch.append((user['username'], user['email']))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def _supports_transactions(self) -> bool:
+        try:
+            hello = await self.client.admin.command('hello')
+        except Exception:  # an older server, or mongomock
+            return False
+        return 'setName' in hello or hello.get('msg') == 'isdbgrid'
+
+    async def record_scores(self, scores, ratings=(), progress=()):
+        """Write everything in one transaction, or, without transactions, in order.
+
+        Either way the progress and ratings go first, so a stale version is
+        refused before anything else is written. Without a transaction a
+        failure after that leaves the progress and ratings saved (the
+        achievements they record are not awarded again) and, if it comes
+        after the insert, the scores stored but not added to their users'
+        totals. The caller still gets the exception.
+        """
+        if not scores:
+            return
+        if not self.transactions:
+            await self._write_scores(scores, ratings, progress)
+            return
+        async with await self.client.start_session() as session:
+            # Retried on transient errors; StaleProgressError and StaleRatingError abort it
+            await session.with_transaction(
+                lambda session: self._write_scores(scores, ratings, progress, session))
+
+    async def _write_scores(self, scores, ratings, progress, session=None):
+        from pymongo import UpdateOne
+        from pymongo.errors import DuplicateKeyError
+        totals = _user_totals(scores)
+        # First, so stale progress or ratings are refused before anything else is written
+        for p in progress:
+            try:
+                result = await self.db.achievement_progress.update_one(
+                    {'user_id': p['user_id'], 'version': p['version'] - 1}, {'$set': dict(p)}, upsert=p['version'] == 1,
+                    session=session)
+            except DuplicateKeyError:  # version 1, but another worker saved one first
+                raise StaleProgressError(p['user_id'])
+            if not (result.matched_count or result.upserted_id):
+                raise StaleProgressError(p['user_id'])
+        for r in ratings:
+            try:
+                result = await self.db.skill_ratings.update_one(
+                    {'user_id': r['user_id'], 'game_type': r['game_type'], 'games': r['games'] - 1},
+                    {'$set': dict(r)}, upsert=r['games'] == 1, session=session)
+            except DuplicateKeyError:  # first game, but another worker saved one first
+                raise StaleRatingError(r['user_id'])
+            if not (result.matched_count or result.upserted_id):
+                raise StaleRatingError(r['user_id'])
+        # insert_many copies so Mongo's _id is not added to the caller's dicts
+        await self.db.game_scores.insert_many([dict(score) for score in scores], ordered=False, session=session)
+        if totals:
+            await self.db.users.bulk_write([
+                UpdateOne({'id': user_id}, {'$inc': {'total_games_played': games, 'total_score': points}})
+                for user_id, (games, points) in totals.items()
+            ], ordered=False, session=session)
+
+    async def get_skill_ratings(self, user_id):
+        ratings = {}
+        async for document in self.db.skill_ratings.find({'user_id': user_id}, self.RATING_PROJECTION):
+            if document['updated_at'].tzinfo is None:
+                document['updated_at'] = document['updated_at'].replace(tzinfo=timezone.utc)
+            ratings[document.pop('game_type')] = document
+        return ratings
+
+    async def get_achievement_progress(self, user_id):
+        document = await self.db.achievement_progress.find_one(
+            {'user_id': user_id}, {'_id': 0, 'version': 1, 'state': 1, 'updated_at': 1})
+        if document is not None and document['updated_at'].tzinfo is None:
+            document['updated_at'] = document['updated_at'].replace(tzinfo=timezone.utc)
+        return document
+
+    async def score_history(self, user_id, limit, game_type=None, since=None, until=None, before=None):
+        query: Dict[str, Any] = {'user_id': user_id}
+        if game_type:
+            query['game_type'] = game_type
+        window = {}
+        if since:
+            window['$gte'] = since
+        if until:
+            window['$lt'] = until
+        if window:
+            query['timestamp'] = window
+        if before:
+            query['$or'] = [
+                {'timestamp': {'$lt': before[0]}},
+                {'timestamp': before[0], 'id': {'$lt': before[1]}},
+            ]
+        cursor = self.db.game_scores.find(query, self.SCORE_PROJECTION)
+        cursor = cursor.sort([('timestamp', -1), ('id', -1)]).limit(limit)
+        return [self._with_utc(score) for score in await cursor.to_list(limit)]
+
+    @staticmethod
+    def _with_utc(score: Dict[str, Any]) -> Dict[str, Any]:
+        # Mongo hands back naive datetimes that are UTC
+        if score['timestamp'].tzinfo is None:
+            score['timestamp'] = score['timestamp'].replace(tzinfo=timezone.utc)
+        return score
+
+    async def top_users(self, limit=10):
+        cursor = self.db.users.find({'id': {'$ne': 'guest'}}, self.USER_PROJECTION)
+        return [UserRecord.from_row(document)
+                for document in await cursor.sort('total_score', -1).limit(limit).to_list(limit)]
+
+    async def window_top_users(self, since, until=None, limit=10):
+        window = {'$gte': since}
+        if until:
+            window['$lt'] = until
+        pipeline = [
+            {'$match': {'timestamp': window, 'flag': None, 'user_id': {'$ne': 'guest'}}},
+            {'$group': {'_id': '$user_id', 'total_score': {'$sum': '$score'}, 'games_played': {'$sum': 1}}},
+            {'$sort': {'total_score': -1, '_id': 1}},
+            {'$limit': limit},
+        ]
+        leaders = [row async for row in self.db.game_scores.aggregate(pipeline)]
+        cursor = self.db.users.find({'id': {'$in': [row['_id'] for row in leaders]}},
+                                    {'_id': 0, 'id': 1, 'username': 1})
+        usernames = {document['id']: document['username'] async for document in cursor}
+        return [{'id': row['_id'], 'username': usernames.get(row['_id']), 'total_score': row['total_score'],
+                 'games_played': row['games_played']} for row in leaders]
+
+    async def user_game_stats(self, user_id):
+        pipeline = [
+            {'$match': {'user_id': user_id}},
+            {'$group': {
+                '_id': '$game_type',
+                'games_played': {'$sum': 1},
+                'avg_accuracy': {'$avg': '$accuracy'},
+                'avg_time': {'$avg': '$time_taken'},
+                'best_score': {'$max': '$score'},
+            }},
+        ]
+        stats = {}
+        async for row in self.db.game_scores.aggregate(pipeline):
+            game_type = row.pop('_id')
+            stats[game_type] = row
+        return stats
+
+    async def record_daily_result(self, result):
+        from pymongo.errors import DuplicateKeyError
+        # Dates are not BSON types: the day is stored as its ISO string
+        document = dict(result, day=result['day'].isoformat())
+        try:
+            await self.db.daily_results.insert_one(document)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def _with_usernames(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        cursor = self.db.users.find({'id': {'$in': [result['user_id'] for result in results]}},
+                                    {'_id': 0, 'id': 1, 'username': 1})
+        usernames = {document['id']: document['username'] async for document in cursor}
+        for result in results:
+            result['username'] = usernames.get(result['user_id'])
+            if result['submitted_at'].tzinfo is None:
+                result['submitted_at'] = result['submitted_at'].replace(tzinfo=timezone.utc)
+        return results
+
+    async def daily_top(self, day, limit=100):
+        cursor = self.db.daily_results.find({'day': day.isoformat()}, self.DAILY_PROJECTION)
+        cursor = cursor.sort([('score', -1), ('time_taken', 1), ('submitted_at', 1), ('user_id', 1)]).limit(limit)
+        return await self._with_usernames(await cursor.to_list(limit))
+
+    async def get_daily_result(self, day, user_id):
+        result = await self.db.daily_results.find_one({'day': day.isoformat(), 'user_id': user_id},
+                                                      self.DAILY_PROJECTION)
+        if result is None:
+            return None
+        ahead = await self.db.daily_results.count_documents({'day': day.isoformat(), '$or': [
+            {'score': {'$gt': result['score']}},
+            {'score': result['score'], 'time_taken': {'$lt': result['time_taken']}},
+            {'score': result['score'], 'time_taken': result['time_taken'],
+             'submitted_at': {'$lt': result['submitted_at']}},
+            {'score': result['score'], 'time_taken': result['time_taken'],
+             'submitted_at': result['submitted_at'], 'user_id': {'$lt': user_id}},
+        ]})
+        (result,) = await self._with_usernames([result])
+        result['rank'] = ahead + 1
+        return result
+
+
+def create_repository(root_dir) -> StorageRepository:
+    """Build the repository selected by STORAGE_BACKEND ('sqlite' or 'mongo') and SQLITE_SCHEMA."""
+    backend = os.environ.get('STORAGE_BACKEND', 'sqlite')
+    if backend == 'mongo':
+        # MONGO_DB_NAME, since DB_NAME is also the SQLite file; deployments
+        # that only set DB_NAME (as server_mongodb.py used to read) keep their database
+        db_name = os.environ.get('MONGO_DB_NAME') or os.environ.get('DB_NAME', 'cognitive_arena')
+        return MongoRepository(os.environ['MONGO_URL'], db_name)
+    if backend != 'sqlite':
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    path = root_dir / os.environ.get('DB_NAME', 'cognitive_arena.db')
+    pool_size = int(os.environ.get('SQLITE_POOL_SIZE', 4))
+    schema = os.environ.get('SQLITE_SCHEMA', 'standard')
+    if schema == 'compact':
+        return CompactSQLiteRepository(path, pool_size)
+    if schema == 'partitioned':
+        return PartitionedSQLiteRepository(path, pool_size)
+    if schema != 'standard':
+        raise ValueError(f"Unknown SQLITE_SCHEMA: {schema}")
+    return SQLiteRepository(path, pool_size)
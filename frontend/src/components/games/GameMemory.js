@@ -38,7 +38,9 @@ const GameMemory = () => {
 
   const fetchGameData = async () => {
     try {
-      const response = await axios.get(`${API}/games/memory/data?difficulty=${level}`);
+      // Each call opens a new round on the server, which keeps the sequence to score the recall
+      // and picks its difficulty from the player's rating
+      const response = await axios.get(`${API}/games/memory/data`);
       setSequence(response.data.sequence);
       setGameData(response.data);
       setGameState('showing');
@@ -68,7 +70,17 @@ const GameMemory = () => {
     setTimeLeft(seq.length * 3 + 5); // Give time based on sequence length
   };
 
-  const handleNumberClick = (number) => {
+  const submitRound = async (recall) => {
+    try {
+      const response = await axios.post(`${API}/games/memory/rounds/${gameData.round_id}`, { recall });
+      return response.data;
+    } catch (error) {
+      console.error('Error submitting round:', error);
+      return null;
+    }
+  };
+
+  const handleNumberClick = async (number) => {
     if (gameState !== 'input' || showingSequence) return;
 
     const newInput = [...userInput, number];
@@ -77,31 +89,29 @@ const GameMemory = () => {
     // Check if the input is correct so far
     const currentIndex = newInput.length - 1;
     if (sequence[currentIndex] !== number) {
-      // Wrong input
+      // Wrong input ends this round; the server records it
+      submitRound(newInput);
       setMistakes(mistakes + 1);
       setLives(lives - 1);
       
       if (lives <= 1) {
-        handleGameOver();
+        finishGame();
         return;
       }
       
-      // Show mistake and restart current level
+      // Show mistake and retry the level with a new round
       setTimeout(() => {
         setUserInput([]);
-        showSequence(sequence);
+        fetchGameData();
       }, 1000);
       return;
     }
     
     // Check if sequence is complete
     if (newInput.length === sequence.length) {
-      // Level complete!
-      const timeBonus = Math.max(0, timeLeft * 10);
-      const levelBonus = level * 50;
-      const perfectBonus = mistakes === 0 ? 100 : 0;
-      
-      setScore(score + 200 + timeBonus + levelBonus + perfectBonus);
+      // Level complete! The server checks the recall and timing and scores the round
+      const result = await submitRound(newInput);
+      setScore(score + (result ? result.score : 0));
       
       if (level < 5) {
         // Next level
@@ -121,28 +131,14 @@ const GameMemory = () => {
   };
 
   const handleGameOver = () => {
+    // Out of time: submit what was entered so the round is recorded
+    submitRound(userInput);
     finishGame();
   };
 
-  const finishGame = async () => {
-    const endTime = Date.now();
-    const totalTime = Math.round((endTime - startTime) / 1000);
-    const accuracy = Math.max(0, ((level - 1) * 100 - mistakes * 20)) / (level * 100) * 100;
-
+  const finishGame = () => {
+    // Every round was already scored and saved by the server
     setGameState('finished');
-
-    try {
-      const response = await axios.post(`${API}/games/score`, {
-        game_type: 'memory_challenge',
-        score: score,
-        accuracy: accuracy,
-        time_taken: totalTime
-      });
-      
-      console.log('Score submitted:', response.data);
-    } catch (error) {
-      console.error('Error submitting score:', error);
-    }
   };
 
   const restartGame = () => {
@@ -349,7 +345,7 @@ const GameMemory = () => {
               <li>• Watch the sequence of numbers light up</li>
               <li>• Remember the exact order</li>
               <li>• Click the numbers in the same sequence</li>
-              <li>• Each level adds more numbers to remember</li>
+              <li>• Sequences get longer as your rating improves</li>
               <li>• You have 3 lives - don't make mistakes!</li>
             </ul>
           </div>
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+from typing import Any, Callable, Coroutine, NamedTuple
+
+import httpx
+import pytest
+
+# The backend is run from its own directory (uvicorn server:app), so its modules import each other by name
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "slow: boots the app in subprocesses; deselect with -m 'not slow'")
+
+
+@pytest.fixture(scope='session')
+def server(tmp_path_factory):
+    """The server module, imported once with every database under a temporary directory."""
+    from bench import startup_env
+
+    os.environ.update(startup_env(tmp_path_factory.mktemp('server')))
+    import server
+    return server
+
+
+class RunningApp(NamedTuple):
+    run: Callable[[Coroutine], Any]  # drives a coroutine on the app's event loop
+    client: httpx.AsyncClient
+
+
+@pytest.fixture(scope='session')
+def api(server):
+    """The app, started once for the session on its own event loop.
+
+    A worker only starts and stops once, so tests share it and its
+    databases: each creates its own players.
+    """
+    from bench import AppLifespan
+
+    loop = asyncio.new_event_loop()
+    lifespan = AppLifespan(server.app)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url='http://test')
+    loop.run_until_complete(lifespan.__aenter__())
+    try:
+        yield RunningApp(loop.run_until_complete, client)
+    finally:
+        loop.run_until_complete(client.aclose())
+        loop.run_until_complete(lifespan.__aexit__(None, None, None))
+        loop.close()
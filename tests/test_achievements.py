@@ -0,0 +1,35 @@
+import uuid
+from datetime import datetime, timezone
+
+from achievements import AchievementRules, AchievementState, AchievementTracker
+
+
+def test_a_save_refused_for_stale_progress_is_replayed_on_the_saved_one(server, api):
+    user_id = str(uuid.uuid4())
+
+    async def run():
+        await server.storage.create_user({'id': user_id, 'username': f'p{user_id[:8]}',
+                                          'email': f'{user_id}@example.com',
+                                          'created_at': datetime.now(timezone.utc)}, 'hash')
+        tracker = server.achievement_tracker
+        conflicts = tracker.conflicts
+        # This worker has the player's empty progress cached when another one saves their first game
+        await tracker.get(user_id)
+        other = AchievementTracker(AchievementRules(), load=server.storage.get_achievement_progress)
+        lost = server.GameScore(user_id=user_id, game_type='text_ai', score=0, accuracy=10.0, time_taken=30,
+                                ai_baseline_score=0, ai_baseline_accuracy=88.7).model_dump()
+        state, theirs = other.apply(await other.get(user_id), lost)
+        await server.storage.record_score(lost, progress=[state.to_row(user_id)])
+
+        _, ours, _ = await server.record_game_score(user_id, 'text_ai', 100, 95.0, 30)
+        saved = AchievementState.from_row(await server.storage.get_achievement_progress(user_id))
+        return lost, [a.id for a in theirs], ours, saved, await tracker.get(user_id), tracker.conflicts - conflicts
+
+    lost, theirs, ours, saved, cached, conflicts = api.run(run())
+    assert conflicts == 1
+    # First Steps went to the other worker's save; the retry only adds the win
+    assert theirs == ['first_game'] and ours == ['first_win']
+    assert saved.version == 2 and saved == cached
+    assert saved.unlocked['first_game'] == lost['timestamp'].timestamp()
+    assert set(saved.unlocked) == {'first_game', 'first_win'}
+    assert saved.counters['total:*:'] == 100
@@ -0,0 +1,61 @@
+import sqlite3
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+analytics = pytest.importorskip('analytics')
+
+
+def _scores_db(path, scores):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE game_scores (id TEXT, user_id TEXT, game_type TEXT, score INTEGER, accuracy REAL, '
+                  'time_taken INTEGER, ai_baseline_score INTEGER, ai_baseline_accuracy REAL, timestamp TEXT, '
+                  'flag TEXT)')
+    now = datetime.now(timezone.utc).isoformat()
+    conn.executemany('INSERT INTO game_scores VALUES (?, ?, ?, ?, 80, 30, 200, 80, ?, NULL)',
+                     [(str(i), 'u', game_type, score, now) for i, (game_type, score) in enumerate(scores)])
+    conn.commit()
+    conn.close()
+
+
+def test_an_absurd_score_shares_the_top_bucket(tmp_path):
+    path = tmp_path / 'scores.db'
+    _scores_db(path, [('ai_image', score) for score in range(100, 200)] + [('ai_image', 10 ** 12)])
+    snapshot = analytics.ScoreAnalytics(path)
+    assert snapshot.refresh() == 101
+    histogram = snapshot.histograms['ai_image']
+    assert len(histogram) == analytics.HISTOGRAM_MAX_SCORE + 1 and histogram[-1] == 1
+    assert snapshot.percentiles('ai_image')['p50'] == 150
+    assert snapshot.summary()['games']['ai_image']['games_played'] == 101
+
+
+def test_a_row_that_cannot_be_folded_is_skipped(tmp_path, monkeypatch):
+    path = tmp_path / 'scores.db'
+    _scores_db(path, [('ai_image', 100), ('text_ai', 666), ('ai_image', 300)])
+    snapshot = analytics.ScoreAnalytics(path)
+    fold = snapshot._fold
+
+    def failing_fold(chunk):
+        if (chunk['score'] == 666).any():
+            raise MemoryError("bad row")
+        fold(chunk)
+
+    monkeypatch.setattr(snapshot, '_fold', failing_fold)
+    assert snapshot.refresh() == 3
+    assert snapshot.watermark == 3
+    assert list(snapshot.histograms) == ['ai_image']
+    assert int(np.sum(snapshot.histograms['ai_image'])) == 2
+
+
+def test_loading_an_oversized_snapshot_caps_it(tmp_path):
+    path = tmp_path / 'scores.db'
+    _scores_db(path, [])
+    snapshot = analytics.ScoreAnalytics(path)
+    counts = np.zeros(analytics.HISTOGRAM_MAX_SCORE + 10, dtype=np.int64)
+    counts[[5, -1]] = 1
+    snapshot.histograms = {'ai_image': counts}
+    snapshot.save(tmp_path / 'snapshot.npz')
+    loaded = analytics.ScoreAnalytics(path, tmp_path / 'snapshot.npz')
+    assert len(loaded.histograms['ai_image']) == analytics.HISTOGRAM_MAX_SCORE + 1
+    assert loaded.histograms['ai_image'][-1] == 1 and loaded.histograms['ai_image'][5] == 1
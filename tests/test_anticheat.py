@@ -0,0 +1,30 @@
+from anticheat import ACCEPT, GAME_LIMITS, QUARANTINE, ScoreDetector
+from memory_rounds import MAX_DIFFICULTY, MemoryRound, new_sequence, score_recall, show_seconds
+from storage import GAME_TYPES
+
+
+def test_every_game_has_limits():
+    assert set(GAME_LIMITS) == set(GAME_TYPES)
+
+
+def test_unknown_game_is_quarantined_without_keeping_statistics():
+    detector = ScoreDetector()
+    verdict = detector.check('u1', 'made_up', 10 ** 12, 100.0, 30)
+    assert verdict == (QUARANTINE, ('unknown_game',))
+    assert 'made_up' not in detector.score_stats and not detector._users
+
+
+def test_scores_beyond_the_game_maximum_are_quarantined():
+    detector = ScoreDetector()
+    assert detector.check('u1', 'ai_image', 480, 100.0, 3).action == ACCEPT
+    assert detector.check('u2', 'ai_image', 481, 100.0, 3).reasons == ('score_exceeds_answers',)
+    assert detector.check('u3', 'memory_challenge', 10 ** 6, 100.0, 60).action == QUARANTINE
+
+
+def test_fastest_perfect_memory_round_at_the_hardest_level_is_accepted():
+    sequence = new_sequence(MAX_DIFFICULTY)
+    elapsed = show_seconds(len(sequence)) + len(sequence) * 0.15
+    result = score_recall(MemoryRound(bytes(sequence), MAX_DIFFICULTY, 0.0), sequence, elapsed)
+    assert result.completed
+    verdict = ScoreDetector().check('u1', 'memory_challenge', result.score, result.accuracy, result.time_taken)
+    assert verdict.action == ACCEPT
@@ -0,0 +1,97 @@
+import asyncio
+import random
+import string
+
+from bloom import BloomFilter, TakenNames
+
+
+def _names(n, seed):
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + '._-éß名'
+    return [''.join(rng.choices(alphabet, k=rng.randrange(1, 24))) for _ in range(n)]
+
+
+def _accounts(names):
+    return [(name, f'{name}@example.com') for name in names]
+
+
+def test_an_added_name_is_never_free():
+    names = _names(5000, seed=1)
+    one_by_one, bulk = BloomFilter(len(names)), BloomFilter(len(names))
+    for name in names:
+        one_by_one.add(name)
+    bulk.add_many(names[:2000])
+    bulk.add_many(names[2000:])
+    assert all(name in one_by_one and name in bulk for name in names)
+    # Both ways of adding set the same bits
+    assert one_by_one._bits == bulk._bits
+    # And the filter still turns most free names away
+    added = set(names)
+    free = [name for name in _names(5000, seed=2) if name not in added]
+    false_positives = sum(name in bulk for name in free)
+    assert false_positives <= 5 * bulk.error_rate * len(free) + 5
+
+
+def test_names_registered_during_a_rebuild_are_kept():
+    stored = _accounts(_names(300, seed=3))
+    during = _accounts(_names(30, seed=4))
+
+    async def run():
+        taken = None
+
+        async def load():
+            # Accounts registered (and announced on the bus) while the build reads storage
+            for n in range(3):
+                yield stored[100 * n:100 * (n + 1)]
+                for username, email in during[10 * n:10 * (n + 1)]:
+                    taken.on_event('taken_username', username)
+                    taken.on_event('taken_email', email)
+
+        async def count():
+            return len(stored)
+
+        taken = TakenNames(load, count, min_capacity=10)
+        assert taken.might_be_taken('username', stored[0][0])  # not built yet
+        await taken.start()
+        await taken._task
+        return taken
+
+    taken = asyncio.run(run())
+    assert taken.ready
+    for username, email in stored + during:
+        assert taken.might_be_taken('username', username) and taken.might_be_taken('email', email)
+
+
+def test_names_added_while_a_full_filter_is_rebuilt_are_kept():
+    stored = _accounts(_names(50, seed=5))
+    later = _accounts(_names(60, seed=6))
+
+    async def run():
+        loads = []
+
+        async def load():
+            loads.append(len(stored))
+            snapshot = list(stored)
+            for i in range(0, len(snapshot), 10):
+                await asyncio.sleep(0)  # lets registrations in mid-read
+                yield snapshot[i:i + 10]
+
+        async def count():
+            return len(stored)
+
+        taken = TakenNames(load, count, headroom=1.0, min_capacity=50)
+        await taken.rebuild()
+        # Past capacity, each registration while the rebuild runs lands in storage and on the bus
+        for account in later:
+            stored.append(account)
+            taken.add('username', account[0])
+            taken.add('email', account[1])
+            await asyncio.sleep(0)
+        while taken._task is not None and not taken._task.done():
+            await asyncio.sleep(0)
+        return taken, loads
+
+    taken, loads = asyncio.run(run())
+    assert len(loads) >= 2 and taken._filters['username'].capacity > 50
+    for username, email in stored:
+        assert taken.might_be_taken('username', username) and taken.might_be_taken('email', email)
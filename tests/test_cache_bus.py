@@ -0,0 +1,147 @@
+import asyncio
+import multiprocessing
+
+from cache_bus import InvalidationBus, LocalCache, SQLiteInvalidationBus, create_bus
+
+
+def test_local_cache_expires_entries():
+    cache = LocalCache(ttl=60)
+    cache.set('user', 'u1', {'id': 'u1'})
+    cache.set('user', 'u2', {'id': 'u2'}, ttl=-1)
+    assert cache.get('user', 'u1') == {'id': 'u1'}
+    assert cache.get('user', 'u2', 'missing') == 'missing'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_invalidate_drops_one_key_or_the_whole_channel():
+    cache = LocalCache()
+    cache.set('user', 'u1', 1)
+    cache.set('user', 'u2', 2)
+    cache.set('leaderboard', None, [])
+    cache.invalidate('user', 'u1')
+    assert cache.get('user', 'u1') is None and cache.get('user', 'u2') == 2
+    cache.invalidate('user')
+    assert cache.get('user', 'u2') is None
+    assert cache.get('leaderboard') == []
+
+
+def test_local_bus_dispatches_at_once_and_survives_a_failing_subscriber():
+    bus = create_bus('local', None)
+    assert type(bus) is InvalidationBus
+    received = []
+
+    def broken(channel, key):
+        raise RuntimeError("subscriber bug")
+
+    bus.subscribe(broken)
+    bus.subscribe(lambda channel, key: received.append((channel, key)))
+    asyncio.run(bus.publish('user', 'u1'))
+    assert received == [('user', 'u1')]
+
+
+async def _wait_for(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "event not delivered"
+        await asyncio.sleep(0.01)
+
+
+def test_sqlite_bus_reaches_other_workers_once(tmp_path):
+    async def run():
+        path = tmp_path / 'cache_bus.db'
+        first, second = SQLiteInvalidationBus(path), SQLiteInvalidationBus(path)
+        seen = {'first': [], 'second': []}
+        first.subscribe(lambda channel, key: seen['first'].append((channel, key)))
+        second.subscribe(lambda channel, key: seen['second'].append((channel, key)))
+        await first.start()
+        await second.start()
+        try:
+            await first.publish('user', 'u1')
+            await first.publish('leaderboard')
+            # The publisher's own subscribers ran straight away
+            assert seen['first'] == [('user', 'u1'), ('leaderboard', None)]
+            await _wait_for(lambda: len(seen['second']) == 2)
+            await first.poll()
+            await asyncio.sleep(0.05)
+        finally:
+            await first.stop()
+            await second.stop()
+        return seen
+
+    seen = asyncio.run(run())
+    assert seen['second'] == [('user', 'u1'), ('leaderboard', None)]
+    assert len(seen['first']) == 2  # not dispatched again when read back from the table
+
+
+def test_sqlite_bus_starts_from_the_tail(tmp_path):
+    async def run():
+        path = tmp_path / 'cache_bus.db'
+        publisher = SQLiteInvalidationBus(path)
+        await publisher.start()
+        await publisher.publish('user', 'before')
+        late = SQLiteInvalidationBus(path)
+        received = []
+        late.subscribe(lambda channel, key: received.append(key))
+        await late.start()
+        try:
+            await publisher.publish('user', 'after')
+            await _wait_for(lambda: received)
+        finally:
+            await publisher.stop()
+            await late.stop()
+        return received
+
+    assert asyncio.run(run()) == ['after']
+
+
+def test_sqlite_bus_prunes_old_events(tmp_path):
+    async def run():
+        bus = SQLiteInvalidationBus(tmp_path / 'cache_bus.db', retention=0)
+        await bus.start()
+        try:
+            await bus.publish('user', 'u1')
+            await asyncio.sleep(0.01)
+            await bus.poll()
+            async with bus._db.execute('SELECT COUNT(*) FROM cache_events') as cursor:
+                return (await cursor.fetchone())[0]
+        finally:
+            await bus.stop()
+
+    assert asyncio.run(run()) == 0
+
+
+def _publish_from_another_process(path, ready, count):
+    async def run():
+        bus = SQLiteInvalidationBus(path)
+        await bus.start()
+        ready.wait(10)
+        for i in range(count):
+            await bus.publish('user', f"u{i}")
+        await bus.stop()
+
+    asyncio.run(run())
+
+
+def test_sqlite_bus_across_processes(tmp_path):
+    path = tmp_path / 'cache_bus.db'
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Event()
+
+    async def run():
+        bus = SQLiteInvalidationBus(path)
+        received = []
+        bus.subscribe(lambda channel, key: received.append(key))
+        await bus.start()
+        proc = ctx.Process(target=_publish_from_another_process, args=(path, ready, 20))
+        proc.start()
+        ready.set()
+        try:
+            await _wait_for(lambda: len(received) == 20, timeout=30)
+        finally:
+            await bus.stop()
+            await asyncio.to_thread(proc.join, 30)
+        return received, proc.exitcode
+
+    received, exitcode = asyncio.run(run())
+    assert exitcode == 0
+    assert received == [f"u{i}" for i in range(20)]
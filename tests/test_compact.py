@@ -0,0 +1,131 @@
+import asyncio
+import random
+import sqlite3
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+import compact
+from retention import run_retention
+from storage import GAME_TYPES, CompactSQLiteRepository, SQLiteRepository, attach_standard_views
+
+NOW = datetime(2026, 6, 15, 12, 0, tzinfo=timezone.utc)
+DAY = date(2026, 6, 14)
+USERS = [str(uuid.UUID(int=i + 1)) for i in range(4)]
+
+
+def seed_standard(path, archive_dir):
+    """A standard-layout file with scores (some flagged, some sharing a timestamp), ratings,
+    achievement progress, daily results and the rollups of archived scores."""
+    rng = random.Random(5)
+
+    async def run():
+        repo = SQLiteRepository(path)
+        await repo.start()
+        try:
+            for i, user_id in enumerate(USERS):
+                await repo.create_user({'id': user_id, 'username': f'player{i}', 'email': f'player{i}@example.com',
+                                        'created_at': NOW - timedelta(days=400)}, 'hash')
+            for user_id in USERS:
+                scores = []
+                for n in range(40):
+                    timestamp = NOW - timedelta(days=rng.randrange(365), seconds=rng.randrange(86400))
+                    scores.append({'id': str(uuid.uuid4()), 'user_id': user_id,
+                                   'game_type': rng.choice(GAME_TYPES), 'score': rng.randrange(1000),
+                                   'accuracy': rng.randrange(1000) / 10, 'time_taken': rng.randrange(1, 300),
+                                   'ai_baseline_score': 90, 'ai_baseline_accuracy': 85.0, 'timestamp': timestamp,
+                                   'flag': 'zero_time' if n % 9 == 0 else None})
+                # Ties on timestamp are paged by id
+                for score in scores[-3:]:
+                    score['timestamp'] = NOW - timedelta(days=3)
+                await repo.record_scores(scores, [
+                    {'user_id': user_id, 'game_type': 'memory_challenge', 'rating': 1400 + rng.random() * 300,
+                     'deviation': 120.5, 'games': 1, 'updated_at': NOW}
+                ], [{'user_id': user_id, 'version': 1, 'state': {'counters': {'count:*:beat_ai': 3}},
+                     'updated_at': NOW}])
+                await repo.record_daily_result({'day': DAY, 'user_id': user_id, 'score': rng.randrange(500),
+                                                'accuracy': 75.0, 'time_taken': rng.randrange(30, 90),
+                                                'submitted_at': NOW - timedelta(hours=20)})
+        finally:
+            await repo.stop()
+
+    asyncio.run(run())
+    # Scores over 200 days old go to the rollups and the archive
+    run_retention(path, archive_dir, days=(datetime.now(timezone.utc) - NOW).days + 200, pause=0)
+
+
+def row_counts(path):
+    conn = sqlite3.connect(path)
+    try:
+        attach_standard_views(conn)
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('users', 'game_scores', 'skill_ratings', 'daily_results', 'daily_score_rollups',
+                              'achievement_progress')}
+    finally:
+        conn.close()
+
+
+async def snapshot(repo):
+    """Everything the API reads back for USERS, through ``repo``."""
+    state = {'count': await repo.count_users(),
+             'top': [(user.id, user.total_score, user.total_games_played) for user in await repo.top_users(10)],
+             'daily': await repo.daily_top(DAY)}
+    for user_id in USERS:
+        # Page through the history with the cursor the API hands out: (timestamp, id) of the last row
+        pages, before = [], None
+        while True:
+            page = await repo.score_history(user_id, 7, before=before)
+            if not page:
+                break
+            pages.append([(s['id'], s['score'], s['flag'], s['timestamp']) for s in page])
+            before = (page[-1]['timestamp'], page[-1]['id'])
+        user = await repo.get_user(user_id)
+        state[user_id] = {
+            'user': (user.username, user.total_score, user.total_games_played),
+            'history': pages,
+            'ratings': await repo.get_skill_ratings(user_id),
+            'progress': await repo.get_achievement_progress(user_id),
+            'stats': await repo.user_game_stats(user_id),
+            'daily': await repo.get_daily_result(DAY, user_id),
+        }
+    return state
+
+
+def read_back(repository, path):
+    async def run():
+        repo = repository(path)
+        await repo.start()
+        try:
+            return await snapshot(repo)
+        finally:
+            await repo.stop()
+
+    return asyncio.run(run())
+
+
+def test_migration_keeps_every_row_and_what_the_api_reads(tmp_path):
+    path = tmp_path / 'scores.db'
+    seed_standard(path, tmp_path / 'archive')
+    counts, before = row_counts(path), read_back(SQLiteRepository, path)
+    assert counts['daily_score_rollups'] and counts['game_scores'] < 4 * 40
+
+    moved = compact.migrate(path)
+
+    assert moved == counts['game_scores']
+    assert row_counts(path) == counts
+    assert read_back(CompactSQLiteRepository, path) == before
+
+
+def test_a_daily_result_for_an_unknown_user_is_refused(tmp_path):
+    async def run():
+        repo = CompactSQLiteRepository(tmp_path / 'compact.db')
+        await repo.start()
+        try:
+            with pytest.raises(ValueError):
+                await repo.record_daily_result({'day': DAY, 'user_id': str(uuid.uuid4()), 'score': 1,
+                                                'accuracy': 50.0, 'time_taken': 30, 'submitted_at': NOW})
+        finally:
+            await repo.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,32 @@
+import asyncio
+
+from .test_history import register
+
+
+def test_a_second_result_for_the_same_day_is_refused(server, api):
+    async def run():
+        _, player = await register(api.client)
+        day = (await api.client.get('/api/daily')).json()['day']
+
+        async def submit(headers, answers, key=None):
+            extra = {'Idempotency-Key': key} if key else {}
+            return await api.client.post('/api/daily/submit', json={'day': day, 'answers': answers, 'time_taken': 60},
+                                         headers=dict(headers, **extra))
+
+        first = await submit(player, [], key='first')
+        retry = await submit(player, [], key='first')  # the same request again: replayed
+        again = await submit(player, [0, 0, 0], key='second')
+        unkeyed = await submit(player, [0, 0, 0])
+        mine = await api.client.get('/api/daily/result', params={'day': day}, headers=player)
+
+        # Two at once from a fresh player: one is stored
+        _, other = await register(api.client)
+        racing = await asyncio.gather(submit(other, []), submit(other, [0]))
+        return first, retry, again, unkeyed, mine, racing
+
+    first, retry, again, unkeyed, mine, racing = api.run(run())
+    assert first.status_code == 200
+    assert retry.status_code == 200 and retry.json() == first.json()
+    assert again.status_code == 409 and unkeyed.status_code == 409
+    assert mine.status_code == 200 and mine.json()['score'] == first.json()['score']
+    assert sorted(response.status_code for response in racing) == [200, 409]
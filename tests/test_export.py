@@ -0,0 +1,77 @@
+import csv
+import io
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from .test_history import register
+
+
+def _scores(user_id, start, n):
+    return [{'id': str(uuid.uuid4()), 'user_id': user_id, 'game_type': 'ai_image', 'score': 10 * i,
+             'accuracy': 50.0 + i, 'time_taken': 5 + i, 'ai_baseline_score': 46, 'ai_baseline_accuracy': 92.5,
+             'timestamp': start + timedelta(minutes=i), 'flag': 'zero_time' if i == 1 else None}
+            for i in range(n)]
+
+
+def _rows(fmt, body):
+    if fmt == 'ndjson':
+        return [json.loads(line) for line in body.decode().splitlines()]
+    if fmt == 'csv':
+        return list(csv.DictReader(io.StringIO(body.decode())))
+    pq = pytest.importorskip('pyarrow.parquet')
+    return pq.read_table(io.BytesIO(body)).to_pylist()
+
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'csv', 'parquet'])
+@pytest.mark.parametrize('include_users', [False, True])
+def test_passing_the_watermark_back_exports_only_newer_scores(server, api, monkeypatch, fmt, include_users):
+    async def run():
+        user_id, headers = await register(api.client)
+        username = (await api.client.get('/api/auth/me', headers=headers)).json()['username']
+        monkeypatch.setattr(server, 'ADMIN_USERNAMES', {username})
+
+        async def export(since=None):
+            params = {'format': fmt, 'include_users': include_users}
+            if since:
+                params['since'] = since
+            response = await api.client.get('/api/admin/export/scores', params=params, headers=headers)
+            assert response.status_code == 200, response.text
+            return response.headers['x-export-watermark'], _rows(fmt, response.content)
+
+        # Scores newer than any other test's, so the watermark is one of ours
+        newest, _ = await export()
+        start = datetime.fromisoformat(newest) if newest else datetime.now(timezone.utc)
+        first = _scores(user_id, start.replace(microsecond=0) + timedelta(seconds=1), 3)
+        await server.storage.record_scores(first)
+
+        watermark, everything = await export()
+        later = _scores(user_id, datetime.fromisoformat(watermark) + timedelta(seconds=1), 2)
+        await server.storage.record_scores(later)
+        next_watermark, newer = await export(since=watermark)
+        _, nothing = await export(since=next_watermark)
+        return username, first, later, watermark, everything, next_watermark, newer, nothing
+
+    username, first, later, watermark, everything, next_watermark, newer, nothing = api.run(run())
+    assert datetime.fromisoformat(watermark) == max(s['timestamp'] for s in first)
+    assert {s['id'] for s in first} <= {row['id'] for row in everything}
+    assert datetime.fromisoformat(next_watermark) == later[-1]['timestamp']
+    assert [row['id'] for row in newer] == [s['id'] for s in later]
+    assert nothing == []
+
+    row = next(row for row in everything if row['id'] == first[1]['id'])
+    assert int(row['score']) == 10 and row['flag'] == 'zero_time'
+    if include_users:
+        assert row['username'] == username and row['user_created_at']
+    else:
+        assert 'username' not in row
+
+
+def test_only_admins_may_export(api):
+    async def run():
+        _, headers = await register(api.client)
+        return await api.client.get('/api/admin/export/scores', headers=headers)
+
+    assert api.run(run()).status_code == 403
@@ -0,0 +1,66 @@
+import base64
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+async def register(client):
+    """A new player; returns (user id, auth headers)."""
+    name = f'p{uuid.uuid4().hex[:12]}'
+    response = await client.post('/api/auth/register', json={'username': name, 'email': f'{name}@example.com',
+                                                              'password': 'correct horse'})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return body['user']['id'], {'Authorization': f"Bearer {body['token']}"}
+
+
+def _cursor(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def test_history_pages_cover_every_score_once(server, api):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+
+    async def run():
+        client = api.client
+        user_id, headers = await register(client)
+        # Three share a timestamp, so a page boundary falls inside the tie
+        scores = [{'id': str(uuid.uuid4()), 'user_id': user_id, 'game_type': 'text_ai', 'score': n,
+                   'accuracy': 50.0, 'time_taken': 10, 'ai_baseline_score': 44, 'ai_baseline_accuracy': 88.7,
+                   'timestamp': now - timedelta(minutes=0 if n < 3 else n)} for n in range(7)]
+        await server.storage.record_scores(scores)
+        pages, cursor = [], None
+        while True:
+            params = {'limit': 2} if cursor is None else {'limit': 2, 'cursor': cursor}
+            response = await client.get('/api/stats/user/history', params=params, headers=headers)
+            assert response.status_code == 200, response.text
+            pages.append([score['id'] for score in response.json()['scores']])
+            cursor = response.json()['next_cursor']
+            if cursor is None:
+                return scores, pages
+
+    scores, pages = api.run(run())
+    expected = [s['id'] for s in sorted(scores, key=lambda s: (s['timestamp'], s['id']), reverse=True)]
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    assert [score_id for page in pages for score_id in page] == expected
+
+
+@pytest.mark.parametrize('cursor', [
+    '',
+    'not a cursor',
+    'é',
+    _cursor('null'),
+    _cursor('"ab"'),
+    _cursor('[1, 2]'),
+    _cursor('["2026-01-01T00:00:00+00:00"]'),
+    _cursor('["2026-01-01T00:00:00+00:00", "not-a-uuid"]'),
+    _cursor('["yesterday", "%s"]' % uuid.uuid4()),
+])
+def test_a_malformed_cursor_is_a_bad_request(api, cursor):
+    async def run():
+        _, headers = await register(api.client)
+        return await api.client.get('/api/stats/user/history', params={'cursor': cursor}, headers=headers)
+
+    response = api.run(run())
+    assert response.status_code == 400 and response.json()['detail'] == "Invalid cursor"
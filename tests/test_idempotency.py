@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from idempotency import (IN_PROGRESS, NEW, REPLAY, IdempotencyMiddleware, MemoryIdempotencyStore,
+                         SQLiteIdempotencyStore)
+
+ROUTES = {('POST', '/api/games/score'), ('POST', '/api/games/memory/rounds/{round_id}')}
+
+
+def _counting_app(statuses=()):
+    """An endpoint answering with ``statuses`` in turn, then 200; records each call's path."""
+    calls = []
+    statuses = list(statuses)
+
+    async def app(scope, receive, send):
+        calls.append(scope['path'])
+        await receive()
+        body = f'{{"call": {len(calls)}}}'.encode()
+        await send({'type': 'http.response.start', 'status': statuses.pop(0) if statuses else 200,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    return app, calls
+
+
+async def _request(middleware, path='/api/games/score', key=None, body=b'{}', client='203.0.113.7',
+                   chunk_size=None):
+    """Send one request through ``middleware``; returns (status, headers, body)."""
+    headers = [(b'idempotency-key', key.encode())] if key is not None else []
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'', 'headers': headers,
+             'client': (client, 1234)}
+    chunk_size = chunk_size or max(1, len(body))
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b'']
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    response = {}
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = dict(message.get('headers', []))
+        else:
+            response['body'] = response.get('body', b'') + message.get('body', b'')
+
+    await middleware(scope, receive, send)
+    return response['status'], response['headers'], response.get('body', b'')
+
+
+def _fingerprint(body, query=b''):
+    return hashlib.sha256(query + b'?' + body).hexdigest()
+
+
+def _middleware(app, store=None):
+    return IdempotencyMiddleware(app, MemoryIdempotencyStore() if store is None else store, ROUTES,
+                                 jwt_secret='secret')
+
+
+def test_a_retry_with_the_same_key_and_body_is_replayed():
+    app, calls = _counting_app()
+    middleware = _middleware(app)
+
+    async def run():
+        return [await _request(middleware, key='k1', body=b'{"score": 10}') for _ in range(2)]
+
+    first, retry = asyncio.run(run())
+    assert len(calls) == 1
+    assert retry[0] == 200 and retry[2] == first[2]
+    assert retry[1][b'idempotency-replayed'] == b'true' and b'idempotency-replayed' not in first[1]
+
+
+def test_a_key_reused_for_a_different_body_is_refused():
+    app, calls = _counting_app()
+    middleware = _middleware(app)
+
+    async def run():
+        await _request(middleware, key='k1', body=b'{"score": 10}')
+        return await _request(middleware, key='k1', body=b'{"score": 9999}')
+
+    status, _, _ = asyncio.run(run())
+    assert status == 422 and len(calls) == 1
+
+
+def test_a_failed_request_releases_its_key():
+    app, calls = _counting_app(statuses=[503])
+    middleware = _middleware(app)
+
+    async def run():
+        return [(await _request(middleware, key='k1'))[0] for _ in range(3)]
+
+    assert asyncio.run(run()) == [503, 200, 200]
+    assert len(calls) == 2  # the third is a replay of the second
+
+
+def test_completed_keys_expire_after_the_ttl():
+    app, calls = _counting_app()
+    middleware = _middleware(app, MemoryIdempotencyStore(ttl=0.05))
+
+    async def run():
+        await _request(middleware, key='k1')
+        await asyncio.sleep(0.1)
+        return await _request(middleware, key='k1')
+
+    _, headers, _ = asyncio.run(run())
+    assert len(calls) == 2 and b'idempotency-replayed' not in headers
+
+
+def test_workers_sharing_a_key_table_run_a_request_once(tmp_path):
+    app, calls = _counting_app()
+
+    async def run():
+        stores = [SQLiteIdempotencyStore(tmp_path / 'idempotency.db') for _ in range(2)]
+        for store in stores:
+            await store.start()
+        try:
+            # Both workers claim the same key at once: only one may run it
+            claims = [await store.claim('alice:POST /api/games/score:k0', 'f') for store in stores]
+            first, second = (_middleware(app, store) for store in stores)
+            original = await _request(first, key='k1')
+            retry = await _request(second, key='k1')
+            mismatch = await _request(second, key='k1', body=b'{"score": 1}')
+            return claims, original, retry, mismatch
+        finally:
+            for store in stores:
+                await store.stop()
+
+    claims, original, retry, mismatch = asyncio.run(run())
+    assert [outcome for outcome, _ in claims] == [NEW, IN_PROGRESS]
+    assert len(calls) == 1
+    assert retry[2] == original[2] and retry[1][b'idempotency-replayed'] == b'true'
+    assert mismatch[0] == 422
+
+
+def test_a_stored_record_outlives_the_worker_that_wrote_it(tmp_path):
+    async def run():
+        store = SQLiteIdempotencyStore(tmp_path / 'idempotency.db')
+        await store.start()
+        app, _ = _counting_app()
+        await _request(_middleware(app, store), key='k1')
+        await store.stop()
+        restarted = SQLiteIdempotencyStore(tmp_path / 'idempotency.db')
+        await restarted.start()
+        try:
+            return await restarted.claim('guest@203.0.113.7:POST /api/games/score:k1', _fingerprint(b'{}'))
+        finally:
+            await restarted.stop()
+
+    outcome, response = asyncio.run(run())
+    assert outcome == REPLAY and response.status == 200
+
+
+def test_guests_do_not_share_keys_across_addresses():
+    app, calls = _counting_app()
+    middleware = _middleware(app)
+
+    async def run():
+        first = await _request(middleware, key='k1', client='203.0.113.7')
+        other = await _request(middleware, key='k1', client='198.51.100.9')
+        retry = await _request(middleware, key='k1', client='203.0.113.7')
+        return first, other, retry
+
+    first, other, retry = asyncio.run(run())
+    assert len(calls) == 2
+    assert b'idempotency-replayed' not in other[1]
+    assert retry[2] == first[2] and retry[1][b'idempotency-replayed'] == b'true'
+
+
+@pytest.mark.parametrize('chunk_size', [None, 4096])
+def test_oversized_bodies_are_refused_before_they_are_hashed(chunk_size):
+    app, calls = _counting_app()
+    middleware = _middleware(app)
+    body = b'x' * (IdempotencyMiddleware.MAX_BODY_BYTES + 1)
+
+    async def run():
+        return await _request(middleware, key='k1', body=body, chunk_size=chunk_size)
+
+    status, _, _ = asyncio.run(run())
+    assert status == 413 and calls == []
+
+
+def test_templated_routes_replay_per_concrete_path():
+    app, calls = _counting_app()
+    middleware = _middleware(app)
+
+    async def run():
+        first = await _request(middleware, '/api/games/memory/rounds/abc', key='k1')
+        retry = await _request(middleware, '/api/games/memory/rounds/abc', key='k1')
+        # Same key on another round is another request
+        await _request(middleware, '/api/games/memory/rounds/def', key='k1')
+        return first, retry
+
+    first, retry = asyncio.run(run())
+    assert retry[2] == first[2] and retry[1][b'idempotency-replayed'] == b'true'
+    assert calls == ['/api/games/memory/rounds/abc', '/api/games/memory/rounds/def']
+
+
+def test_templates_match_one_whole_segment_only():
+    middleware = _middleware(None)
+    assert middleware._matches('POST', '/api/games/score')
+    assert middleware._matches('POST', '/api/games/memory/rounds/abc')
+    assert not middleware._matches('GET', '/api/games/memory/rounds/abc')
+    assert not middleware._matches('POST', '/api/games/memory/rounds/')
+    assert not middleware._matches('POST', '/api/games/memory/rounds/abc/extra')
+    assert not middleware._matches('POST', '/api/games/memory/data')
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from matchmaking import Matchmaker, NoOpponent
+
+
+def test_player_without_an_opponent_times_out():
+    async def run():
+        now = 0.0
+        pairs = []
+        matchmaker = Matchmaker(lambda game_type, a, b: pairs.append((a.user_id, b.user_id)) or 'match',
+                                max_wait=30, clock=lambda: now)
+        alone = matchmaker.join('text_ai', 'alice', 1500)
+        now = 10.0
+        later = matchmaker.join('ai_image', 'bob', 1500)
+        now = 29.9
+        matchmaker.check_due(now)
+        assert not alone.done()
+        now = 30.0
+        matchmaker.check_due(now)
+        with pytest.raises(NoOpponent):
+            alone.result()
+        assert matchmaker.waiting() == {('text_ai',): 0, ('ai_image',): 1}
+        # A player paired before the deadline is not timed out
+        paired = matchmaker.join('ai_image', 'carol', 1500)
+        assert later.result() == paired.result() == 'match'
+        now = 100.0
+        matchmaker.check_due(now)
+        assert (matchmaker.matched, matchmaker.timed_out, pairs) == (1, 1, [('bob', 'carol')])
+
+    asyncio.run(run())
+
+
+def test_leaving_and_rejoining_restarts_the_wait():
+    async def run():
+        now = 0.0
+        matchmaker = Matchmaker(lambda *pair: None, max_wait=30, clock=lambda: now)
+        matchmaker.join('text_ai', 'alice', 1500)
+        now = 20.0
+        matchmaker.leave('alice')
+        again = matchmaker.join('text_ai', 'alice', 1500)
+        now = 40.0
+        matchmaker.check_due(now)
+        assert not again.done()
+        now = 50.0
+        matchmaker.check_due(now)
+        assert isinstance(again.exception(), NoOpponent)
+
+    asyncio.run(run())
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from memory_rounds import ImplausibleRecall, RoundStore, SQLiteRoundStore, score_recall, show_seconds
+
+
+def test_peek_leaves_the_round_open_and_take_closes_it():
+    store = RoundStore(capacity=4, ttl=60)
+    round_id = store.issue('alice', [1, 2, 3], difficulty=1, now=0.0)
+    assert store.peek(round_id, 'bob', now=1.0) is None
+    assert store.peek(round_id, 'alice', now=1.0).sequence == bytes([1, 2, 3])
+    assert len(store) == 1
+    assert store.take(round_id, 'alice', now=1.0).difficulty == 1
+    assert store.peek(round_id, 'alice', now=1.0) is None
+    assert store.take(round_id, 'alice', now=1.0) is None
+    assert len(store) == 0
+
+
+def test_an_implausible_recall_does_not_use_up_the_round():
+    store = RoundStore(capacity=4, ttl=60)
+    round_id = store.issue('alice', [1, 2, 3], difficulty=1, now=0.0)
+    with pytest.raises(ImplausibleRecall):
+        score_recall(store.peek(round_id, 'alice', now=0.1), [1, 2, 3], 0.1)
+    elapsed = show_seconds(3) + 3
+    result = score_recall(store.peek(round_id, 'alice', now=elapsed), [1, 2, 3], elapsed)
+    assert result.completed
+    assert store.take(round_id, 'alice', now=elapsed) is not None
+
+
+def test_expired_rounds_are_released():
+    store = RoundStore(capacity=1, ttl=10)
+    round_id = store.issue('alice', [1], difficulty=1, now=0.0)
+    assert store.peek(round_id, 'alice', now=10.0) is None
+    assert len(store) == 0
+    store.issue('alice', [2], difficulty=1, now=10.0)
+
+
+def test_workers_sharing_a_round_table_take_a_round_once(tmp_path):
+    async def run():
+        issuer, scorer = (SQLiteRoundStore(tmp_path / 'memory_rounds.db') for _ in range(2))
+        await issuer.start()
+        await scorer.start()
+        try:
+            round_id = await issuer.issue('alice', [1, 2, 3], difficulty=2)
+            assert await scorer.peek(round_id, 'bob') is None
+            memory_round = await scorer.peek(round_id, 'alice')
+            assert (memory_round.sequence, memory_round.difficulty) == (bytes([1, 2, 3]), 2)
+            taken = await asyncio.gather(scorer.take(round_id, 'alice'), issuer.take(round_id, 'alice'))
+            assert sum(r is not None for r in taken) == 1
+            assert await issuer.peek(round_id, 'alice') is None
+        finally:
+            await issuer.stop()
+            await scorer.stop()
+
+    asyncio.run(run())
+
+
+def test_expired_shared_rounds_are_not_returned_and_get_pruned(tmp_path):
+    async def run():
+        store = SQLiteRoundStore(tmp_path / 'memory_rounds.db', ttl=60, prune_interval=0)
+        store.clock = lambda: now[0]
+        await store.start()
+        try:
+            round_id = await store.issue('alice', [1], difficulty=1)
+            assert store.active == 1
+            now[0] += 60
+            assert await store.peek(round_id, 'alice') is None
+            await store.issue('alice', [2], difficulty=1)
+            assert store.active == 1
+        finally:
+            await store.stop()
+
+    now = [1000.0]
+    asyncio.run(run())
@@ -0,0 +1,54 @@
+import asyncio
+import sqlite3
+import uuid
+from datetime import timedelta
+
+import pytest
+
+import partitions
+from storage import PartitionedSQLiteRepository, SQLiteRepository
+
+from .test_compact import NOW, USERS, read_back, row_counts, seed_standard
+
+
+def _score(score_id, timestamp):
+    return {'id': score_id, 'user_id': USERS[0], 'game_type': 'ai_image', 'score': 50, 'accuracy': 50.0,
+            'time_taken': 20, 'ai_baseline_score': 90, 'ai_baseline_accuracy': 85.0, 'timestamp': timestamp}
+
+
+def test_migration_keeps_every_row_and_what_the_api_reads(tmp_path):
+    path = tmp_path / 'scores.db'
+    seed_standard(path, tmp_path / 'archive')
+    counts, before = row_counts(path), read_back(SQLiteRepository, path)
+
+    moved = partitions.migrate(path)
+
+    assert moved == counts['game_scores']
+    assert len(partitions.describe(path)) > 2
+    assert row_counts(path) == counts
+    assert read_back(PartitionedSQLiteRepository, path) == before
+
+
+def test_an_id_taken_in_another_month_is_refused(tmp_path):
+    async def run():
+        repo = PartitionedSQLiteRepository(tmp_path / 'scores.db')
+        await repo.start()
+        try:
+            await repo.create_user({'id': USERS[0], 'username': 'player0', 'email': 'player0@example.com',
+                                    'created_at': NOW}, 'hash')
+            taken = str(uuid.uuid4())
+            await repo.record_score(_score(taken, NOW))
+            with pytest.raises(sqlite3.IntegrityError):
+                await repo.record_score(_score(taken, NOW - timedelta(days=40)))
+            # Twice in one batch, each in its own month
+            again = str(uuid.uuid4())
+            with pytest.raises(sqlite3.IntegrityError):
+                await repo.record_scores([_score(again, NOW), _score(again, NOW - timedelta(days=80))])
+            user = await repo.get_user(USERS[0])
+            history = await repo.score_history(USERS[0], 10)
+            return user.total_games_played, [s['id'] for s in history], taken
+        finally:
+            await repo.stop()
+
+    played, history, taken = asyncio.run(run())
+    assert played == 1 and history == [taken]
@@ -0,0 +1,128 @@
+import asyncio
+import random
+import sqlite3
+from bisect import bisect_left
+
+import pytest
+
+import percentiles
+from percentiles import KLLSketch, SQLitePercentileStore
+
+
+def _scores(count, seed=7):
+    # Skewed and full of ties, like game scores: most players land low, a few very high
+    rng = random.Random(seed)
+    return [int(rng.lognormvariate(5, 0.8)) for _ in range(count)]
+
+
+def _max_rank_error(sketch, scores):
+    ordered = sorted(scores)
+    return max(abs(sketch.rank(value) - bisect_left(ordered, value)) for value in set(scores)) / len(scores)
+
+
+def test_small_sketch_ranks_exactly():
+    sketch = KLLSketch(200)
+    for score in range(100):
+        sketch.update(score)
+    assert [sketch.rank(value) for value in (0, 50, 100)] == [0, 50, 100]
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_rank_error_stays_under_one_percent(seed):
+    scores = _scores(200000, seed)
+    sketch = KLLSketch(200, random.Random(seed))
+    for score in scores:
+        sketch.update(score)
+    assert sketch.retained < 3 * 200 + 8 * len(sketch.levels)
+    assert _max_rank_error(sketch, scores) < 0.01
+
+
+def test_sketches_merged_through_their_encoding_keep_the_bound():
+    scores = _scores(200000)
+    merged = KLLSketch(200, random.Random(0))
+    for worker in range(4):
+        sketch = KLLSketch(200, random.Random(worker + 1))
+        for score in scores[worker::4]:
+            sketch.update(score)
+        merged.merge(KLLSketch.from_bytes(sketch.to_bytes()))
+    assert len(merged) == len(scores)
+    assert _max_rank_error(merged, scores) < 0.01
+
+
+def test_workers_sharing_a_checkpoint_table_converge(tmp_path):
+    scores = _scores(20000)
+
+    async def run():
+        workers = [SQLitePercentileStore(tmp_path / 'percentiles.db') for _ in range(2)]
+        for worker in workers:
+            await worker.start()
+        for i, score in enumerate(scores):
+            workers[i % 2].add('game', score)
+        # Each sees only its own scores until it checkpoints
+        assert workers[0].counts() == {'game': len(scores) // 2}
+        await workers[0].checkpoint()
+        await workers[1].checkpoint()
+        await workers[0].checkpoint()
+        views = [(w.counts(), w.percentile('game', scores[0])) for w in workers]
+        for worker in workers:
+            await worker.stop()
+        return views
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert first[0] == {'game': len(scores)}
+
+
+def test_stop_flushes_pending_scores_for_the_next_worker(tmp_path):
+    async def run():
+        worker = SQLitePercentileStore(tmp_path / 'percentiles.db')
+        await worker.start()
+        for score in range(1000):
+            worker.add('game', score)
+        await worker.stop()
+        restarted = SQLitePercentileStore(tmp_path / 'percentiles.db')
+        await restarted.start()
+        try:
+            return restarted.counts(), restarted.percentile('game', 500)
+        finally:
+            await restarted.stop()
+
+    counts, percentile = asyncio.run(run())
+    assert counts == {'game': 1000}
+    assert percentile == pytest.approx(50, abs=1)
+
+
+def test_the_first_fill_scans_without_the_write_lock(tmp_path, monkeypatch):
+    path = tmp_path / 'percentiles.db'
+
+    def sketch(values):
+        sketch = KLLSketch(200)
+        for value in values:
+            sketch.update(value)
+        return sketch
+
+    def slow_scan(db_path, k):
+        # Another worker finishes its own fill while this one is scanning; with the
+        # lock held it would fail at once (timeout=0) instead of waiting
+        conn = sqlite3.connect(path, timeout=0, isolation_level=None)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('INSERT INTO percentile_sketches VALUES (?, ?, ?, ?)',
+                         ('game', sketch(range(10)).to_bytes(), 10, 0.0))
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return {'game': sketch(range(3))}
+
+    monkeypatch.setattr(percentiles, 'sketch_game_scores', slow_scan)
+
+    async def run():
+        worker = SQLitePercentileStore(path, source_path=tmp_path / 'scores.db')
+        try:
+            await worker.start()
+            return worker.counts()
+        finally:
+            await worker.stop()
+
+    # The other worker's fill is kept, not overwritten by this one's scan
+    assert asyncio.run(run()) == {'game': 10}
@@ -0,0 +1,112 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from rate_limit import MemoryBucketStore, RateLimitMiddleware, RatePolicy, parse_networks, parse_policy_overrides
+
+POLICIES = [RatePolicy('login', rate=10 / 60, capacity=10), RatePolicy('api', rate=20.0, capacity=100)]
+
+
+def test_overrides_replace_rate_and_burst_by_name():
+    policies = parse_policy_overrides('login=30/60:5, api=50/1', POLICIES)
+    assert policies['login'] == RatePolicy('login', rate=0.5, capacity=5)
+    assert policies['api'] == RatePolicy('api', rate=50.0, capacity=50)
+    assert parse_policy_overrides('', POLICIES)['login'] == POLICIES[0]
+
+
+@pytest.mark.parametrize('spec', ['signup=5/60', 'login=5', 'login=0/60', 'login=x/60'])
+def test_bad_overrides_are_refused(spec):
+    with pytest.raises(ValueError):
+        parse_policy_overrides(spec, POLICIES)
+
+
+def _scope(peer, forwarded=None):
+    headers = [(b'x-forwarded-for', forwarded.encode())] if forwarded else []
+    return {'type': 'http', 'method': 'POST', 'path': '/api/auth/register', 'client': (peer, 1234),
+            'headers': headers}
+
+
+def _middleware(trusted=''):
+    return RateLimitMiddleware(None, {}, MemoryBucketStore(), 'secret', trusted_proxies=parse_networks(trusted))
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies():
+    assert _middleware()._client_ip(_scope('10.0.0.5', '203.0.113.7')) == '10.0.0.5'
+
+
+def test_forwarded_for_is_used_only_from_a_trusted_proxy():
+    middleware = _middleware('10.0.0.0/8')
+    assert middleware._client_ip(_scope('10.0.0.5', '203.0.113.7')) == '203.0.113.7'
+    assert middleware._client_ip(_scope('198.51.100.1', '203.0.113.7')) == '198.51.100.1'
+    assert middleware._client_ip(_scope('10.0.0.5')) == '10.0.0.5'
+
+
+def test_spoofed_entries_left_of_the_proxy_are_skipped():
+    middleware = _middleware('10.0.0.0/8')
+    # The client sent "1.2.3.4"; the proxies appended what they saw
+    assert middleware._client_ip(_scope('10.0.0.5', '1.2.3.4, 203.0.113.7, 10.0.0.9')) == '203.0.113.7'
+
+
+def test_clients_behind_one_proxy_get_their_own_buckets():
+    statuses = []
+
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    middleware = RateLimitMiddleware(app, {('POST', '/api/auth/register'): RatePolicy('register', 5 / 3600, 5)},
+                                     MemoryBucketStore(), 'secret', trusted_proxies=parse_networks('10.0.0.1'))
+
+    async def run():
+        for client in range(20):
+            await middleware(_scope('10.0.0.1', f"203.0.113.{client}"), None, send)
+        for _ in range(5):
+            await middleware(_scope('10.0.0.1', '203.0.113.0'), None, send)
+
+    asyncio.run(run())
+    assert statuses == [200] * 20 + [200] * 4 + [429]
+
+
+def _login_limited(wrap=lambda app: app, trusted='10.0.0.0/8'):
+    """Statuses of 40 logins from 198.51.100.9 through the proxy at 10.0.0.1, each with a new forged first hop."""
+    statuses = []
+
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    middleware = wrap(RateLimitMiddleware(app, {('POST', '/api/auth/login'): RatePolicy('login', 10 / 60, 10)},
+                                          MemoryBucketStore(), 'secret', trusted_proxies=parse_networks(trusted)))
+
+    async def run():
+        for attempt in range(40):
+            scope = dict(_scope('10.0.0.1', f"203.0.113.{attempt}, 198.51.100.9"), path='/api/auth/login',
+                         http_version='1.1', scheme='http', server=('api', 80))
+            await middleware(scope, None, send)
+
+    asyncio.run(run())
+    return statuses
+
+
+def test_forged_forwarded_for_does_not_escape_the_limit():
+    assert _login_limited().count(429) == 30
+
+
+def test_forged_forwarded_for_through_uvicorn_proxy_headers():
+    proxy_headers = pytest.importorskip('uvicorn.middleware.proxy_headers')
+    # As deployed: uvicorn trusts only the proxy, so the peer it reports is the proxy's right-most hop
+    statuses = _login_limited(lambda app: proxy_headers.ProxyHeadersMiddleware(app, trusted_hosts='10.0.0.1'))
+    assert statuses.count(429) == 30
+
+
+def test_procfile_does_not_trust_every_proxy():
+    procfile = (Path(__file__).parent.parent / 'backend' / 'Procfile').read_text()
+    assert '*' not in procfile
@@ -0,0 +1,136 @@
+import asyncio
+import gzip
+import sqlite3
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import orjson
+import pytest
+
+import retention
+from retention import RetentionJob, archive_path, run_retention
+from storage import SQLiteRepository
+
+ALICE = str(uuid.uuid4())
+NOW = datetime.now(timezone.utc)
+
+
+def _scores(days_ago):
+    return [{'id': str(uuid.uuid4()), 'user_id': ALICE, 'game_type': 'ai_image', 'score': 10 * i + days,
+             'accuracy': 50.0 + i, 'time_taken': 20 + i, 'ai_baseline_score': 90, 'ai_baseline_accuracy': 85.0,
+             'timestamp': NOW - timedelta(days=days, minutes=i)}
+            for i, days in enumerate(days_ago)]
+
+
+def _seed(path, scores):
+    async def run():
+        repo = SQLiteRepository(path)
+        await repo.start()
+        try:
+            await repo.create_user({'id': ALICE, 'username': 'alice', 'email': 'alice@example.com',
+                                    'created_at': NOW}, 'hash')
+            await repo.record_scores(scores)
+        finally:
+            await repo.stop()
+
+    asyncio.run(run())
+
+
+def _stats(path):
+    async def run():
+        repo = SQLiteRepository(path)
+        await repo.start()
+        try:
+            return await repo.user_game_stats(ALICE)
+        finally:
+            await repo.stop()
+
+    return asyncio.run(run())
+
+
+def _archived_ids(archive_dir):
+    ids = []
+    for path in sorted(archive_dir.iterdir()):
+        with gzip.open(path) as archive:  # reads every member
+            ids += [orjson.loads(line)['id'] for line in archive]
+    return ids
+
+
+def _remaining_ids(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0] for row in conn.execute('SELECT id FROM game_scores')}
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def seeded(tmp_path):
+    # Eleven scores past a 30-day cutoff, spread over several months, and three inside it
+    scores = _scores([400, 380, 200, 200, 190, 120, 95, 90, 60, 45, 31, 10, 2, 0])
+    path = tmp_path / 'scores.db'
+    _seed(path, scores)
+    return path, scores
+
+
+def test_old_scores_move_to_archives_across_chunks(seeded, tmp_path):
+    path, scores = seeded
+    before = _stats(path)
+
+    run = run_retention(path, tmp_path / 'archive', days=30, chunk_rows=3, pause=0)
+
+    old, recent = scores[:11], scores[11:]
+    assert run.archived == len(old) and run.chunks == 4 and run.complete
+    assert sorted(_archived_ids(tmp_path / 'archive')) == sorted(s['id'] for s in old)
+    assert _remaining_ids(path) == {s['id'] for s in recent}
+    # Stats read the rollups for archived scores
+    assert _stats(path) == before
+    # Nothing left to do
+    assert run_retention(path, tmp_path / 'archive', days=30, chunk_rows=3, pause=0).archived == 0
+
+
+def test_a_chunk_archived_but_not_committed_is_archived_once(seeded, tmp_path, monkeypatch):
+    path, scores = seeded
+    archive_dir = tmp_path / 'archive'
+    record_archived = retention._record_archived
+    calls = []
+
+    def crash_on_second_chunk(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("killed between the archive append and the commit")
+        return record_archived(*args, **kwargs)
+
+    monkeypatch.setattr(retention, '_record_archived', crash_on_second_chunk)
+    with pytest.raises(RuntimeError):
+        run_retention(path, archive_dir, days=30, chunk_rows=3, pause=0)
+    # The second chunk's rows are in a file but still in the database
+    assert len(_archived_ids(archive_dir)) == 6
+    assert len(_remaining_ids(path)) == len(scores) - 3
+
+    monkeypatch.setattr(retention, '_record_archived', record_archived)
+    run = run_retention(path, archive_dir, days=30, chunk_rows=3, pause=0)
+
+    assert run.archived == 8
+    archived = _archived_ids(archive_dir)
+    assert sorted(archived) == sorted(s['id'] for s in scores[:11])
+    conn = sqlite3.connect(path)
+    try:
+        recorded = dict(conn.execute('SELECT month, bytes FROM archive_files'))
+    finally:
+        conn.close()
+    assert recorded == {month: archive_path(archive_dir, month).stat().st_size for month in recorded}
+
+
+def test_a_finished_run_gives_its_lease_back(seeded, tmp_path):
+    path, _ = seeded
+    job = RetentionJob(path, tmp_path / 'archive', days=30, max_run_seconds=300, pause=0)
+    other = RetentionJob(path, tmp_path / 'archive', days=30, max_run_seconds=300, pause=0)
+
+    async def run():
+        await job.run()
+        await other.run()  # would wait out the 300 s lease if the first run kept it
+
+    asyncio.run(run())
+    assert (job.runs, other.runs) == (1, 1)
+    assert job.archived == 11 and other.archived == 0
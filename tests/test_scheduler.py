@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from scheduler import LeaderLease, Scheduler
+
+
+def test_one_worker_holds_the_lease_and_a_release_hands_it_over(tmp_path):
+    ttl = 1.5
+
+    async def run():
+        leases = [LeaderLease(tmp_path / 'scheduler.db', ttl=ttl) for _ in range(2)]
+        for lease in leases:
+            await lease.start()
+        try:
+            held = [lease.held for lease in leases]
+            leader, other = leases if held[0] else leases[::-1]
+            await asyncio.sleep(ttl / 3 + 0.1)  # a renewal each: the leader keeps it
+            renewed = [leader.held, other.held]
+            released = time.monotonic()
+            await leader.stop()
+            while not other.held and time.monotonic() - released < ttl:
+                await asyncio.sleep(0.02)
+            return held, renewed, other.held, time.monotonic() - released, other.acquired
+        finally:
+            for lease in leases:
+                await lease.stop()
+
+    held, renewed, taken_over, after, acquired = asyncio.run(run())
+    assert sorted(held) == [False, True]
+    assert renewed == [True, False]
+    # Within one renewal, not once the released row would have expired
+    assert taken_over and after <= ttl / 3 + 0.2 and acquired == 1
+
+
+def test_leader_jobs_run_on_one_worker_and_flush_jobs_run_at_stop(tmp_path):
+    async def run():
+        schedulers, calls = [], []
+        for worker in range(2):
+            scheduler = Scheduler(LeaderLease(tmp_path / 'scheduler.db', ttl=3.0))
+
+            def record(job, worker=worker):
+                async def fn():
+                    calls.append((job, worker))
+                return fn
+
+            scheduler.every('rollup', 0.05, record('rollup'), leader=True)
+            # Hourly, so only the final run at stop is seen
+            scheduler.every('flush', 3600, record('flush'), flush=True)
+            scheduler.every('leader_flush', 3600, record('leader_flush'), leader=True, flush=True)
+            schedulers.append(scheduler)
+        for scheduler in schedulers:
+            await scheduler.start()
+        try:
+            await asyncio.sleep(0.3)
+            leaders = [scheduler.is_leader for scheduler in schedulers]
+            skipped = [scheduler.jobs['rollup'].skipped for scheduler in schedulers]
+        finally:
+            for scheduler in schedulers:
+                await scheduler.stop(timeout=1.0)
+        return leaders, skipped, calls
+
+    leaders, skipped, calls = asyncio.run(run())
+    assert sorted(leaders) == [False, True]
+    leader = leaders.index(True)
+    assert {worker for job, worker in calls if job == 'rollup'} == {leader}
+    assert skipped[leader] == 0 and skipped[1 - leader] > 0
+    assert sorted(worker for job, worker in calls if job == 'flush') == [0, 1]
+    assert [worker for job, worker in calls if job == 'leader_flush'] == [leader]
@@ -0,0 +1,77 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from cache_bus import InvalidationBus
+from skill import LADDERS, SkillModel
+from storage import CompactSQLiteRepository, PartitionedSQLiteRepository, SQLiteRepository, StaleRatingError
+
+ALICE = str(uuid.uuid4())
+
+
+def _score(user_id):
+    return {'id': str(uuid.uuid4()), 'user_id': user_id, 'game_type': 'memory_challenge', 'score': 100,
+            'accuracy': 80.0, 'time_taken': 30, 'ai_baseline_score': 90, 'ai_baseline_accuracy': 85.0,
+            'timestamp': datetime.now(timezone.utc)}
+
+
+@pytest.mark.parametrize('repository', [SQLiteRepository, CompactSQLiteRepository, PartitionedSQLiteRepository])
+def test_a_rating_played_from_a_stale_copy_is_refused(tmp_path, repository):
+    async def run():
+        repo = repository(tmp_path / 'skill.db')
+        await repo.start()
+        try:
+            await repo.create_user({'id': ALICE, 'username': 'alice', 'email': 'alice@example.com',
+                                    'created_at': datetime.now(timezone.utc)}, 'hash')
+            first, second = (SkillModel(LADDERS, load=repo.get_skill_ratings) for _ in range(2))
+            stale = await second.get(ALICE, 'memory_challenge')
+
+            won = first.play('memory_challenge', await first.get(ALICE, 'memory_challenge'), 1, 1.0, now=1000.0)
+            await repo.record_score(_score(ALICE), [won.to_row(ALICE, 'memory_challenge')])
+            lost = second.play('memory_challenge', stale, 1, 0.0, now=1001.0)
+            with pytest.raises(StaleRatingError):
+                await repo.record_score(_score(ALICE), [lost.to_row(ALICE, 'memory_challenge')])
+
+            # The retry plays the round again from the saved rating
+            second.forget(ALICE, 'memory_challenge')
+            current = await second.get(ALICE, 'memory_challenge')
+            assert current.games == 1 and current.rating == pytest.approx(won.rating)
+            lost = second.play('memory_challenge', current, 1, 0.0, now=1001.0)
+            await repo.record_score(_score(ALICE), [lost.to_row(ALICE, 'memory_challenge')])
+            saved = (await repo.get_skill_ratings(ALICE))['memory_challenge']
+            user = await repo.get_user(ALICE)
+            return saved, lost, user.total_games_played, second.conflicts
+        finally:
+            await repo.stop()
+
+    saved, lost, played, conflicts = asyncio.run(run())
+    assert saved['games'] == 2 and saved['rating'] == pytest.approx(lost.rating)
+    assert played == 2  # the refused score was not written
+    assert conflicts == 1
+
+
+def test_a_published_rating_drops_the_cached_copy():
+    async def run():
+        loads = []
+
+        async def load(user_id):
+            loads.append(user_id)
+            return {}
+
+        model = SkillModel(LADDERS, load=load)
+        bus = InvalidationBus()
+        bus.subscribe(model.on_event)
+        await model.get(ALICE, 'memory_challenge')
+        await model.get(ALICE, 'memory_challenge')
+        await bus.publish(SkillModel.CHANNEL, SkillModel.encode('someone-else', 'memory_challenge'))
+        await model.get(ALICE, 'memory_challenge')
+        assert loads == [ALICE]
+        await bus.publish(SkillModel.CHANNEL, SkillModel.encode(ALICE, 'memory_challenge'))
+        await model.get(ALICE, 'memory_challenge')
+        return loads, model.conflicts
+
+    loads, conflicts = asyncio.run(run())
+    assert loads == [ALICE, ALICE]
+    assert conflicts == 0
@@ -0,0 +1,22 @@
+import os
+import statistics
+
+import pytest
+
+from bench import STARTUP_BUDGET_MS, boot_once, startup_env
+
+# A slower CI machine can raise it rather than skip the test
+BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', STARTUP_BUDGET_MS))
+
+
+@pytest.mark.slow
+def test_worker_boots_to_first_request_within_budget(tmp_path):
+    env = startup_env(tmp_path)
+    totals = []
+    for _ in range(4):
+        total, phases = boot_once(env)
+        assert phases['status'] == 200
+        totals.append(total)
+    # The first boot creates the schema; the budget is for a worker joining an existing database
+    typical_ms = statistics.median(totals[1:]) * 1000
+    assert typical_ms <= BUDGET_MS, f"boot to first request took {typical_ms:.0f} ms (budget {BUDGET_MS:.0f} ms)"
@@ -0,0 +1,63 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from storage import (CompactSQLiteRepository, DuplicateUserError, PartitionedSQLiteRepository, SQLiteRepository,
+                     StaleProgressError)
+
+
+ALICE, S1 = str(uuid.uuid4()), str(uuid.uuid4())
+
+
+def _user(name, user_id=ALICE):
+    return {'id': user_id, 'username': name, 'email': f"{name}@example.com",
+            'created_at': datetime.now(timezone.utc)}
+
+
+def _score(user_id, score_id):
+    return {'id': score_id, 'user_id': user_id, 'game_type': 'ai_image', 'score': 100, 'accuracy': 80.0,
+            'time_taken': 30, 'ai_baseline_score': 90, 'ai_baseline_accuracy': 85.0,
+            'timestamp': datetime.now(timezone.utc)}
+
+
+@pytest.mark.parametrize('repository', [SQLiteRepository, CompactSQLiteRepository, PartitionedSQLiteRepository])
+def test_connections_are_reused_and_failed_writes_rolled_back(tmp_path, repository):
+    async def run():
+        repo = repository(tmp_path / 'pool.db', pool_size=2)
+        await repo.start()
+        try:
+            await repo.create_user(_user('alice'), 'hash')
+            with pytest.raises(DuplicateUserError):
+                await repo.create_user(_user('alice'), 'hash')
+            # The score is inserted before the stale progress is found: nothing of it may stay
+            await repo.record_scores([_score(ALICE, S1)], progress=[
+                {'user_id': ALICE, 'version': 1, 'state': {}, 'updated_at': datetime.now(timezone.utc)}])
+            with pytest.raises(StaleProgressError):
+                await repo.record_scores([_score(ALICE, str(uuid.uuid4()))], progress=[
+                    {'user_id': ALICE, 'version': 1, 'state': {}, 'updated_at': datetime.now(timezone.utc)}])
+            await asyncio.gather(*(repo.get_user(ALICE) for _ in range(20)))
+            history = await repo.score_history(ALICE, 10)
+            user = await repo.get_user(ALICE)
+            return repo._pool.opened, [s['id'] for s in history], user.total_games_played
+        finally:
+            await repo.stop()
+
+    opened, history, played = asyncio.run(run())
+    assert opened <= 2
+    assert history == [S1] and played == 1
+
+
+def test_stop_closes_the_pool_and_later_calls_still_work(tmp_path):
+    async def run():
+        repo = SQLiteRepository(tmp_path / 'pool.db', pool_size=1)
+        await repo.start()
+        await repo.create_user(_user('bob', str(uuid.uuid4())), 'hash')
+        pool = repo._pool
+        await repo.stop()
+        # Not started: one connection per call, as scripts use it
+        return pool.opened, await repo.count_users()
+
+    opened, users = asyncio.run(run())
+    assert opened == 0 and users == 2  # bob and the guest account